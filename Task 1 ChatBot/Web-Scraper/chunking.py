@@ -0,0 +1,348 @@
+"""
+Chunking of extracted PDF pages, with page numbers.
+
+Two strategies, chosen per source (CHUNKING in backend/scraper_config.py):
+
+- "sentences" (default): token windows that end at sentence boundaries and
+  start a new chunk at section headings (articles, chapters, resolutions,
+  numbered section titles), so clauses are not cut in half. Consecutive
+  chunks share whole sentences up to overlap_tokens.
+- "words": fixed word windows (chunk_size words, overlap words), the
+  original chunker.
+
+Word windows work on integer arrays (start/end offset of every word in the
+joined page text, page index of every word): a chunk is a single slice of
+that string and its page is a bincount over a slice of the page index array.
+Nothing is allocated per word beyond the array entries (about 20 bytes a
+word instead of a dict and a string per word).
+
+Each chunk gets the page holding most of its words (tokens for sentence
+windows); on a tie, the page the chunk starts on.
+
+Peak memory and time against the previous per-word-dict chunker on the
+largest local PDF (or a given one):
+    python chunking.py --pdf-dir pdfs
+    python chunking.py --pdf pdfs/iifa/IIFA_Resolutions_E-Book.pdf
+Retrieval recall per strategy: python benchmark.py chunking (in backend/).
+"""
+
+import argparse
+import re
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from token_counter import get_token_counter
+
+
+DEFAULT_CHUNKING: Dict[str, Any] = {'strategy': 'sentences', 'max_tokens': 256, 'overlap_tokens': 32}
+
+
+def chunk_pages(page_texts: List[Dict[str, Any]], chunk_size: int = 500, overlap: int = 50) -> List[Dict[str, Any]]:
+    """Split page texts into overlapping word windows
+
+    Args:
+        page_texts: List of dicts with 'text' and 'page_number' keys, in page order
+        chunk_size: Number of words per chunk
+        overlap: Number of words shared by consecutive chunks
+
+    Returns:
+        List of dicts with 'text', 'page_number' and 'chunk_index' keys
+    """
+    texts: List[str] = []
+    starts: List[np.ndarray] = []
+    ends: List[np.ndarray] = []
+    words_per_page = np.zeros(len(page_texts), dtype=np.int64)
+    offset = 0
+    for page_idx, page in enumerate(page_texts):
+        # Only one page's words exist as strings at a time
+        words = page['text'].split()
+        if not words:
+            continue
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        page_ends = offset + np.cumsum(lengths + 1) - 1
+        texts.append(' '.join(words))
+        starts.append(page_ends - lengths)
+        ends.append(page_ends)
+        words_per_page[page_idx] = len(words)
+        offset = int(page_ends[-1]) + 1  # Skip the space joining the next page
+    if not texts:
+        return []
+
+    text = ' '.join(texts)
+    word_starts = np.concatenate(starts)
+    word_ends = np.concatenate(ends)
+    word_pages = np.repeat(np.arange(len(page_texts), dtype=np.int32), words_per_page)
+    page_numbers = [page['page_number'] for page in page_texts]
+    del texts, starts, ends
+
+    chunks = []
+    total_words = len(word_starts)
+    for chunk_index, first in enumerate(range(0, total_words, chunk_size - overlap)):
+        last = min(first + chunk_size, total_words) - 1
+        first_page = word_pages[first]
+        # Words per page in this chunk, counted from the chunk's first page
+        counts = np.bincount(word_pages[first:last + 1] - first_page)
+        top = counts.max()
+        page_idx = first_page + int(np.argmax(counts)) if np.count_nonzero(counts == top) == 1 else first_page
+        chunks.append({
+            'text': text[word_starts[first]:word_ends[last]],
+            'page_number': page_numbers[page_idx],
+            'chunk_index': chunk_index
+        })
+    return chunks
+
+
+# Section headings: "Article 12", "CHAPTER IV", "Resolution No. 236 (1/24)",
+# "المادة 5", "قرار رقم", and numbered titles such as "4.2 Scope of application"
+_HEADING_RE = re.compile(
+    r'^(?:(?:article|chapter|part|section|schedule|appendix|resolution|clause)\s+(?:no\.?\s*)?[\dIVXLC]+\b'
+    r'|(?:المادة|مادة|الفصل|الباب|البند|قرار رقم)\b)',
+    re.I
+)
+_NUMBERED_TITLE_RE = re.compile(r'^\d{1,2}(?:\.\d{1,2})*\.?\s+[A-Z\u0600-\u06FF][^.!?:;؟]{0,80}$')
+# Sentence ends in English and Arabic (؟ question mark, ؛ semicolon)
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?؟؛])\s+')
+# Words ending in a period that do not end a sentence
+_ABBREVIATIONS = {
+    'no', 'nos', 'art', 'arts', 'para', 'paras', 'sec', 'cl', 'ch', 'p', 'pp', 'vol', 'e.g', 'i.e', 'etc',
+    'vs', 'mr', 'mrs', 'ms', 'dr', 'prof', 'sdn', 'bhd', 'co', 'inc', 'ltd', 'st', 'jan', 'feb', 'mar', 'apr',
+    'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+}
+
+
+def is_heading(line: str) -> bool:
+    """Whether a line starts a new section"""
+    line = line.strip()
+    if not line or len(line) > 120:
+        return False
+    if _HEADING_RE.match(line) or _NUMBERED_TITLE_RE.match(line):
+        return True
+    # Short all-caps titles ("DEFINITIONS AND INTERPRETATION")
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 4 and len(line.split()) <= 12 and all(c.isupper() for c in letters)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences of a paragraph, keeping abbreviations and list markers ("1.", "(a).") attached"""
+    sentences: List[str] = []
+    current = ''
+    position = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        piece = text[position:match.start()]
+        position = match.end()
+        current = f"{current} {piece}" if current else piece
+        last_word = current.rsplit(None, 1)[-1].rstrip('.').lower() if current.strip() else ''
+        if last_word in _ABBREVIATIONS or len(current.split()) <= 1:
+            continue
+        sentences.append(current)
+        current = ''
+    rest = text[position:]
+    current = f"{current} {rest}" if current and rest else current or rest
+    if current.strip():
+        sentences.append(current)
+    return sentences
+
+
+def _page_units(page_texts: List[Dict[str, Any]]) -> List[tuple]:
+    """(text, page index, is heading) for every heading line and sentence, in order
+
+    Lines wrapped by the PDF layout are joined into paragraphs before they
+    are split into sentences; a blank line or a heading ends a paragraph.
+    """
+    units = []
+    for page_idx, page in enumerate(page_texts):
+        paragraph: List[str] = []
+
+        def flush():
+            if paragraph:
+                units.extend((sentence, page_idx, False) for sentence in split_sentences(' '.join(paragraph)))
+                paragraph.clear()
+
+        for line in page['text'].splitlines():
+            line = ' '.join(line.split())
+            if not line:
+                flush()
+            elif is_heading(line):
+                flush()
+                units.append((line, page_idx, True))
+            else:
+                paragraph.append(line)
+        flush()
+    return units
+
+
+def chunk_sentences(
+    page_texts: List[Dict[str, Any]],
+    max_tokens: int = 256,
+    overlap_tokens: int = 32,
+    min_tokens: Optional[int] = None,
+    count_tokens: Optional[Callable[[str], int]] = None
+) -> List[Dict[str, Any]]:
+    """Split page texts into token windows along sentence and section boundaries
+
+    Sentences are packed into a chunk until the next one would exceed
+    max_tokens. A heading starts a new chunk once the current one holds
+    min_tokens (default: a quarter of max_tokens), and is never left at the
+    end of a chunk. A sentence longer than max_tokens (e.g. a table read as
+    one line) is split into word windows of about max_tokens.
+
+    Args:
+        page_texts: List of dicts with 'text' and 'page_number' keys, in page order
+        max_tokens: Token budget per chunk
+        overlap_tokens: Whole sentences of the previous chunk repeated at the start of
+            the next, up to this many tokens (not across a heading)
+        min_tokens: Tokens a chunk needs before a heading may close it
+        count_tokens: Token counter (default: the shared counter used for chunk payloads)
+
+    Returns:
+        List of dicts with 'text', 'page_number' and 'chunk_index' keys
+    """
+    count_tokens = count_tokens or get_token_counter().count
+    min_tokens = max_tokens // 4 if min_tokens is None else min_tokens
+
+    units = []  # (text, page index, is heading, tokens)
+    for text, page_idx, heading in _page_units(page_texts):
+        tokens = count_tokens(text)
+        if tokens <= max_tokens:
+            units.append((text, page_idx, heading, tokens))
+            continue
+        words = text.split()
+        step = max(1, len(words) * max_tokens // tokens)
+        for start in range(0, len(words), step):
+            piece = ' '.join(words[start:start + step])
+            units.append((piece, page_idx, False, count_tokens(piece)))
+
+    chunks: List[Dict[str, Any]] = []
+
+    def emit(window: List[tuple]):
+        text = ''.join(unit[0] + ('\n' if unit[2] else ' ') for unit in window).strip()
+        pages = np.fromiter((unit[1] for unit in window), dtype=np.int32, count=len(window))
+        # Tokens per page in this chunk, counted from the chunk's first page
+        counts = np.bincount(pages - pages[0], weights=[max(1, unit[3]) for unit in window])
+        top = counts.max()
+        page_idx = int(pages[0]) + int(np.argmax(counts)) if np.count_nonzero(counts == top) == 1 else int(pages[0])
+        chunks.append({'text': text, 'page_number': page_texts[page_idx]['page_number'], 'chunk_index': len(chunks)})
+
+    window: List[tuple] = []
+    window_tokens = 0
+    carried = 0  # Units at the start of the window repeated from the previous chunk
+    for unit in units:
+        heading, tokens = unit[2], unit[3]
+        if heading and carried == len(window):
+            # A new section does not begin with the end of the previous one
+            window, window_tokens, carried = [], 0, 0
+        full = window_tokens + tokens > max_tokens
+        if window and (full or (heading and window_tokens >= min_tokens)):
+            # Headings go with the text after them
+            lead = []
+            while window and window[-1][2]:
+                lead.insert(0, window.pop())
+            if window:
+                emit(window)
+            carry = []
+            if not heading and not lead:
+                carry_tokens = 0
+                for previous in reversed(window):
+                    if previous[2] or carry_tokens + previous[3] > overlap_tokens:
+                        break
+                    carry.insert(0, previous)
+                    carry_tokens += previous[3]
+            window = carry + lead
+            window_tokens = sum(u[3] for u in window)
+            # The carried overlap gives way to the new sentence
+            while carry and window_tokens + tokens > max_tokens:
+                window_tokens -= carry.pop(0)[3]
+                window.pop(0)
+            carried = len(carry)
+        window.append(unit)
+        window_tokens += tokens
+    if window:
+        emit(window)
+    return chunks
+
+
+CHUNKING_STRATEGIES: Dict[str, Callable[..., List[Dict[str, Any]]]] = {
+    'sentences': chunk_sentences,
+    'words': chunk_pages,
+}
+
+
+def chunk_document(page_texts: List[Dict[str, Any]], strategy: str = 'sentences', **options) -> List[Dict[str, Any]]:
+    """Chunk extracted pages with a named strategy
+
+    Args:
+        page_texts: List of dicts with 'text' and 'page_number' keys, in page order
+        strategy: Key of CHUNKING_STRATEGIES
+        **options: Keyword arguments of that strategy (max_tokens / overlap_tokens for
+            "sentences", chunk_size / overlap for "words")
+    """
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy '{strategy}' (expected one of {sorted(CHUNKING_STRATEGIES)})")
+    return CHUNKING_STRATEGIES[strategy](page_texts, **options)
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def _chunk_with_word_dicts(page_texts: List[Dict[str, Any]], chunk_size: int = 500, overlap: int = 50) -> list:
+    """The previous chunker: a dict per word, a dict of page counts per chunk"""
+    words = [{'word': word, 'page_number': page['page_number']} for page in page_texts for word in page['text'].split()]
+    chunks = []
+    for i in range(0, len(words), chunk_size - overlap):
+        window = words[i:i + chunk_size]
+        page_counts = {}
+        for word in window:
+            page_counts[word['page_number']] = page_counts.get(word['page_number'], 0) + 1
+        top = max(page_counts.values())
+        pages_with_max = [page for page, count in page_counts.items() if count == top]
+        chunks.append({
+            'text': ' '.join(word['word'] for word in window),
+            'page_number': pages_with_max[0] if len(pages_with_max) == 1 else window[0]['page_number'],
+            'chunk_index': len(chunks)
+        })
+    return chunks
+
+
+def _measure(chunker, page_texts: list, chunk_size: int, overlap: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = chunker(page_texts, chunk_size, overlap)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return chunks, elapsed, peak
+
+
+def main():
+    from ingest_pipeline import extract_pages
+
+    parser = argparse.ArgumentParser(description="Peak memory and time: per-word dicts vs offset-array chunking")
+    parser.add_argument("--pdf", help="PDF to chunk (default: the largest PDF under --pdf-dir)")
+    parser.add_argument("--pdf-dir", default="pdfs")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--overlap", type=int, default=50)
+    args = parser.parse_args()
+
+    pdf = Path(args.pdf) if args.pdf else max(Path(args.pdf_dir).rglob("*.pdf"), key=lambda p: p.stat().st_size, default=None)
+    if pdf is None:
+        print(f"No PDFs found under {args.pdf_dir}")
+        return
+    page_texts = extract_pages(str(pdf))
+    total_words = sum(len(page['text'].split()) for page in page_texts)
+    print(f"{pdf}: {len(page_texts)} pages, {total_words} words")
+
+    results = []
+    for label, chunker in (("per-word dicts", _chunk_with_word_dicts), ("offset arrays", chunk_pages)):
+        chunks, elapsed, peak = _measure(chunker, page_texts, args.chunk_size, args.overlap)
+        results.append(chunks)
+        print(f"  {label:<16} {len(chunks):6d} chunks in {elapsed:7.3f}s, peak {peak / 1e6:8.1f} MB")
+    print(f"  Same chunks and page numbers: {results[0] == results[1]}")
+
+
+if __name__ == "__main__":
+    main()
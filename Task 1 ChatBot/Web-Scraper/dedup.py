@@ -0,0 +1,403 @@
+"""
+Near-duplicate chunk detection at ingest (MinHash + LSH, SQLite).
+
+Sources overlap: the IIFA Resolutions E-Book contains the text of every
+individual resolution PDF, so most of iifa_resolutions would be indexed
+twice. Each chunk gets a MinHash signature over word shingles; LSH buckets
+find earlier chunks of other documents that are probably similar, and a
+chunk whose estimated Jaccard similarity to one of them reaches the
+threshold is stored as an alias of that canonical chunk instead of as a
+separate vector. The canonical point lists the documents it also stands for
+in its 'duplicate_sources' payload.
+
+Only published (live) chunks can be canonical. When a document is replaced,
+aliases of its old chunks are linked to another canonical chunk or stored as
+points of their own again (see qdrant_writer.QdrantWriter.publish).
+
+Settings from the environment:
+    DEDUP_ENABLED         (default 1)
+    DEDUP_THRESHOLD       (default 0.9 estimated Jaccard similarity)
+    DEDUP_INDEX_PATH      (default: dedup_index.db next to this file)
+
+Index-size reduction per collection:
+    python dedup.py --report
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1").lower() in ("1", "true", "yes")
+DEFAULT_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))
+DEFAULT_INDEX_PATH = os.getenv("DEDUP_INDEX_PATH", str(Path(__file__).parent / "dedup_index.db"))
+
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs above ~0.7 Jaccard share a bucket with high probability
+BANDS = 16
+SHINGLE_WORDS = 5
+# Payload fields of a linked chunk copied into its canonical point's duplicate_sources
+# (enough for the backend to cite the document and list it)
+DUPLICATE_SOURCE_FIELDS = ('pdf_url', 'pdf_title', 'page_number', 'chunk_index', 'total_chunks',
+                           'date', 'document_type', 'resolution_number')
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.RandomState(1)  # Fixed: signatures are persisted across runs
+_PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM).astype(np.uint64)
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature (uint32[NUM_PERM]) of a text's word shingles"""
+    words = re.sub(r'\s+', ' ', text.lower()).strip().split(' ')
+    if len(words) <= SHINGLE_WORDS:
+        shingles = {' '.join(words)}
+    else:
+        shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    hashes = np.array([zlib.crc32(shingle.encode('utf-8')) for shingle in shingles], dtype=np.uint64)
+    # (a * x + b) mod p for every permutation and shingle; a, b, x < 2^32 cannot overflow uint64
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME
+    return (permuted.min(axis=0) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+def document_key(payload: Dict[str, Any]) -> str:
+    """The unit a chunk is published with: its source document for sections of a split PDF, else its PDF"""
+    return payload.get('source_document') or payload['pdf_url']
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(a == b))
+
+
+def lsh_buckets(signature: np.ndarray) -> List[int]:
+    """One bucket key per band (band number included, so one column holds all bands)"""
+    rows = NUM_PERM // BANDS
+    buckets = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(),
+                                 digest_size=8, person=band.to_bytes(2, 'little')).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+
+class DedupIndex:
+    """Signatures, LSH buckets and alias links of one collection"""
+
+    def __init__(self, collection_name: str, db_path: str = DEFAULT_INDEX_PATH, threshold: float = DEFAULT_THRESHOLD):
+        """
+        Args:
+            collection_name: Qdrant collection the chunks are stored in
+            db_path: SQLite file, shared by all collections
+            threshold: Estimated Jaccard similarity from which a chunk is a duplicate
+        """
+        self.collection_name = collection_name
+        self.db_path = Path(db_path)
+        self.threshold = threshold
+        self._init_database()
+
+    @contextmanager
+    def get_db_connection(self):
+        """Context manager for database connections"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _init_database(self):
+        """Initialize the chunk, bucket and alias tables"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            # Embed and upsert workers use the index at the same time
+            cursor.execute("PRAGMA journal_mode=WAL")
+            # Indexes created before e-book splitting keyed documents by pdf_url
+            for table in ("chunks", "aliases"):
+                columns = [row['name'] for row in cursor.execute(f"PRAGMA table_info({table})")]
+                if 'pdf_url' in columns:
+                    cursor.execute(f"ALTER TABLE {table} RENAME COLUMN pdf_url TO document")
+            # Chunks stored as points (candidates for canonical once live)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    collection TEXT NOT NULL,
+                    point_id TEXT NOT NULL,
+                    document TEXT NOT NULL,
+                    doc_version TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    live INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (collection, point_id)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(collection, document)")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    collection TEXT NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    point_id TEXT NOT NULL
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_buckets_lookup ON buckets(collection, bucket)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_buckets_point ON buckets(collection, point_id)")
+            # Chunks not stored because a canonical chunk has (nearly) the same text
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS aliases (
+                    collection TEXT NOT NULL,
+                    alias_id TEXT NOT NULL,
+                    canonical_id TEXT NOT NULL,
+                    document TEXT NOT NULL,
+                    doc_version TEXT NOT NULL,
+                    similarity REAL NOT NULL,
+                    signature BLOB NOT NULL,
+                    payload TEXT NOT NULL,
+                    live INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (collection, alias_id)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_aliases_canonical ON aliases(collection, canonical_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_aliases_document ON aliases(collection, document)")
+
+    def find_canonicals(
+        self,
+        signatures: List[np.ndarray],
+        exclude_document: Optional[str] = None
+    ) -> List[Optional[Tuple[str, float]]]:
+        """Most similar live chunk of another document for each signature
+
+        Returns:
+            (point ID, estimated similarity) per signature, or None below the threshold
+        """
+        matches: List[Optional[Tuple[str, float]]] = []
+        with self.get_db_connection() as conn:
+            for signature in signatures:
+                buckets = lsh_buckets(signature)
+                rows = conn.execute(
+                    f"""
+                    SELECT DISTINCT c.point_id, c.signature FROM buckets b
+                    JOIN chunks c ON c.collection = b.collection AND c.point_id = b.point_id
+                    WHERE b.collection = ? AND b.bucket IN ({",".join("?" * len(buckets))})
+                      AND c.live = 1 AND c.document != ?
+                    """,
+                    (self.collection_name, *buckets, exclude_document or "")
+                ).fetchall()
+                best = None
+                for row in rows:
+                    score = similarity(signature, np.frombuffer(row['signature'], dtype=np.uint32))
+                    if score >= self.threshold and (best is None or score > best[1]):
+                        best = (row['point_id'], score)
+                matches.append(best)
+        return matches
+
+    def add_chunks(self, chunks: Iterable[Tuple[str, str, str, np.ndarray]], live: bool = False):
+        """Index stored chunks: (point ID, document, doc_version, signature)"""
+        chunks = list(chunks)
+        if not chunks:
+            return
+        with self.get_db_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (collection, point_id, document, doc_version, signature, live) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.collection_name, point_id, url, version, signature.tobytes(), int(live))
+                 for point_id, url, version, signature in chunks]
+            )
+            conn.executemany(
+                "DELETE FROM buckets WHERE collection = ? AND point_id = ?",
+                [(self.collection_name, point_id) for point_id, _, _, _ in chunks]
+            )
+            conn.executemany(
+                "INSERT INTO buckets (collection, bucket, point_id) VALUES (?, ?, ?)",
+                [(self.collection_name, bucket, point_id)
+                 for point_id, _, _, signature in chunks for bucket in lsh_buckets(signature)]
+            )
+
+    def add_aliases(self, aliases: Iterable[Dict[str, Any]], live: bool = False):
+        """Link chunks to canonical ones
+
+        Each alias has 'alias_id' (the point ID it would have had), 'canonical_id',
+        'similarity', 'signature' and 'payload' (the point payload it would have had).
+        """
+        aliases = list(aliases)
+        if not aliases:
+            return
+        with self.get_db_connection() as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO aliases
+                    (collection, alias_id, canonical_id, document, doc_version, similarity, signature, payload, live)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(self.collection_name, alias['alias_id'], alias['canonical_id'], document_key(alias['payload']),
+                  alias['payload']['doc_version'], alias['similarity'], alias['signature'].tobytes(),
+                  json.dumps(alias['payload']), int(live))
+                 for alias in aliases]
+            )
+
+    def publish(self, document: str, doc_version: str) -> Tuple[List[Dict[str, Any]], Set[str]]:
+        """Make a document version's chunks and aliases live and forget its other versions
+
+        Args:
+            document: document_key() of the published chunks
+
+        Returns:
+            Tuple of (aliases of other documents whose canonical chunk was
+            removed, now unlinked; canonical IDs whose alias list changed)
+        """
+        with self.get_db_connection() as conn:
+            removed = [row['point_id'] for row in conn.execute(
+                "SELECT point_id FROM chunks WHERE collection = ? AND document = ? AND doc_version != ?",
+                (self.collection_name, document, doc_version)
+            )]
+            touched = {row['canonical_id'] for row in conn.execute(
+                "SELECT DISTINCT canonical_id FROM aliases WHERE collection = ? AND document = ?",
+                (self.collection_name, document)
+            )}
+
+            orphans = []
+            for start in range(0, len(removed), 500):
+                batch = removed[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT * FROM aliases WHERE collection = ? AND canonical_id IN ({placeholders})",
+                    (self.collection_name, *batch)
+                ).fetchall()
+                # Aliases of documents still being ingested are orphaned too
+                orphans.extend({
+                    'alias_id': row['alias_id'],
+                    'live': bool(row['live']),
+                    'similarity': row['similarity'],
+                    'signature': np.frombuffer(row['signature'], dtype=np.uint32),
+                    'payload': json.loads(row['payload']),
+                } for row in rows)
+                conn.execute(
+                    f"DELETE FROM aliases WHERE collection = ? AND canonical_id IN ({placeholders})",
+                    (self.collection_name, *batch)
+                )
+                conn.execute(
+                    f"DELETE FROM buckets WHERE collection = ? AND point_id IN ({placeholders})",
+                    (self.collection_name, *batch)
+                )
+            conn.execute(
+                "DELETE FROM chunks WHERE collection = ? AND document = ? AND doc_version != ?",
+                (self.collection_name, document, doc_version)
+            )
+            conn.execute(
+                "DELETE FROM aliases WHERE collection = ? AND document = ? AND doc_version != ?",
+                (self.collection_name, document, doc_version)
+            )
+            conn.execute(
+                "UPDATE chunks SET live = 1 WHERE collection = ? AND document = ? AND doc_version = ?",
+                (self.collection_name, document, doc_version)
+            )
+            conn.execute(
+                "UPDATE aliases SET live = 1 WHERE collection = ? AND document = ? AND doc_version = ?",
+                (self.collection_name, document, doc_version)
+            )
+            touched |= {row['canonical_id'] for row in conn.execute(
+                "SELECT DISTINCT canonical_id FROM aliases WHERE collection = ? AND document = ?",
+                (self.collection_name, document)
+            )}
+        return orphans, touched - set(removed)
+
+    def forget(self, point_ids: Iterable[str]):
+        """Drop chunks that are no longer stored (e.g. the collection was recreated), and aliases linked to them"""
+        ids = list(point_ids)
+        with self.get_db_connection() as conn:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for statement in (
+                    f"DELETE FROM chunks WHERE collection = ? AND point_id IN ({placeholders})",
+                    f"DELETE FROM buckets WHERE collection = ? AND point_id IN ({placeholders})",
+                    f"DELETE FROM aliases WHERE collection = ? AND canonical_id IN ({placeholders})",
+                ):
+                    conn.execute(statement, (self.collection_name, *batch))
+
+    def duplicate_sources(self, canonical_ids: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Documents each canonical chunk stands in for (pdf_url, pdf_title, page_number, ...)"""
+        sources: Dict[str, List[Dict[str, Any]]] = {point_id: [] for point_id in canonical_ids}
+        ids = list(sources)
+        with self.get_db_connection() as conn:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT canonical_id, payload FROM aliases WHERE collection = ? AND live = 1 "
+                    f"AND canonical_id IN ({','.join('?' * len(batch))}) ORDER BY document",
+                    (self.collection_name, *batch)
+                )
+                for row in rows:
+                    payload = json.loads(row['payload'])
+                    source = {key: payload[key] for key in DUPLICATE_SOURCE_FIELDS if key in payload}
+                    sources[row['canonical_id']].append(source)
+        return sources
+
+    def stats(self) -> Dict[str, Any]:
+        """Live chunks stored as points vs. linked as aliases"""
+        with self.get_db_connection() as conn:
+            stored = conn.execute(
+                "SELECT COUNT(*) FROM chunks WHERE collection = ? AND live = 1", (self.collection_name,)
+            ).fetchone()[0]
+            aliased = conn.execute(
+                "SELECT COUNT(*) FROM aliases WHERE collection = ? AND live = 1", (self.collection_name,)
+            ).fetchone()[0]
+        total = stored + aliased
+        return {
+            "collection": self.collection_name,
+            "stored": stored,
+            "aliased": aliased,
+            "reduction": aliased / total if total else 0.0,
+        }
+
+
+_indexes: Dict[Tuple[str, str], DedupIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_dedup_index(collection_name: str, db_path: str = DEFAULT_INDEX_PATH) -> Optional[DedupIndex]:
+    """Shared index for a collection, or None if deduplication is disabled or the index cannot be opened"""
+    if not DEDUP_ENABLED:
+        return None
+    key = (collection_name, str(db_path))
+    with _indexes_lock:
+        if key not in _indexes:
+            try:
+                _indexes[key] = DedupIndex(collection_name, db_path)
+            except sqlite3.Error as e:
+                print(f"  ⚠ Near-duplicate index unavailable ({e}), storing every chunk")
+                return None
+        return _indexes[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-duplicate chunk index report")
+    parser.add_argument("--db", default=DEFAULT_INDEX_PATH)
+    parser.add_argument("--report", action="store_true", help="Index-size reduction per collection")
+    args = parser.parse_args()
+
+    if not Path(args.db).exists():
+        print(f"No near-duplicate index at {args.db}")
+        return
+    with sqlite3.connect(args.db) as conn:
+        collections = [row[0] for row in conn.execute("SELECT DISTINCT collection FROM chunks ORDER BY collection")]
+    print(f"{'collection':<28}{'stored':>10}{'aliased':>10}{'reduction':>11}")
+    for collection in collections:
+        stats = DedupIndex(collection, args.db).stats()
+        print(f"{collection:<28}{stats['stored']:>10}{stats['aliased']:>10}{stats['reduction']:>10.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Concurrent PDF downloads with per-host politeness limits.
+
+One connection-pooled httpx.AsyncClient per host is kept for the whole run,
+together with its cookies (from Selenium or from fetching the landing page
+once per scrape run; ingest() calls reset_cookies() first so a long-lived
+process picks up fresh session cookies). Downloads run on a background
+event loop. Total concurrency is bounded, and each host has its own
+concurrency limit and minimum interval between requests. Connection
+errors, 429 and 5xx responses are retried with exponential backoff,
+honouring Retry-After. Bodies are streamed to a temporary file, which is
+renamed into place once complete. Conditional requests (If-None-Match /
+If-Modified-Since) that come back 304 raise NotModified and leave the
+existing file alone.
+
+The scrapers call download() from their (threaded) fetch stage; it blocks
+the calling thread only, so several downloads share the pooled clients.
+
+Settings (environment):
+    DOWNLOAD_CONCURRENCY    (default 8 downloads in total)
+    DOWNLOAD_PER_HOST       (default 2 concurrent downloads per host)
+    DOWNLOAD_RATE_PER_HOST  (default 2 requests/second per host)
+    DOWNLOAD_RETRIES        (default 3 retries)
+
+Benchmark against sequential requests on a local fixture server:
+    python downloader.py --files 40 --size-kb 512 --latency 0.1
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'application/pdf,application/octet-stream,*/*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'identity',  # Don't compress, we want raw bytes
+}
+
+# Statuses worth retrying (rate limited or server-side trouble)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class NotModified(Exception):
+    """The server answered a conditional request with 304"""
+
+
+@dataclass
+class DownloadResult:
+    """What a finished download looked like (the body is on disk)"""
+    path: str
+    status_code: int
+    content_type: str
+    final_url: str
+    size: int
+    first_bytes: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class AsyncDownloader:
+    """Pooled, rate-limited downloads on a background event loop"""
+
+    def __init__(
+        self,
+        max_concurrency: int = int(os.getenv("DOWNLOAD_CONCURRENCY", "8")),
+        per_host_concurrency: int = int(os.getenv("DOWNLOAD_PER_HOST", "2")),
+        per_host_rate: float = float(os.getenv("DOWNLOAD_RATE_PER_HOST", "2")),
+        retries: int = int(os.getenv("DOWNLOAD_RETRIES", "3")),
+        backoff: float = 1.0,
+        timeout: float = 60.0
+    ):
+        """
+        Args:
+            max_concurrency: Downloads in flight across all hosts
+            per_host_concurrency: Downloads in flight (and pooled connections) per host
+            per_host_rate: Requests per second started against one host (0 = unlimited)
+            retries: Retries after the first attempt
+            backoff: First retry delay in seconds, doubled on each retry
+            timeout: Per-request timeout in seconds
+        """
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_host_concurrency = max(1, per_host_concurrency)
+        self.min_interval = 1.0 / per_host_rate if per_host_rate > 0 else 0.0
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # Created on the loop: global limit, per-host clients, limits and pacing
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._next_request: Dict[str, float] = {}
+        self._primed: set = set()
+        self._priming: Dict[str, asyncio.Task] = {}
+        self._local = threading.local()
+
+    # ----- Sync API (any thread) -----
+
+    def download(
+        self,
+        url: str,
+        filepath: str,
+        referer: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None
+    ) -> DownloadResult:
+        """Download url to filepath, blocking the calling thread until done
+
+        Raises:
+            NotModified: A conditional request (headers) came back 304
+        """
+        self._local.result = None
+        result = self._submit(self.fetch(url, filepath, referer=referer, headers=headers)).result()
+        self._local.result = result
+        return result
+
+    def last_result(self) -> Optional[DownloadResult]:
+        """The calling thread's last successful download() (for validators after a wrapped call)"""
+        return getattr(self._local, 'result', None)
+
+    def download_many(self, items: List[tuple], referer: Optional[str] = None) -> List[object]:
+        """Download (url, filepath) pairs concurrently; failures are returned as exceptions"""
+        async def run_all():
+            return await asyncio.gather(
+                *(self.fetch(url, filepath, referer=referer) for url, filepath in items),
+                return_exceptions=True
+            )
+        return self._submit(run_all()).result()
+
+    def prime(self, landing_url: str):
+        """Fetch a host's landing page once (until reset_cookies) so later downloads carry its cookies"""
+        self._submit(self._prime(landing_url)).result()
+
+    def reset_cookies(self, url: str):
+        """Forget url's host cookies so the next prime() fetches the landing page again"""
+        async def reset():
+            host = self._host(url)
+            self._primed.discard(host)
+            if host in self._clients:
+                self._clients[host].cookies.clear()
+        self._submit(reset()).result()
+
+    def set_cookies(self, cookies: List[dict], url: str):
+        """Reuse browser cookies (Selenium get_cookies() format) for url's host"""
+        async def apply():
+            client = self._client(self._host(url))
+            for cookie in cookies:
+                client.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''))
+            self._primed.add(self._host(url))
+        self._submit(apply()).result()
+
+    def close(self):
+        """Close pooled connections and stop the event loop"""
+        if self._loop is None:
+            return
+
+        async def close_clients():
+            for client in self._clients.values():
+                await client.aclose()
+            self._clients.clear()
+        self._submit(close_clients()).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+        self._thread = None
+
+    # ----- Async implementation -----
+
+    async def fetch(
+        self,
+        url: str,
+        filepath: str,
+        referer: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None
+    ) -> DownloadResult:
+        """Download url to filepath with retries (must run on this downloader's loop)"""
+        host = self._host(url)
+        client = self._client(host)
+        headers = dict(headers or {})
+        if referer:
+            headers['Referer'] = referer
+        attempt = 0
+        async with self._semaphore, self._host_semaphores[host]:
+            while True:
+                await self._pace(host)
+                try:
+                    return await self._stream_to_file(client, url, filepath, headers)
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                    if attempt >= self.retries or (status is not None and status not in RETRY_STATUSES):
+                        raise
+                    delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                    retry_after = e.response.headers.get('Retry-After') if status is not None else None
+                    if retry_after and retry_after.isdigit():
+                        delay = max(delay, float(retry_after))
+                    attempt += 1
+                    print(f"  ↻ Retry {attempt}/{self.retries} for {url} in {delay:.1f}s ({status or type(e).__name__})")
+                    await asyncio.sleep(delay)
+
+    async def _stream_to_file(self, client: httpx.AsyncClient, url: str, filepath: str, headers: dict) -> DownloadResult:
+        partial = Path(f"{filepath}.part")
+        try:
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 304:
+                    raise NotModified(url)
+                response.raise_for_status()
+                size = 0
+                first_bytes = b''
+                with open(partial, 'wb') as f:
+                    async for block in response.aiter_bytes():
+                        if len(first_bytes) < 4:
+                            first_bytes = (first_bytes + block)[:4]
+                        f.write(block)
+                        size += len(block)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        os.replace(partial, filepath)
+        return DownloadResult(
+            path=str(filepath),
+            status_code=response.status_code,
+            content_type=response.headers.get('Content-Type', '').lower(),
+            final_url=str(response.url),
+            size=size,
+            first_bytes=first_bytes,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified')
+        )
+
+    async def _prime(self, landing_url: str):
+        """Fetch the landing page unless its host is primed; concurrent callers share one fetch"""
+        host = self._host(landing_url)
+        if host in self._primed:
+            return
+        if host not in self._priming:
+            self._priming[host] = asyncio.ensure_future(self._fetch_landing(host, landing_url))
+        await asyncio.shield(self._priming[host])
+
+    async def _fetch_landing(self, host: str, landing_url: str):
+        client = self._client(host)
+        try:
+            await self._pace(host)
+            await client.get(landing_url)
+            # Only a fetched landing page counts, so a failed prime is retried by the next caller
+            self._primed.add(host)
+        except httpx.HTTPError as e:
+            print(f"  ⚠ Could not fetch {landing_url} for cookies: {e}")
+        finally:
+            del self._priming[host]
+
+    async def _pace(self, host: str):
+        """Wait until this host may receive the next request"""
+        if not self.min_interval:
+            return
+        async with self._host_locks[host]:
+            now = time.monotonic()
+            wait = self._next_request.get(host, now) - now
+            self._next_request[host] = max(now, self._next_request.get(host, now)) + self.min_interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _client(self, host: str) -> httpx.AsyncClient:
+        if host not in self._clients:
+            self._clients[host] = httpx.AsyncClient(
+                headers=DEFAULT_HEADERS,
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(
+                    max_connections=self.per_host_concurrency,
+                    max_keepalive_connections=self.per_host_concurrency
+                )
+            )
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_concurrency)
+            self._host_locks[host] = asyncio.Lock()
+        return self._clients[host]
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return urlparse(url).netloc.lower()
+
+    def _submit(self, coro):
+        """Run a coroutine on the background loop, starting it on first use"""
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="pdf-downloader", daemon=True)
+                self._thread.start()
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+
+_downloader: Optional[AsyncDownloader] = None
+_downloader_lock = threading.Lock()
+
+
+def get_downloader() -> AsyncDownloader:
+    """Shared downloader, so every scraper in the process reuses the same pooled clients"""
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = AsyncDownloader()
+        return _downloader
+
+
+# ---------------------------------------------------------------------------
+# Benchmark (local fixture server)
+# ---------------------------------------------------------------------------
+
+def start_fixture_server(size_kb: int = 512, latency: float = 0.1, fail_rate: float = 0.0):
+    """Serve fake PDFs on 127.0.0.1 (random port) with added latency and optional 503s"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    body = b'%PDF-1.4\n' + os.urandom(size_kb * 1024)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path.endswith('.pdf') and random.random() < fail_rate:
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            payload = body if self.path.endswith('.pdf') else b'<html>landing</html>'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf' if self.path.endswith('.pdf') else 'text/html')
+            self.send_header('Content-Length', str(len(payload)))
+            self.send_header('Set-Cookie', 'session=fixture; Path=/')
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _download_sequentially(urls: List[str], out_dir: Path, landing_url: str, retries: int) -> int:
+    """The previous path: a new requests.Session and a landing-page visit per PDF"""
+    import requests
+
+    done = 0
+    for i, url in enumerate(urls):
+        for attempt in range(retries + 1):
+            session = requests.Session()
+            session.get(landing_url, headers=DEFAULT_HEADERS, timeout=30)
+            response = session.get(url, headers=DEFAULT_HEADERS, timeout=60)
+            if response.status_code < 500:
+                break
+            time.sleep(2 ** attempt)
+        response.raise_for_status()
+        (out_dir / f"seq_{i}.pdf").write_bytes(response.content)
+        done += 1
+    return done
+
+
+def main():
+    import shutil
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="PDF download throughput: sequential vs pooled async")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--size-kb", type=int, default=512)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds the fixture server waits per request")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of PDF requests answered with 503")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0, help="Requests/second per host (0 = unlimited)")
+    args = parser.parse_args()
+
+    server = start_fixture_server(args.size_kb, args.latency, args.fail_rate)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    urls = [f"{base}/docs/{i}.pdf" for i in range(args.files)]
+    out_dir = Path(tempfile.mkdtemp(prefix="download-benchmark-"))
+    total_mb = args.files * args.size_kb / 1024
+    print(f"Fixture server at {base}: {args.files} PDFs of {args.size_kb} KB, "
+          f"{args.latency * 1000:.0f}ms latency, {args.fail_rate:.0%} 503s")
+
+    try:
+        start = time.perf_counter()
+        done = _download_sequentially(urls, out_dir, f"{base}/", retries=3)
+        elapsed = time.perf_counter() - start
+        print(f"  {'sequential (session per PDF)':<32} {done} files in {elapsed:6.2f}s = "
+              f"{done / elapsed:6.1f} files/s, {total_mb / elapsed:6.1f} MB/s")
+
+        downloader = AsyncDownloader(max_concurrency=args.concurrency, per_host_concurrency=args.per_host,
+                                     per_host_rate=args.rate, retries=3, backoff=0.2)
+        start = time.perf_counter()
+        downloader.prime(f"{base}/")
+        results = downloader.download_many([(url, str(out_dir / f"async_{i}.pdf")) for i, url in enumerate(urls)])
+        elapsed = time.perf_counter() - start
+        done = sum(1 for result in results if isinstance(result, DownloadResult))
+        print(f"  {'async, pooled per host':<32} {done} files in {elapsed:6.2f}s = "
+              f"{done / elapsed:6.1f} files/s, {total_mb / elapsed:6.1f} MB/s")
+        downloader.close()
+    finally:
+        server.shutdown()
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Split the IIFA Resolutions E-Book into one logical document per resolution.
+
+Resolutions start with a heading such as "Resolution No. 236 (1/24)" or
+"قرار رقم: 236 (1/24)" (resolution number, then number within the session /
+session number). The splitter walks the extracted page text line by line,
+starts a new section at every heading, and reads the session date (the first
+Gregorian date in the section) for the 'date' metadata. Headings listed in
+the table of contents are recognised by repeating a number that has a longer
+section elsewhere and are folded back into the text around them.
+
+Try it on a downloaded e-book:
+    python ebook_splitter.py pdfs/iifa/IIFA_Resolutions_E-Book.pdf
+"""
+
+import argparse
+import re
+from typing import Any, Dict, List, Optional
+
+# Arabic-Indic and Extended Arabic-Indic digits → ASCII
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+
+RESOLUTION_HEADINGS = [
+    re.compile(r'^\s*resolution\s*(?:no\.?|number|#)\s*:?\s*(\d{1,4})\s*\(\s*(\d{1,3})\s*/\s*(\d{1,3})\s*\)', re.I),
+    re.compile(r'^\s*قرار\s*رقم\s*:?\s*(\d{1,4})\s*\(\s*(\d{1,3})\s*/\s*(\d{1,3})\s*\)'),
+]
+
+_MONTHS = (
+    r'January|February|March|April|May|June|July|August|September|October|November|December|'
+    r'Jan|Feb|Mar|Apr|Jun|Jul|Aug|Sep|Sept|Oct|Nov|Dec|'
+    r'يناير|فبراير|مارس|أبريل|إبريل|ابريل|مايو|يونيو|يونيه|يوليو|يوليه|أغسطس|اغسطس|سبتمبر|أكتوبر|اكتوبر|نوفمبر|ديسمبر'
+)
+# "26-30 April 2009", "15 to 19 April 2014", "14 أبريل 2014"
+SESSION_DATE = re.compile(
+    rf'(\d{{1,2}}(?:\s*(?:-|–|to|إلى)\s*\d{{1,2}})?\s+(?:{_MONTHS})\.?,?\s+\d{{4}})', re.I
+)
+
+# Only the start of a section is searched for its session date
+_DATE_WINDOW = 3000
+
+
+def find_heading(line: str) -> Optional[Dict[str, str]]:
+    """Resolution number and session of a heading line, or None"""
+    normalized = line.translate(_DIGITS)
+    for pattern in RESOLUTION_HEADINGS:
+        match = pattern.match(normalized)
+        if match:
+            return {
+                'resolution_number': match.group(1),
+                'session': match.group(3),
+                'heading': f"{match.group(1)} ({match.group(2)}/{match.group(3)})",
+            }
+    return None
+
+
+def split_resolutions(page_texts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sections of an e-book, one per resolution
+
+    Args:
+        page_texts: Extracted pages ({'text', 'page_number'}), in order
+
+    Returns:
+        Dicts with 'resolution_number', 'session', 'date', 'title' and 'pages'
+        (the section's text per page, same shape as page_texts). Text before
+        the first heading is a section with an empty resolution_number.
+    """
+    sections: List[Dict[str, Any]] = []
+    current = {'resolution_number': '', 'session': '', 'title': '', 'pages': []}
+
+    def add_text(section: Dict[str, Any], page_number: int, lines: List[str]):
+        text = "\n".join(lines).strip()
+        if not text:
+            return
+        if section['pages'] and section['pages'][-1]['page_number'] == page_number:
+            section['pages'][-1]['text'] += "\n" + text
+        else:
+            section['pages'].append({'text': text, 'page_number': page_number})
+
+    for page in page_texts:
+        lines: List[str] = []
+        for line in page['text'].splitlines():
+            heading = find_heading(line)
+            if heading is None:
+                lines.append(line)
+                continue
+            add_text(current, page['page_number'], lines)
+            sections.append(current)
+            current = {
+                'resolution_number': heading['resolution_number'],
+                'session': heading['session'],
+                'title': f"Resolution No. {heading['heading']}",
+                'pages': [],
+            }
+            lines = [line]
+        add_text(current, page['page_number'], lines)
+    sections.append(current)
+
+    sections = _fold_repeated_headings([section for section in sections if section['pages']])
+    for section in sections:
+        text = "\n".join(page['text'] for page in section['pages'])
+        date = SESSION_DATE.search(text[:_DATE_WINDOW].translate(_DIGITS))
+        section['date'] = date.group(1) if date else ''
+        # The line after the heading is usually the resolution's subject
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if section['resolution_number'] and len(lines) > 1 and len(lines[1]) <= 120:
+            section['title'] = f"{section['title']}: {lines[1]}"
+    return sections
+
+
+def _fold_repeated_headings(sections: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep the longest section per resolution number; merge the others into the section before them
+
+    Table-of-contents entries and running headers repeat a heading without
+    the resolution's text.
+    """
+    size = lambda section: sum(len(page['text']) for page in section['pages'])
+    longest: Dict[str, int] = {}
+    for i, section in enumerate(sections):
+        number = section['resolution_number']
+        if number and (number not in longest or size(section) > size(sections[longest[number]])):
+            longest[number] = i
+
+    merged: List[Dict[str, Any]] = []
+    for i, section in enumerate(sections):
+        number = section['resolution_number']
+        if not number or longest[number] == i:
+            merged.append(section)
+        elif not merged:
+            # Nothing before it: front matter
+            merged.append({**section, 'resolution_number': '', 'session': '', 'title': ''})
+        else:
+            previous = merged[-1]
+            for page in section['pages']:
+                if previous['pages'] and previous['pages'][-1]['page_number'] == page['page_number']:
+                    previous['pages'][-1]['text'] += "\n" + page['text']
+                else:
+                    previous['pages'].append(dict(page))
+    return merged
+
+
+def main():
+    from ingest_pipeline import extract_pages
+
+    parser = argparse.ArgumentParser(description="Show the resolutions found in an IIFA e-book")
+    parser.add_argument("pdf")
+    args = parser.parse_args()
+
+    sections = split_resolutions(extract_pages(args.pdf))
+    for section in sections:
+        pages = section['pages']
+        words = sum(len(page['text'].split()) for page in pages)
+        print(f"{section['resolution_number'] or '-':>5}  pages {pages[0]['page_number']:>4}-{pages[-1]['page_number']:<4} "
+              f"{words:>6} words  {section['date'] or '':<22} {section['title'][:70]}")
+    print(f"{sum(1 for s in sections if s['resolution_number'])} resolutions")
+
+
+if __name__ == "__main__":
+    main()
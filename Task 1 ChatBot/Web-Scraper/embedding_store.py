@@ -0,0 +1,279 @@
+"""
+Persistent chunk embedding store (SQLite), keyed by content hash.
+
+Vectors are stored as float32 blobs under (model, SHA-256 of the chunk text),
+so re-ingesting a revised document only encodes the chunks whose text
+changed; every other chunk reuses its stored vector. Chunks identical across
+documents or sources share one entry.
+
+Location and size can be set in the environment:
+    EMBEDDING_STORE_PATH  (default: embedding_store.db next to this file)
+
+Maintenance and a benchmark of re-ingesting a slightly revised corpus:
+    python embedding_store.py --stats
+    python embedding_store.py --prune-days 180
+    python embedding_store.py --benchmark --pdf-dir pdfs/bnm --limit 20
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+DEFAULT_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", str(Path(__file__).parent / "embedding_store.db"))
+
+
+def text_hash(text: str) -> str:
+    """Content key of a chunk"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    """Chunk vectors of one embedding model, reusable across ingestion runs"""
+
+    def __init__(self, model_name: str, db_path: str = DEFAULT_STORE_PATH):
+        """
+        Args:
+            model_name: Embedding model the vectors come from (vectors of other models are never returned)
+            db_path: SQLite file, shared by all scrapers
+        """
+        self.model_name = model_name
+        self.db_path = Path(db_path)
+        self._init_database()
+
+    @contextmanager
+    def get_db_connection(self):
+        """Context manager for database connections"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _init_database(self):
+        """Initialize the embeddings table"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            # Several scrapers may ingest at the same time
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used TEXT NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Stored vectors for the given content hashes (missing ones are left out)"""
+        hashes = list(dict.fromkeys(hashes))
+        found: Dict[str, List[float]] = {}
+        now = datetime.now().isoformat()
+        with self.get_db_connection() as conn:
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT text_hash, dim, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    (self.model_name, *batch)
+                ).fetchall()
+                for row in rows:
+                    vector = np.frombuffer(row['vector'], dtype=np.float32)
+                    if len(vector) == row['dim']:
+                        found[row['text_hash']] = vector.tolist()
+                if rows:
+                    # Used vectors survive prune()
+                    conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash IN ({placeholders})",
+                        (now, self.model_name, *batch)
+                    )
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, List[float]]]):
+        """Store (content hash, vector) pairs"""
+        now = datetime.now().isoformat()
+        rows = [
+            (self.model_name, key, len(vector), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items
+        ]
+        if not rows:
+            return
+        with self.get_db_connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def prune(self, older_than_days: int) -> int:
+        """Delete vectors of this model not used for older_than_days; returns how many"""
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+        with self.get_db_connection() as conn:
+            cursor = conn.execute(
+                "DELETE FROM embeddings WHERE model = ? AND last_used < ?", (self.model_name, cutoff)
+            )
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self.get_db_connection() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) AS vectors, COALESCE(SUM(LENGTH(vector)), 0) AS bytes FROM embeddings WHERE model = ?",
+                (self.model_name,)
+            ).fetchone()
+        return {"vectors": row['vectors'], "bytes": row['bytes']}
+
+
+_stores: Dict[Tuple[str, str], EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(model_name: str, db_path: str = DEFAULT_STORE_PATH) -> Optional[EmbeddingStore]:
+    """Shared store for a model, or None if it cannot be opened (ingestion then encodes everything)"""
+    key = (model_name, str(db_path))
+    with _stores_lock:
+        if key not in _stores:
+            try:
+                _stores[key] = EmbeddingStore(model_name, db_path)
+            except sqlite3.Error as e:
+                print(f"  ⚠ Embedding store unavailable ({e}), every chunk will be encoded")
+                return None
+        return _stores[key]
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+AMENDMENT = "This provision was amended in the revised edition."
+
+
+def _revise(page_texts: List[Dict], fraction: float) -> List[Dict]:
+    """A 'revised edition', edited in the page text before chunking
+
+    Every n-th sentence is alternately followed by a new sentence or removed,
+    so the chunks after an edit shift the way they do in a real revision.
+    """
+    from chunking import split_sentences
+
+    step = max(1, round(1 / fraction)) if fraction > 0 else 0
+    count = 0
+    revised = []
+    for page in page_texts:
+        lines = []
+        for line in page['text'].split('\n'):
+            sentences = []
+            for sentence in split_sentences(line):
+                count += 1
+                if not step or count % step:
+                    sentences.append(sentence)
+                elif (count // step) % 2:
+                    sentences += [sentence, AMENDMENT]
+                # else: the sentence is removed
+            lines.append(' '.join(sentences))
+        revised.append({**page, 'text': '\n'.join(lines)})
+    return revised
+
+
+def _benchmark(args):
+    import tempfile
+
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, VectorParams
+    from sentence_transformers import SentenceTransformer
+
+    from chunking import DEFAULT_CHUNKING, chunk_document
+    from ingest_pipeline import extract_pages
+    from qdrant_writer import QdrantWriter
+
+    options = DEFAULT_CHUNKING if args.strategy == DEFAULT_CHUNKING['strategy'] else {'strategy': args.strategy}
+
+    def chunk(page_texts: List[Dict]) -> List[str]:
+        return [c['text'] for c in chunk_document(page_texts, **options)]
+
+    corpus = []
+    for pdf_path in sorted(Path(args.pdf_dir).rglob("*.pdf"))[:args.limit]:
+        try:
+            page_texts = extract_pages(str(pdf_path))
+        except Exception as e:
+            print(f"  Skipping {pdf_path}: {e}")
+            continue
+        if page_texts:
+            corpus.append((str(pdf_path), chunk(page_texts), chunk(_revise(page_texts, args.changed))))
+    total_chunks = sum(len(original) for _, original, _ in corpus)
+    if not total_chunks:
+        print(f"No PDF text found under {args.pdf_dir}")
+        return
+    unchanged = sum(len(set(original) & set(revised)) for _, original, revised in corpus)
+    revised_chunks = sum(len(revised) for _, _, revised in corpus)
+    print(f"Corpus: {len(corpus)} PDFs, {total_chunks} chunks ({args.strategy}); revision edits "
+          f"{args.changed:.0%} of sentences, leaving {unchanged}/{revised_chunks} chunks unchanged")
+
+    embedding_model = SentenceTransformer(args.model)
+    embedding_model.encode("warm-up")
+    client = QdrantClient(":memory:")
+    client.create_collection("embedding_store_benchmark", vectors_config=VectorParams(size=384, distance=Distance.COSINE))
+    store = EmbeddingStore(args.model, Path(tempfile.mkdtemp()) / "embedding_store.db")
+
+    def ingest(label: str, writer: QdrantWriter, revised: bool):
+        start = time.perf_counter()
+        for pdf_path, original, revision in corpus:
+            writer.store(pdf_path, Path(pdf_path).stem, revision if revised else original, pdf_path)
+        elapsed = time.perf_counter() - start
+        reuse = writer.reused / max(1, writer.reused + writer.encoded)
+        print(f"  {label:<32} {elapsed:7.2f}s, {writer.encoded:6d} chunks encoded, {writer.reused:6d} reused ({reuse:.0%})")
+
+    ingest("first ingestion (fills store)", QdrantWriter(client, "embedding_store_benchmark", embedding_model,
+                                                          embedding_store=store), revised=False)
+    ingest("revision, no store", QdrantWriter(client, "embedding_store_benchmark", embedding_model), revised=True)
+    ingest("revision, with store", QdrantWriter(client, "embedding_store_benchmark", embedding_model,
+                                                embedding_store=store), revised=True)
+    print(f"  Store: {store.stats()['vectors']} vectors, {store.stats()['bytes'] / 1e6:.1f} MB of float32")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk embedding store maintenance and benchmark")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--db", default=DEFAULT_STORE_PATH)
+    parser.add_argument("--stats", action="store_true", help="Show stored vector count and size")
+    parser.add_argument("--prune-days", type=int, help="Delete vectors not used for this many days")
+    parser.add_argument("--benchmark", action="store_true", help="Re-ingest a revised corpus with and without the store")
+    parser.add_argument("--pdf-dir", default="pdfs")
+    parser.add_argument("--limit", type=int, default=20, help="Number of PDFs for the benchmark")
+    parser.add_argument("--changed", type=float, default=0.05,
+                        help="Fraction of sentences inserted after or removed in the revision")
+    parser.add_argument("--strategy", default="sentences", choices=["sentences", "words"],
+                        help="Chunking strategy the corpus is chunked with (see chunking.py)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        _benchmark(args)
+        return
+
+    store = EmbeddingStore(args.model, args.db)
+    if args.prune_days is not None:
+        print(f"Pruned {store.prune(args.prune_days)} vectors unused for {args.prune_days} days")
+    stats = store.stats()
+    print(f"{args.db}: {stats['vectors']} vectors for {args.model} ({stats['bytes'] / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
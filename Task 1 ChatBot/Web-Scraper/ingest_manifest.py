@@ -0,0 +1,165 @@
+"""
+Ingestion manifest (SQLite) for incremental re-scraping.
+
+For every ingested PDF it records the HTTP validators (ETag, Last-Modified),
+the SHA-256 of the file and the IDs of the chunks stored in Qdrant, and for
+every collection the hash of the last listing page's link set. A re-run can
+then send conditional requests, skip documents whose content did not change,
+and skip the whole run when the listing is unchanged.
+"""
+
+import hashlib
+import json
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def listing_hash(jobs: Iterable[Dict[str, Any]]) -> str:
+    """Order-independent hash of a listing's links (URL and title)"""
+    links = sorted(f"{job['url']}\t{job.get('title', '')}" for job in jobs)
+    return hashlib.sha256("\n".join(links).encode('utf-8')).hexdigest()
+
+
+def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """If-None-Match / If-Modified-Since for a previously ingested document"""
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+class IngestManifest:
+    """What was ingested into one collection, and from which version of each PDF"""
+
+    def __init__(self, db_path: str, collection_name: str):
+        """
+        Args:
+            db_path: SQLite file (one per source output directory)
+            collection_name: Qdrant collection the documents were stored in
+        """
+        self.db_path = Path(db_path)
+        self.collection_name = collection_name
+        self._init_database()
+
+    @contextmanager
+    def get_db_connection(self):
+        """Context manager for database connections"""
+        conn = sqlite3.connect(str(self.db_path), timeout=10)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _init_database(self):
+        """Initialize the document and listing tables"""
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            # Pipeline workers record documents while others read
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    collection TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    sha256 TEXT NOT NULL,
+                    chunk_ids TEXT NOT NULL,
+                    filepath TEXT,
+                    ingested_at TEXT NOT NULL,
+                    PRIMARY KEY (collection, url)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS listings (
+                    collection TEXT PRIMARY KEY,
+                    listing_hash TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Manifest entry for a document URL (chunk_ids decoded), or None"""
+        with self.get_db_connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM documents WHERE collection = ? AND url = ?",
+                (self.collection_name, url)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = dict(row)
+        entry['chunk_ids'] = json.loads(entry['chunk_ids'])
+        return entry
+
+    def known_urls(self) -> set:
+        with self.get_db_connection() as conn:
+            rows = conn.execute("SELECT url FROM documents WHERE collection = ?", (self.collection_name,))
+            return {row['url'] for row in rows}
+
+    def chunk_ids(self) -> Dict[str, List[str]]:
+        """Stored chunk IDs of every recorded document, by URL"""
+        with self.get_db_connection() as conn:
+            rows = conn.execute("SELECT url, chunk_ids FROM documents WHERE collection = ?", (self.collection_name,))
+            return {row['url']: json.loads(row['chunk_ids']) for row in rows}
+
+    def record(
+        self,
+        url: str,
+        sha256: str,
+        chunk_ids: List[str],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        filepath: Optional[str] = None
+    ):
+        """Record (or replace) a fully stored document (no chunk IDs if its PDF yielded no chunks)"""
+        with self.get_db_connection() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO documents
+                    (collection, url, etag, last_modified, sha256, chunk_ids, filepath, ingested_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (self.collection_name, url, etag, last_modified, sha256, json.dumps(chunk_ids),
+                 filepath, datetime.now().isoformat())
+            )
+
+    def update_validators(self, url: str, etag: Optional[str], last_modified: Optional[str]):
+        """New validators for unchanged content (the server may have rotated its ETag)"""
+        with self.get_db_connection() as conn:
+            conn.execute(
+                "UPDATE documents SET etag = ?, last_modified = ? WHERE collection = ? AND url = ?",
+                (etag, last_modified, self.collection_name, url)
+            )
+
+    def listing_hash(self) -> Optional[str]:
+        with self.get_db_connection() as conn:
+            row = conn.execute(
+                "SELECT listing_hash FROM listings WHERE collection = ?", (self.collection_name,)
+            ).fetchone()
+        return row['listing_hash'] if row else None
+
+    def record_listing(self, value: str):
+        with self.get_db_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO listings (collection, listing_hash, updated_at) VALUES (?, ?, ?)",
+                (self.collection_name, value, datetime.now().isoformat())
+            )
@@ -0,0 +1,402 @@
+"""
+Streaming ingestion: fetch → extract → chunk → embed → upsert.
+
+Every stage has its own workers and hands documents to the next stage
+through a bounded queue, so downloads, PDF parsing, embedding and Qdrant
+writes overlap instead of running one PDF at a time, and a slow stage
+holds back the ones before it instead of piling up memory.
+
+PDF text extraction runs in worker processes (pdfplumber is CPU-bound and
+holds the GIL); large PDFs are extracted in page ranges on several workers.
+A split hook can turn one downloaded PDF into several logical documents
+(e.g. the IIFA e-book into its resolutions). Its sections are chunked,
+embedded and stored as separate items and published together. Embedding runs on the scraper's shared model in batches
+(qdrant_writer.QdrantWriter), reusing stored vectors of unchanged chunk
+texts, and upserts are sent with wait=False; only the last request of each
+document waits. Once a document's chunks are all stored, the writer publishes
+them as the document's live version.
+
+Worker counts per stage can be set in the environment:
+    INGEST_FETCH_WORKERS    (default 4)
+    INGEST_EXTRACT_WORKERS  (default: CPU count, at most 4)
+    INGEST_CHUNK_WORKERS    (default 1)
+    INGEST_EMBED_WORKERS    (default 1)
+    INGEST_UPSERT_WORKERS   (default 1)
+    INGEST_QUEUE_SIZE       (default 8 documents between two stages)
+    INGEST_PAGES_PER_TASK   (default 40 pages per extraction task)
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import pdfplumber
+
+from qdrant_writer import new_version
+
+
+STAGES = ("fetch", "extract", "chunk", "embed", "upsert")
+
+DEFAULT_WORKERS = {
+    "fetch": int(os.getenv("INGEST_FETCH_WORKERS", "4")),
+    "extract": int(os.getenv("INGEST_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    "chunk": int(os.getenv("INGEST_CHUNK_WORKERS", "1")),
+    "embed": int(os.getenv("INGEST_EMBED_WORKERS", "1")),
+    "upsert": int(os.getenv("INGEST_UPSERT_WORKERS", "1")),
+}
+DEFAULT_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "40"))
+
+# Tells a stage worker that no more items will come
+_DONE = object()
+
+
+class SkipDocument(Exception):
+    """A document with nothing (new) to ingest, e.g. no text or unchanged; not an error"""
+
+
+def extract_pages(pdf_path: str, first_page: int = 1, last_page: Optional[int] = None) -> list:
+    """Extract text content from PDF with page number tracking
+
+    Module-level so it can run in a worker process.
+
+    Args:
+        first_page: First page to extract (1-based)
+        last_page: Last page to extract (default: the last page)
+
+    Returns:
+        List of dicts with 'text' and 'page_number' keys
+    """
+    page_texts = []
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            pages = pdf.pages[first_page - 1:last_page]
+            for page_num, page in enumerate(pages, start=first_page):
+                text = page.extract_text()
+                if text and text.strip():
+                    page_texts.append({
+                        'text': text,
+                        'page_number': page_num
+                    })
+        return page_texts
+    except Exception as e:
+        print(f"Error extracting text from {pdf_path}: {e}")
+        return []
+
+
+def page_count(pdf_path: str) -> int:
+    """Number of pages in a PDF (0 if it cannot be opened)"""
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+    except Exception:
+        return 0
+
+
+class IngestPipeline:
+    """Runs ingestion jobs through the five stages concurrently
+
+    A job is a dict with 'url', 'title' and 'filename', plus 'meta' with the
+    source-specific fields that payload() turns into chunk payload.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[Dict[str, Any]], str],
+        chunk: Callable[[list], list],
+        writer,
+        payload: Optional[Callable[..., Dict[str, Any]]] = None,
+        workers: Optional[Dict[str, int]] = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        on_stored: Optional[Callable[[Dict[str, Any], List[str]], None]] = None,
+        split: Optional[Callable[[Dict[str, Any], list], Optional[List[Tuple[Dict[str, Any], list]]]]] = None
+    ):
+        """
+        Args:
+            fetch: Downloads a job's PDF and returns the local path
+            chunk: Turns extracted pages into chunk dicts
+            writer: QdrantWriter for the target collection
+            payload: Builds extra chunk payload from a job's 'meta'
+            workers: Worker count per stage (missing stages use the defaults)
+            queue_size: Documents allowed to wait between two stages
+            progress_callback: Called with a snapshot of stage progress on every change
+            on_stored: Called with a job and its chunk IDs once all of its chunks are stored,
+                or with no chunk IDs when its PDF yields no chunks (e.g. a scanned PDF)
+            split: Turns a job and its extracted pages into (section job, pages) pairs, or
+                returns None to keep the document whole. Section jobs need their own 'url'
+                and 'title'; they are stored under the job's version and published with it.
+        """
+        self.fetch = fetch
+        self.chunk = chunk
+        self.writer = writer
+        self.payload = payload or (lambda **meta: meta)
+        self.workers = {stage: max(1, (workers or {}).get(stage, DEFAULT_WORKERS[stage])) for stage in STAGES}
+        self.queue_size = max(1, queue_size)
+        self.progress_callback = progress_callback
+        self.on_stored = on_stored
+        self.split = split
+        self._lock = threading.Lock()
+        self._progress: Dict[str, Any] = {}
+        self._extract_pool: Optional[ProcessPoolExecutor] = None
+
+    def run(self, jobs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Ingest all jobs and return the final stage progress"""
+        self._progress = {
+            "total": len(jobs),
+            "chunks": 0,
+            "sections": 0,
+            **{stage: {"active": 0, "done": 0, "skipped": 0, "failed": 0} for stage in STAGES}
+        }
+        self._report()
+        if not jobs:
+            return self._progress
+
+        start = time.perf_counter()
+        try:
+            # spawn: the scraper runs inside the API's threads, where fork is unsafe
+            self._extract_pool = ProcessPoolExecutor(
+                max_workers=self.workers["extract"],
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        except (OSError, NotImplementedError) as e:
+            print(f"  ⚠ No worker processes for PDF extraction ({e}), extracting in threads")
+
+        handlers = {
+            "fetch": self._fetch,
+            "extract": self._extract,
+            "chunk": self._chunk,
+            "embed": self._embed,
+            "upsert": self._upsert,
+        }
+        inbox = queue.Queue()
+        for job in jobs:
+            inbox.put(job)
+        queues = [inbox] + [queue.Queue(maxsize=self.queue_size) for _ in STAGES[1:]] + [None]
+
+        stage_threads = []
+        for i, stage in enumerate(STAGES):
+            threads = [
+                threading.Thread(
+                    target=self._work,
+                    args=(stage, handlers[stage], queues[i], queues[i + 1]),
+                    name=f"ingest-{stage}-{n}",
+                    daemon=True
+                )
+                for n in range(self.workers[stage])
+            ]
+            for thread in threads:
+                thread.start()
+            stage_threads.append(threads)
+
+        # Close each stage once the one before it has finished
+        for _ in range(self.workers["fetch"]):
+            inbox.put(_DONE)
+        for i, threads in enumerate(stage_threads):
+            for thread in threads:
+                thread.join()
+            if i + 1 < len(STAGES):
+                for _ in range(self.workers[STAGES[i + 1]]):
+                    queues[i + 1].put(_DONE)
+
+        if self._extract_pool is not None:
+            self._extract_pool.shutdown()
+            self._extract_pool = None
+
+        elapsed = time.perf_counter() - start
+        skipped = sum(self._progress[stage]["skipped"] for stage in STAGES)
+        failed = sum(self._progress[stage]["failed"] for stage in STAGES)
+        print(f"  ✓ Ingested {self._progress['upsert']['done']}/{len(jobs)} documents "
+              f"({self._progress['chunks']} chunks, {skipped} skipped, {failed} failed) in {elapsed:.1f}s")
+        if getattr(self.writer, 'embedding_store', None) is not None:
+            print(f"  ↻ Embeddings: {self.writer.reused} reused from the store, {self.writer.encoded} encoded")
+        if getattr(self.writer, 'dedup_index', None) is not None:
+            print(f"  ↻ Near-duplicates: {self.writer.aliased} chunks linked to a canonical chunk instead of stored")
+        return self._progress
+
+    def _work(self, stage: str, handler: Callable, inbox: queue.Queue, outbox: Optional[queue.Queue]):
+        """Stage worker: handle items until told to stop"""
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            job = item[0] if isinstance(item, tuple) else item
+            self._count(stage, "active", 1)
+            try:
+                outputs = handler(item)
+                for output in outputs:
+                    if outbox is not None:
+                        outbox.put(output)
+            except SkipDocument as e:
+                self._count(stage, "skipped", 1)
+                print(f"  Warning: {e} ({job.get('title') or job.get('url')})")
+                if '_parent' in job:
+                    self._section_done(job, [])
+                elif stage != "fetch":
+                    # Fetch skips unchanged documents; later stages find nothing to store
+                    self._stored_empty(job)
+            except Exception as e:
+                self._count(stage, "failed", 1)
+                print(f"  ✗ {stage} failed for {job.get('title') or job.get('url')}: {str(e) or repr(e)}")
+                traceback.print_exc()
+                if '_parent' in job:
+                    self._section_done(job, [], failed=True)
+            finally:
+                self._count(stage, "active", -1)
+
+    # Stage handlers: each takes one queue item and returns the items for the next stage
+
+    def _fetch(self, job: Dict[str, Any]) -> Iterable:
+        filepath = self.fetch(job)
+        self._count("fetch", "done", 1)
+        return [(job, filepath)]
+
+    def _extract(self, item) -> Iterable:
+        job, filepath = item
+        page_texts = self._extract_pages(filepath)
+        if not page_texts:
+            raise SkipDocument(f"No text extracted from {filepath}")
+        sections = self.split(job, page_texts) if self.split is not None else None
+        self._count("extract", "done", 1)
+        if not sections:
+            return [(job, filepath, page_texts)]
+
+        # Sections share the document's version, so they go live together
+        job['doc_version'] = new_version()
+        job['_chunk_ids'] = []
+        job['_sections_left'] = len(sections)
+        job['_sections_failed'] = 0
+        self._count("sections", None, len(sections))
+        print(f"  Split {job.get('title') or job['url']} into {len(sections)} sections")
+        return [
+            ({**section_job, 'doc_version': job['doc_version'], '_parent': job}, filepath, section_pages)
+            for section_job, section_pages in sections
+        ]
+
+    def _extract_pages(self, filepath: str) -> list:
+        """Pages of a PDF, in page ranges across the worker processes when it is large"""
+        if self._extract_pool is None:
+            return extract_pages(filepath)
+        pages = page_count(filepath)
+        if pages <= PAGES_PER_TASK:
+            return self._extract_pool.submit(extract_pages, filepath).result()
+        futures = [
+            self._extract_pool.submit(extract_pages, filepath, first, min(first + PAGES_PER_TASK - 1, pages))
+            for first in range(1, pages + 1, PAGES_PER_TASK)
+        ]
+        return [page for future in futures for page in future.result()]
+
+    def _chunk(self, item) -> Iterable:
+        job, filepath, page_texts = item
+        chunked_data = self.chunk(page_texts)
+        if not chunked_data:
+            raise SkipDocument(f"No chunks created from {filepath}")
+        self._count("chunk", "done", 1)
+        return [(job, filepath, chunked_data)]
+
+    def _embed(self, item) -> Iterable:
+        job, filepath, chunked_data = item
+        job.setdefault('doc_version', new_version())
+        requests = self.writer.points(
+            job['url'], job['title'], chunked_data, filepath,
+            extra_payload=self.payload(**job.get('meta', {})),
+            doc_version=job['doc_version']
+        )
+        # Mark the last request of the document so the upsert stage waits for it
+        previous = None
+        embedded = 0
+        for request in requests:
+            if previous is not None:
+                yield (job, previous, False)
+            previous = request
+            embedded += len(request)
+        if previous is None:
+            raise SkipDocument("No chunks could be embedded")
+        job['_embedded'] = embedded
+        self._count("embed", "done", 1)
+        yield (job, previous, True)
+
+    def _upsert(self, item) -> Iterable:
+        job, points, last = item
+        self.writer.upsert(points, wait=last)
+        self._count("chunks", None, len(points))
+        with self._lock:
+            stored_ids = job.setdefault('_chunk_ids', [])
+            stored_ids.extend(str(point.id) for point in points)
+            complete = len(stored_ids) == job.get('_embedded')
+        if complete:
+            if '_parent' in job:
+                self._section_done(job, list(stored_ids))
+            else:
+                self._publish(job, list(stored_ids))
+        return []
+
+    def _publish(self, job: Dict[str, Any], chunk_ids: List[str]):
+        # The last request waited, so the whole version is stored: switch to it
+        self.writer.publish(job['url'], job['doc_version'])
+        self._count("upsert", "done", 1)
+        if self.on_stored is not None:
+            self.on_stored(job, chunk_ids)
+
+    def _stored_empty(self, job: Dict[str, Any]):
+        """Report a document without chunks, so an unchanged listing containing it can still be skipped"""
+        if self.on_stored is None:
+            return
+        try:
+            self.on_stored(job, [])
+        except Exception as e:
+            print(f"  ⚠ Could not record {job.get('title') or job.get('url')}: {e}")
+
+    def _section_done(self, section: Dict[str, Any], chunk_ids: List[str], failed: bool = False):
+        """Account for a stored (or skipped / failed) section; publish the document after its last one"""
+        job = section['_parent']
+        with self._lock:
+            # A section whose upsert requests fail is reported once
+            if section.get('_resolved'):
+                return
+            section['_resolved'] = True
+            job['_chunk_ids'].extend(chunk_ids)
+            job['_sections_failed'] += int(failed)
+            job['_sections_left'] -= 1
+            last = job['_sections_left'] == 0
+        if not last:
+            return
+        title = job.get('title') or job['url']
+        if job['_sections_failed']:
+            # Keep the previous version live; the staged sections are garbage-collected
+            self._count("upsert", "failed", 1)
+            print(f"  ✗ {job['_sections_failed']} sections of {title} failed, keeping its previous version")
+        elif not job['_chunk_ids']:
+            self._count("upsert", "skipped", 1)
+            print(f"  Warning: No chunks stored for any section ({title})")
+            self._stored_empty(job)
+        else:
+            try:
+                self._publish(job, list(job['_chunk_ids']))
+            except Exception as e:
+                self._count("upsert", "failed", 1)
+                print(f"  ✗ upsert failed for {title}: {str(e) or repr(e)}")
+                traceback.print_exc()
+
+    def _count(self, stage: str, field: Optional[str], amount: int):
+        with self._lock:
+            if field is None:
+                self._progress[stage] += amount
+            else:
+                self._progress[stage][field] += amount
+        self._report()
+
+    def _report(self):
+        if self.progress_callback is None:
+            return
+        with self._lock:
+            snapshot = {key: dict(value) if isinstance(value, dict) else value for key, value in self._progress.items()}
+        try:
+            self.progress_callback(snapshot)
+        except Exception as e:
+            print(f"  ⚠ Progress callback failed: {e}")
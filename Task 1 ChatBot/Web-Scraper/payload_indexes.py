@@ -0,0 +1,27 @@
+"""
+Payload indexes of the document collections (bnm_pdfs, iifa_resolutions, ...).
+
+Declared once here for the scrapers, which create the collections, and for
+the backend, which adds missing indexes to existing collections at startup
+(backend/qdrant_indexes.py).
+"""
+
+from typing import Any, Dict
+
+from qdrant_client.models import PayloadSchemaType
+
+# Payload fields the backend filters on (document listing, citations, resolution lookups)
+DOCUMENT_PAYLOAD_INDEXES: Dict[str, Any] = {
+    'pdf_url': PayloadSchemaType.KEYWORD,
+    'pdf_title': PayloadSchemaType.KEYWORD,
+    'date': PayloadSchemaType.KEYWORD,  # Free-form date strings from the source sites
+    'chunk_index': PayloadSchemaType.INTEGER,
+    'document_type': PayloadSchemaType.KEYWORD,
+    'source_type': PayloadSchemaType.KEYWORD,
+    'resolution_number': PayloadSchemaType.KEYWORD,
+    'doc_version': PayloadSchemaType.KEYWORD,
+    'doc_state': PayloadSchemaType.KEYWORD,  # Filtered on every search and by garbage collection
+    'staged_at': PayloadSchemaType.FLOAT,
+    'source_document': PayloadSchemaType.KEYWORD,  # Publishing the sections of a split PDF together
+    'duplicate_sources[].chunk_index': PayloadSchemaType.INTEGER,  # Deduplicated first chunks, for document listings
+}
@@ -0,0 +1,523 @@
+"""
+Batched writes of PDF chunks to Qdrant, shared by all scrapers.
+
+Chunks are embedded in batches (one forward pass per EMBED_BATCH_SIZE
+chunks instead of one per chunk) and upserted in bounded requests of
+UPSERT_BATCH_SIZE points. Upserts use wait=False and run on a background
+thread while the next batch is encoded; the last request of a document
+waits, and since Qdrant applies a collection's updates in order, every
+point of the document is stored when store() returns.
+
+Documents are versioned: a document's chunks are written under a new
+doc_version with doc_state "staged" (hidden from search), then publish()
+switches the document to them in one request that also marks the chunks of
+every older version "retired". collect_garbage() deletes retired chunks in
+bulk with a filter, so a re-scraped document that got shorter leaves no
+orphaned tail chunks behind.
+
+With an embedding store (embedding_store.py), chunks whose text was embedded
+before (e.g. the unchanged parts of a revised PDF) reuse their stored vector
+and only new or edited chunks are encoded. With a near-duplicate index
+(dedup.py), chunks that nearly match a live chunk of another document are
+linked to it instead of being stored.
+
+Benchmark against the old one-chunk-at-a-time path on local PDFs:
+    python qdrant_writer.py --pdf-dir pdfs/bnm --limit 20
+"""
+
+import argparse
+import hashlib
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from qdrant_client.models import (
+    FieldCondition, Filter, FilterSelector, MatchValue, PointStruct, Range,
+    SetPayload, SetPayloadOperation
+)
+
+from dedup import document_key, minhash
+from embedding_store import text_hash
+from token_counter import get_token_counter
+
+
+DEFAULT_EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+DEFAULT_UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "256"))
+
+# doc_state of a chunk: written but not yet published / replaced by a newer version.
+# Chunks without doc_state (stored before versioning) and "live" ones are searchable.
+DOC_STAGED = "staged"
+DOC_LIVE = "live"
+DOC_RETIRED = "retired"
+
+# Staged chunks this old belong to an ingestion that never published
+STALE_STAGED_SECONDS = 24 * 3600
+
+
+def new_version() -> str:
+    """A fresh document version; every write gets its own, so it never overwrites live chunks"""
+    return uuid.uuid4().hex[:16]
+
+
+class QdrantWriter:
+    """Embeds chunks in batches and upserts them in bounded, pipelined requests"""
+
+    def __init__(
+        self,
+        client,
+        collection_name: str,
+        embedding_model,
+        embed_batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+        upsert_batch_size: int = DEFAULT_UPSERT_BATCH_SIZE,
+        embedding_store=None,
+        dedup_index=None
+    ):
+        """
+        Args:
+            client: QdrantClient (server or local)
+            collection_name: Collection to write to
+            embedding_model: SentenceTransformer used for chunk vectors
+            embed_batch_size: Chunks per encode call
+            upsert_batch_size: Points per upsert request
+            embedding_store: Optional EmbeddingStore of embedding_model's vectors, keyed by chunk text
+            dedup_index: Optional DedupIndex of the collection, to link near-duplicate chunks
+        """
+        self.client = client
+        self.collection_name = collection_name
+        self.embedding_model = embedding_model
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.upsert_batch_size = max(1, upsert_batch_size)
+        self.embedding_store = embedding_store
+        self.dedup_index = dedup_index
+        # Chunks sent through the model / served from the embedding store / linked as duplicates
+        self.encoded = 0
+        self.reused = 0
+        self.aliased = 0
+
+    def store(
+        self,
+        pdf_url: str,
+        pdf_title: str,
+        text_chunks: list,
+        filepath: str,
+        page_numbers: Optional[list] = None,
+        extra_payload: Optional[Dict[str, Any]] = None,
+        doc_version: Optional[str] = None
+    ) -> int:
+        """Store one document's chunks as a new version and publish it
+
+        Args:
+            pdf_url: URL of the PDF (chunk IDs are derived from it)
+            pdf_title: Title of the PDF
+            text_chunks: List of text chunks (strings) or list of dicts with 'text' and 'page_number'
+            filepath: Path to the PDF file
+            page_numbers: Optional list of page numbers (if text_chunks is list of strings)
+            extra_payload: Source-specific fields added to every chunk (empty values are skipped)
+            doc_version: Version of the document (default: a new one)
+
+        Returns:
+            Number of chunks stored
+        """
+        doc_version = doc_version or new_version()
+        stored = 0
+        previous = None
+        with ThreadPoolExecutor(max_workers=1) as upserter:
+            in_flight = None
+            # Ship each full request while the next batch is encoded, holding one
+            # back so the final request of the document can wait
+            for request in self.points(pdf_url, pdf_title, text_chunks, filepath, page_numbers, extra_payload,
+                                       doc_version):
+                if previous is not None:
+                    if in_flight is not None:
+                        in_flight.result()
+                    in_flight = upserter.submit(self.upsert, previous, False)
+                    stored += len(previous)
+                previous = request
+            if in_flight is not None:
+                in_flight.result()
+
+        # The last request waits, so the whole document is applied on return
+        # An empty last request means every chunk was a duplicate; the version is still published
+        if previous is not None:
+            self.upsert(previous, True)
+            stored += len(previous)
+            self.publish(pdf_url, doc_version)
+        return stored
+
+    def points(
+        self,
+        pdf_url: str,
+        pdf_title: str,
+        text_chunks: list,
+        filepath: str,
+        page_numbers: Optional[list] = None,
+        extra_payload: Optional[Dict[str, Any]] = None,
+        doc_version: Optional[str] = None
+    ) -> Iterator[List[PointStruct]]:
+        """Embed a document's chunks, yielding upsert requests of at most upsert_batch_size points
+
+        Takes the same arguments as store(). The chunks are staged: they stay
+        out of search until publish() is called for their version. Near-duplicates
+        of other documents' chunks are linked instead of yielded, so the last
+        request may be empty.
+        """
+        token_counter = get_token_counter()
+        doc_version = doc_version or new_version()
+        staged_at = time.time()
+        extra = {key: value for key, value in (extra_payload or {}).items() if value}
+        # Sections of a split PDF are published together under their source document
+        document = extra.get('source_document') or pdf_url
+
+        # (chunk index, text, page number) for every non-empty chunk
+        pending = []
+        for idx, chunk_data in enumerate(text_chunks):
+            if isinstance(chunk_data, dict):
+                # New format with page numbers
+                chunk_text = chunk_data.get('text', '')
+                page_number = chunk_data.get('page_number')
+                chunk_idx = chunk_data.get('chunk_index', idx)
+            else:
+                # Old format (backward compatibility)
+                chunk_text = chunk_data
+                page_number = page_numbers[idx] if page_numbers and idx < len(page_numbers) else None
+                chunk_idx = idx
+            if chunk_text.strip():
+                pending.append((chunk_idx, chunk_text, page_number))
+
+        points: List[PointStruct] = []
+        aliased = 0
+        for start in range(0, len(pending), self.embed_batch_size):
+            batch = []
+            for chunk_idx, chunk_text, page_number in pending[start:start + self.embed_batch_size]:
+                payload = {
+                    'pdf_url': pdf_url,
+                    'pdf_title': pdf_title,
+                    'chunk_index': chunk_idx,
+                    'chunk_text': chunk_text,
+                    'token_count': token_counter.count(chunk_text),  # Lets the backend pack context by tokens
+                    'tokenizer': token_counter.name,
+                    'filepath': filepath,
+                    'total_chunks': len(text_chunks),
+                    'doc_version': doc_version,
+                    'doc_state': DOC_STAGED,
+                    'staged_at': staged_at
+                }
+                if page_number is not None:
+                    payload['page_number'] = page_number
+                payload.update(extra)
+                batch.append((hashlib.md5(f"{pdf_url}_{doc_version}_{chunk_idx}".encode()).hexdigest(), payload))
+
+            if self.dedup_index is not None:
+                batch, linked = self._link_duplicates(document, batch)
+                aliased += linked
+            else:
+                batch = [(point_id, payload, None) for point_id, payload in batch]
+
+            vectors = self._vectors([payload['chunk_text'] for _, payload, _ in batch]) if batch else []
+            stored = []
+            for (point_id, payload, signature), vector in zip(batch, vectors):
+                if vector is None:
+                    continue
+                points.append(PointStruct(id=point_id, vector=vector, payload=payload))
+                stored.append((point_id, document, doc_version, signature))
+            if self.dedup_index is not None:
+                self.dedup_index.add_chunks(stored)
+
+            while len(points) >= self.upsert_batch_size:
+                yield points[:self.upsert_batch_size]
+                points = points[self.upsert_batch_size:]
+        if points or aliased:
+            yield points
+
+    def _link_duplicates(self, document: str, batch: List[tuple]) -> tuple:
+        """Link chunks that nearly match another document's live chunk
+
+        A document's first chunk is always stored, so the backend's document
+        listing (which scrolls chunk_index 0) still finds the document.
+
+        Returns:
+            Tuple of (remaining (point ID, payload, signature) to store, number linked)
+        """
+        signatures = [minhash(payload['chunk_text']) for _, payload in batch]
+        try:
+            matches = self._find_canonicals(signatures, exclude_document=document)
+        except Exception as e:
+            print(f"  ⚠ Near-duplicate lookup failed ({e}), storing the batch")
+            matches = [None] * len(batch)
+
+        remaining, aliases = [], []
+        for (point_id, payload), signature, match in zip(batch, signatures, matches):
+            if match is None or payload['chunk_index'] == 0:
+                remaining.append((point_id, payload, signature))
+            else:
+                aliases.append({'alias_id': point_id, 'canonical_id': match[0], 'similarity': match[1],
+                                'signature': signature, 'payload': payload})
+        if aliases:
+            self.dedup_index.add_aliases(aliases)
+            self.aliased += len(aliases)
+        return remaining, len(aliases)
+
+    def _find_canonicals(self, signatures: List, exclude_document: str) -> List[Optional[tuple]]:
+        """find_canonicals() limited to chunks that are still points of this collection
+
+        The index is a sidecar file: if the collection was recreated or the
+        scraper now writes to another Qdrant, its chunks are gone and must not
+        be linked to. Such rows are dropped and the lookup repeated.
+        """
+        while True:
+            matches = self.dedup_index.find_canonicals(signatures, exclude_document=exclude_document)
+            candidates = {match[0] for match in matches if match is not None}
+            if not candidates:
+                return matches
+            stored = {
+                uuid.UUID(str(point.id)).hex
+                for point in self.client.retrieve(self.collection_name, ids=list(candidates), with_payload=False)
+            }
+            missing = {point_id for point_id in candidates if uuid.UUID(point_id).hex not in stored}
+            if not missing:
+                return matches
+            print(f"  ⚠ {len(missing)} indexed chunks are not in {self.collection_name}, "
+                  f"dropping them from the near-duplicate index")
+            self.dedup_index.forget(missing)
+
+    def _vectors(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Vectors for a batch, encoding only the texts the embedding store does not have"""
+        if self.embedding_store is None:
+            self.encoded += len(texts)
+            return self._encode(texts)
+
+        keys = [text_hash(text) for text in texts]
+        try:
+            stored = self.embedding_store.get_many(keys)
+        except Exception as e:
+            print(f"  ⚠ Embedding store lookup failed ({e}), encoding the batch")
+            stored = {}
+        # Identical texts within the batch are encoded once
+        missing = list(dict.fromkeys(key for key in keys if key not in stored))
+        if missing:
+            text_by_key = dict(zip(keys, texts))
+            encoded = self._encode([text_by_key[key] for key in missing])
+            new = [(key, vector) for key, vector in zip(missing, encoded) if vector is not None]
+            try:
+                self.embedding_store.put_many(new)
+            except Exception as e:
+                print(f"  ⚠ Could not save {len(new)} embeddings: {e}")
+            stored.update(new)
+        self.encoded += len(missing)
+        self.reused += len(texts) - len(missing)
+        return [stored.get(key) for key in keys]
+
+    def _encode(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Vectors for a batch; one bad chunk only drops itself"""
+        try:
+            return self.embedding_model.encode(texts, batch_size=self.embed_batch_size).tolist()
+        except Exception as e:
+            print(f"  Error encoding batch of {len(texts)} chunks: {e}. Encoding one by one")
+        vectors = []
+        for text in texts:
+            try:
+                vectors.append(self.embedding_model.encode(text).tolist())
+            except Exception as e:
+                print(f"  Error encoding chunk: {e}")
+                vectors.append(None)
+        return vectors
+
+    def upsert(self, points: List[PointStruct], wait: bool = False):
+        """One upsert request (wait=False returns once Qdrant has accepted it)"""
+        if points:
+            self.client.upsert(collection_name=self.collection_name, points=points, wait=wait)
+
+    def publish(self, pdf_url: str, doc_version: str):
+        """Make a stored version the document's live one and retire every other version
+
+        Both payload updates go in one request, applied in order, so searches
+        see the old version until the new one is live. Call only after the
+        version's last upsert has completed (wait=True). For a split PDF this
+        publishes all of its sections (chunks whose source_document is pdf_url)
+        and retires the PDF's earlier sections or unsplit chunks.
+        """
+        document = Filter(should=[
+            FieldCondition(key='pdf_url', match=MatchValue(value=pdf_url)),
+            FieldCondition(key='source_document', match=MatchValue(value=pdf_url)),
+        ])
+        version = FieldCondition(key='doc_version', match=MatchValue(value=doc_version))
+        self.client.batch_update_points(
+            collection_name=self.collection_name,
+            update_operations=[
+                # Also catches chunks stored before versioning (no doc_version)
+                SetPayloadOperation(set_payload=SetPayload(
+                    payload={'doc_state': DOC_RETIRED},
+                    filter=Filter(must=[document], must_not=[version])
+                )),
+                SetPayloadOperation(set_payload=SetPayload(
+                    payload={'doc_state': DOC_LIVE},
+                    filter=Filter(must=[document, version])
+                )),
+            ],
+            wait=True
+        )
+        if self.dedup_index is not None:
+            self._publish_duplicates(pdf_url, doc_version)
+
+    def _publish_duplicates(self, pdf_url: str, doc_version: str):
+        """Bring the near-duplicate index in line with a published version
+
+        Aliases whose canonical chunk belonged to a replaced version are linked
+        to another live chunk or stored as points again, and canonical chunks
+        get the list of documents they stand in for.
+        """
+        orphans, touched = self.dedup_index.publish(pdf_url, doc_version)
+
+        by_document: Dict[str, List[Dict[str, Any]]] = {}
+        for orphan in orphans:
+            by_document.setdefault(document_key(orphan['payload']), []).append(orphan)
+        for document, document_orphans in by_document.items():
+            matches = self._find_canonicals([o['signature'] for o in document_orphans], exclude_document=document)
+            unmatched = []
+            for orphan, match in zip(document_orphans, matches):
+                if match is None or orphan['payload']['chunk_index'] == 0:
+                    unmatched.append(orphan)
+                    continue
+                self.dedup_index.add_aliases([{**orphan, 'canonical_id': match[0], 'similarity': match[1]}],
+                                             live=orphan['live'])
+                touched.add(match[0])
+            if unmatched:
+                self._restore_aliases(unmatched)
+
+        if touched:
+            sources = self.dedup_index.duplicate_sources(touched)
+            operations = [
+                SetPayloadOperation(set_payload=SetPayload(payload={'duplicate_sources': documents}, points=[point_id]))
+                for point_id, documents in sources.items()
+            ]
+            for start in range(0, len(operations), self.upsert_batch_size):
+                self.client.batch_update_points(
+                    collection_name=self.collection_name,
+                    update_operations=operations[start:start + self.upsert_batch_size],
+                    wait=False
+                )
+
+    def _restore_aliases(self, aliases: List[Dict[str, Any]]):
+        """Store unlinked aliases as points of their own documents (live or staged, as their document is)"""
+        vectors = self._vectors([alias['payload']['chunk_text'] for alias in aliases])
+        points = []
+        restored = {True: [], False: []}
+        for alias, vector in zip(aliases, vectors):
+            if vector is None:
+                continue
+            payload = {**alias['payload'], 'doc_state': DOC_LIVE if alias['live'] else DOC_STAGED}
+            points.append(PointStruct(id=alias['alias_id'], vector=vector, payload=payload))
+            restored[alias['live']].append(
+                (alias['alias_id'], document_key(payload), payload['doc_version'], alias['signature'])
+            )
+        for start in range(0, len(points), self.upsert_batch_size):
+            self.upsert(points[start:start + self.upsert_batch_size], wait=True)
+        for live, chunks in restored.items():
+            self.dedup_index.add_chunks(chunks, live=live)
+        print(f"  ↻ Restored {len(points)} duplicate chunks whose canonical chunk was replaced")
+
+    def collect_garbage(self):
+        """Delete retired chunks, and staged ones whose ingestion never published, with one filter each"""
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=Filter(
+                must=[FieldCondition(key='doc_state', match=MatchValue(value=DOC_RETIRED))]
+            )),
+            wait=True
+        )
+        self.client.delete(
+            collection_name=self.collection_name,
+            points_selector=FilterSelector(filter=Filter(must=[
+                FieldCondition(key='doc_state', match=MatchValue(value=DOC_STAGED)),
+                FieldCondition(key='staged_at', range=Range(lt=time.time() - STALE_STAGED_SECONDS)),
+            ])),
+            wait=True
+        )
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def _load_corpus(pdf_dir: str, limit: int, chunk_size: int = 500, overlap: int = 50) -> List[tuple]:
+    """(pdf path, word-window chunks) for up to limit local PDFs"""
+    import pdfplumber
+
+    corpus = []
+    for pdf_path in sorted(Path(pdf_dir).rglob("*.pdf"))[:limit]:
+        try:
+            with pdfplumber.open(pdf_path) as pdf:
+                words = ' '.join(page.extract_text() or '' for page in pdf.pages).split()
+        except Exception as e:
+            print(f"  Skipping {pdf_path}: {e}")
+            continue
+        chunks = [' '.join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size - overlap)]
+        corpus.append((str(pdf_path), [chunk for chunk in chunks if chunk.strip()]))
+    return corpus
+
+
+def _store_one_by_one(client, collection_name: str, embedding_model, pdf_path: str, chunks: List[str]) -> int:
+    """The previous path: one encode per chunk, one unbounded upsert per document"""
+    token_counter = get_token_counter()
+    points = []
+    for idx, chunk_text in enumerate(chunks):
+        points.append(PointStruct(
+            id=hashlib.md5(f"{pdf_path}_{idx}".encode()).hexdigest(),
+            vector=embedding_model.encode(chunk_text).tolist(),
+            payload={'pdf_url': pdf_path, 'chunk_index': idx, 'chunk_text': chunk_text,
+                     'token_count': token_counter.count(chunk_text), 'tokenizer': token_counter.name}
+        ))
+    if points:
+        client.upsert(collection_name=collection_name, points=points)
+    return len(points)
+
+
+def main():
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, VectorParams
+    from sentence_transformers import SentenceTransformer
+
+    parser = argparse.ArgumentParser(description="Chunks/second: per-chunk vs batched ingestion")
+    parser.add_argument("--pdf-dir", default="pdfs")
+    parser.add_argument("--limit", type=int, default=20, help="Number of PDFs to ingest")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL"), help="Qdrant server (default: in-memory)")
+    parser.add_argument("--embed-batch-size", type=int, default=DEFAULT_EMBED_BATCH_SIZE)
+    parser.add_argument("--upsert-batch-size", type=int, default=DEFAULT_UPSERT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    corpus = _load_corpus(args.pdf_dir, args.limit)
+    total_chunks = sum(len(chunks) for _, chunks in corpus)
+    if not total_chunks:
+        print(f"No PDF text found under {args.pdf_dir}")
+        return
+    print(f"Corpus: {len(corpus)} PDFs, {total_chunks} chunks")
+
+    embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+    embedding_model.encode("warm-up")
+    client = QdrantClient(url=args.qdrant_url) if args.qdrant_url else QdrantClient(":memory:")
+
+    for label in ("one chunk at a time", "batched writer"):
+        collection_name = f"ingest_benchmark_{'batched' if label == 'batched writer' else 'single'}"
+        if client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+        client.create_collection(collection_name, vectors_config=VectorParams(size=384, distance=Distance.COSINE))
+        writer = QdrantWriter(client, collection_name, embedding_model,
+                              embed_batch_size=args.embed_batch_size, upsert_batch_size=args.upsert_batch_size)
+
+        start = time.perf_counter()
+        stored = 0
+        for pdf_path, chunks in corpus:
+            if label == "batched writer":
+                stored += writer.store(pdf_path, Path(pdf_path).stem, chunks, pdf_path)
+            else:
+                stored += _store_one_by_one(client, collection_name, embedding_model, pdf_path, chunks)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<25} {stored} chunks in {elapsed:7.2f}s = {stored / elapsed:8.1f} chunks/s")
+        client.delete_collection(collection_name)
+
+
+if __name__ == "__main__":
+    main()
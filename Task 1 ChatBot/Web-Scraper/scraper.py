@@ -17,10 +17,19 @@ from pathlib import Path
 import pdfplumber
 from sentence_transformers import SentenceTransformer
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from tqdm import tqdm
-import hashlib
+from qdrant_client.models import Distance, VectorParams
 import time
+import uuid
+
+from qdrant_writer import QdrantWriter
+from embedding_store import get_embedding_store
+from dedup import get_dedup_index
+from ebook_splitter import split_resolutions
+from chunking import DEFAULT_CHUNKING, chunk_document, chunk_pages
+from ingest_pipeline import IngestPipeline, SkipDocument, extract_pages
+from downloader import NotModified, get_downloader
+from ingest_manifest import IngestManifest, conditional_headers, file_sha256, listing_hash
+from payload_indexes import DOCUMENT_PAYLOAD_INDEXES
 
 # Optional Selenium for JavaScript rendering
 try:
@@ -38,6 +47,15 @@ except ImportError:
 
 
 class BNMScraper:
+    # Called with per-stage ingestion progress (e.g. by the API's scraper status)
+    progress_callback = None
+    # Re-ingest everything, ignoring the ingestion manifest
+    force_rescrape = False
+    # Sentence-transformers model for chunk vectors (also keys the embedding store)
+    embedding_model_name = 'all-MiniLM-L6-v2'
+    # Chunking strategy and window (see chunking.py; the API sets it per source)
+    chunking = DEFAULT_CHUNKING
+    
     def __init__(self, base_url: str, output_dir: str = "pdfs", qdrant_path: str = None, qdrant_url: str = None):
         self.base_url = base_url
         self.output_dir = Path(output_dir)
@@ -62,7 +80,7 @@ class BNMScraper:
         # Initialize sentence transformer for embeddings
         print("Loading embedding model...")
         try:
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.embedding_model = SentenceTransformer(self.embedding_model_name)
         except Exception as e:
             print(f"Error loading embedding model: {e}")
             print("This might be due to protobuf version conflict.")
@@ -92,10 +110,32 @@ class BNMScraper:
                 )
             else:
                 print(f"Collection {self.collection_name} already exists")
+            self._ensure_payload_indexes()
         except Exception as e:
             print(f"Error setting up collection: {e}")
             raise
     
+    def _ensure_payload_indexes(self):
+        """Create payload indexes missing from the collection (migrates existing ones)"""
+        try:
+            existing = self.qdrant_client.get_collection(self.collection_name).payload_schema or {}
+        except Exception as e:
+            print(f"Could not read payload schema for {self.collection_name}: {e}")
+            existing = {}
+        
+        for field_name, field_schema in DOCUMENT_PAYLOAD_INDEXES.items():
+            if field_name in existing:
+                continue
+            try:
+                self.qdrant_client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema
+                )
+                print(f"Created payload index {self.collection_name}.{field_name}")
+            except Exception as e:
+                print(f"Could not create payload index {self.collection_name}.{field_name}: {e}")
+    
     def get_page_content(self, url: str, use_selenium: bool = False) -> BeautifulSoup:
         """Fetch and parse HTML content from URL"""
         if use_selenium and SELENIUM_AVAILABLE:
@@ -414,55 +454,54 @@ class BNMScraper:
             if driver:
                 driver.quit()
     
-    def download_pdf(self, url: str, filename: str) -> str:
-        """Download PDF file"""
+    def download_pdf(self, url: str, filename: str, headers: dict = None) -> str:
+        """Download PDF file (pooled, rate-limited; see downloader.py)
+        
+        Args:
+            headers: Optional extra request headers (e.g. conditional validators)
+        
+        Raises:
+            NotModified: A conditional request came back 304
+        """
+        landing_url = self.base_url
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'application/pdf,application/octet-stream,*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'identity',  # Don't compress, we want raw bytes
-                'Referer': 'https://www.bnm.gov.my/banking-islamic-banking',
-                'Connection': 'keep-alive'
-            }
-            
-            session = requests.Session()
+            downloader = get_downloader()
             
             # Use Selenium cookies if available
             if self.selenium_cookies:
-                for cookie in self.selenium_cookies:
-                    session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''))
+                downloader.set_cookies(self.selenium_cookies, url)
             else:
-                # Fallback: visit main page to get cookies
-                session.get('https://www.bnm.gov.my/banking-islamic-banking', headers=headers, timeout=30)
+                # Fallback: visit the listing page once per run to get cookies
+                downloader.prime(landing_url)
             
-            # Now download the PDF
-            response = session.get(url, headers=headers, timeout=60, stream=True, allow_redirects=True)
+            # Now download the PDF (streamed to disk)
+            filepath = self.output_dir / filename
+            response = downloader.download(url, str(filepath), referer=landing_url, headers=headers)
             
             # Debug: Check response status and headers
             print(f"  Response status: {response.status_code}")
-            print(f"  Content-Type: {response.headers.get('Content-Type', 'unknown')}")
-            print(f"  Content-Length: {response.headers.get('Content-Length', 'unknown')}")
-            
-            response.raise_for_status()
+            print(f"  Content-Type: {response.content_type or 'unknown'}")
+            print(f"  Content-Length: {response.size}")
             
             # Check response
-            if len(response.content) == 0:
+            if response.size == 0:
                 print(f"  Response content length: 0")
-                print(f"  Response URL (after redirects): {response.url}")
+                print(f"  Response URL (after redirects): {response.final_url}")
                 raise ValueError("Downloaded file is empty")
             
             # Check if response is actually a PDF
-            content_type = response.headers.get('Content-Type', '').lower()
-            first_bytes = response.content[:4] if len(response.content) >= 4 else b''
+            content_type = response.content_type
+            first_bytes = response.first_bytes
             
             if first_bytes != b'%PDF':
                 # Might be HTML error page or redirect
                 if 'text/html' in content_type or first_bytes == b'<!DO' or first_bytes == b'<htm':
-                    error_text = response.text[:500] if hasattr(response, 'text') else str(response.content[:500])
+                    with open(filepath, 'rb') as f:
+                        error_text = f.read(500).decode('utf-8', errors='replace')
+                    filepath.unlink()
                     print(f"  ⚠ Warning: Server returned HTML instead of PDF")
                     print(f"  URL: {url}")
-                    print(f"  Final URL (after redirects): {response.url}")
+                    print(f"  Final URL (after redirects): {response.final_url}")
                     print(f"  Content-Type: {content_type}")
                     print(f"  Response preview: {error_text[:200]}...")
                     # Check if this is a page URL that should be skipped
@@ -471,11 +510,6 @@ class BNMScraper:
                         raise ValueError(f"URL appears to be a page, not a direct PDF link: {url}")
                     raise ValueError("Server returned HTML instead of PDF - URL might be incorrect or require authentication")
             
-            filepath = self.output_dir / filename
-            with open(filepath, 'wb') as f:
-                # Write content directly (already downloaded)
-                f.write(response.content)
-            
             # Verify file was written
             if filepath.stat().st_size == 0:
                 raise ValueError("File was not written correctly")
@@ -488,6 +522,8 @@ class BNMScraper:
                     # Don't raise, just warn - some PDFs might have different headers
             
             return str(filepath)
+        except NotModified:
+            raise
         except Exception as e:
             # If regular download fails, try Selenium as fallback
             if "empty" in str(e).lower() or "HTML" in str(e):
@@ -524,20 +560,7 @@ class BNMScraper:
         Returns:
             List of dicts with 'text' and 'page_number' keys
         """
-        page_texts = []
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page_num, page in enumerate(pdf.pages, start=1):
-                    text = page.extract_text()
-                    if text and text.strip():
-                        page_texts.append({
-                            'text': text,
-                            'page_number': page_num
-                        })
-            return page_texts
-        except Exception as e:
-            print(f"Error extracting text from {pdf_path}: {e}")
-            return []
+        return extract_pages(pdf_path)
     
     def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> list:
         """Split text into chunks for better embedding"""
@@ -556,7 +579,8 @@ class BNMScraper:
         
         This function ensures each chunk is assigned the correct page number.
         For chunks that span multiple pages, it assigns the page number where
-        the majority of the chunk content is located.
+        the majority of the chunk content is located. Words are tracked with
+        offset arrays rather than per-word objects (see chunking.py).
         
         Args:
             page_texts: List of dicts with 'text' and 'page_number' keys
@@ -566,70 +590,15 @@ class BNMScraper:
         Returns:
             List of dicts with 'text', 'page_number', and 'chunk_index' keys
         """
-        chunks = []
-        chunk_index = 0
-        
-        # Combine all pages into a single list with word-level page tracking
-        all_words_with_pages = []
-        for page_data in page_texts:
-            text = page_data['text']
-            page_number = page_data['page_number']
-            words = text.split()
-            
-            # Tag each word with its page number
-            for word in words:
-                all_words_with_pages.append({
-                    'word': word,
-                    'page_number': page_number
-                })
-        
-        if not all_words_with_pages:
-            return chunks
-        
-        # Create chunks with accurate page number assignment
-        step_size = chunk_size - overlap
-        for i in range(0, len(all_words_with_pages), step_size):
-            # Get words for this chunk
-            chunk_words_data = all_words_with_pages[i:i + chunk_size]
-            
-            if not chunk_words_data:
-                continue
-            
-            # Extract words
-            chunk_words = [w['word'] for w in chunk_words_data]
-            chunk_text = ' '.join(chunk_words)
-            
-            if not chunk_text.strip():
-                continue
-            
-            # Determine page number for this chunk
-            # Count words per page in this chunk
-            page_counts = {}
-            for word_data in chunk_words_data:
-                page_num = word_data['page_number']
-                page_counts[page_num] = page_counts.get(page_num, 0) + 1
-            
-            # Assign page number based on where majority of words are
-            # If tied, use the starting page
-            if page_counts:
-                # Find page with most words
-                max_count = max(page_counts.values())
-                pages_with_max = [p for p, count in page_counts.items() if count == max_count]
-                
-                # If multiple pages have same count, prefer the starting page
-                chunk_page_number = pages_with_max[0] if len(pages_with_max) == 1 else chunk_words_data[0]['page_number']
-            else:
-                # Fallback to first word's page
-                chunk_page_number = chunk_words_data[0]['page_number']
-            
-            chunks.append({
-                'text': chunk_text,
-                'page_number': chunk_page_number,
-                'chunk_index': chunk_index
-            })
-            chunk_index += 1
+        return chunk_pages(page_texts, chunk_size, overlap)
+    
+    def chunk_document(self, page_texts: list) -> list:
+        """Split extracted pages into chunks with this source's chunking settings
         
-        return chunks
+        Returns:
+            List of dicts with 'text', 'page_number', and 'chunk_index' keys
+        """
+        return chunk_document(page_texts, **self.chunking)
     
     def store_in_qdrant(self, pdf_url: str, pdf_title: str, text_chunks: list, filepath: str, 
                        date: str = "", doc_type: str = "", page_numbers: list = None):
@@ -644,64 +613,127 @@ class BNMScraper:
             doc_type: Optional document type
             page_numbers: Optional list of page numbers (if text_chunks is list of strings)
         """
-        points = []
-        
-        # Handle both old format (list of strings) and new format (list of dicts)
-        for idx, chunk_data in enumerate(text_chunks):
-            if isinstance(chunk_data, dict):
-                # New format with page numbers
-                chunk_text = chunk_data.get('text', '')
-                page_number = chunk_data.get('page_number')
-                chunk_idx = chunk_data.get('chunk_index', idx)
-            else:
-                # Old format (backward compatibility)
-                chunk_text = chunk_data
-                page_number = page_numbers[idx] if page_numbers and idx < len(page_numbers) else None
-                chunk_idx = idx
-            
-            if not chunk_text.strip():
-                continue
-            
-            # Generate embedding
-            embedding = self.embedding_model.encode(chunk_text).tolist()
-            
-            # Create unique ID
-            chunk_id = hashlib.md5(f"{pdf_url}_{chunk_idx}".encode()).hexdigest()
-            
-            # Create point with metadata
-            payload = {
-                'pdf_url': pdf_url,
-                'pdf_title': pdf_title,
-                'chunk_index': chunk_idx,
-                'chunk_text': chunk_text,
-                'filepath': filepath,
-                'total_chunks': len(text_chunks)
-            }
-            
-            # Add page number if available
-            if page_number is not None:
-                payload['page_number'] = page_number
-            
-            # Add optional metadata if available
-            if date:
-                payload['date'] = date
-            if doc_type:
-                payload['document_type'] = doc_type
-            
-            point = PointStruct(
-                id=chunk_id,
-                vector=embedding,
-                payload=payload
-            )
-            points.append(point)
+        stored = self._writer().store(
+            pdf_url, pdf_title, text_chunks, filepath,
+            page_numbers=page_numbers,
+            extra_payload=self._extra_payload(date=date, doc_type=doc_type)
+        )
+        if stored:
+            print(f"  Stored {stored} chunks in Qdrant")
+    
+    def _extra_payload(self, date: str = "", doc_type: str = "") -> dict:
+        """Source-specific chunk payload (empty values are left out)"""
+        return {'date': date, 'document_type': doc_type}
+    
+    def _writer(self) -> QdrantWriter:
+        """Batched writer for this scraper's collection, reusing stored chunk vectors and linking near-duplicates"""
+        return QdrantWriter(
+            self.qdrant_client, self.collection_name, self.embedding_model,
+            embedding_store=get_embedding_store(self.embedding_model_name),
+            dedup_index=get_dedup_index(self.collection_name)
+        )
+    
+    def _split_job(self, job: dict, page_texts: list):
+        """Logical documents within a downloaded PDF as (job, pages) pairs; None keeps it whole"""
+        return None
+    
+    def _fetch_job(self, job: dict, headers: dict = None) -> str:
+        """Download an ingestion job's PDF"""
+        filepath = self.download_pdf(job['url'], job['filename'], headers=headers)
+        print(f"  Downloaded: {job['filename']}")
+        return filepath
+    
+    def _unstored_documents(self, manifest: IngestManifest) -> set:
+        """URLs in the manifest whose chunks are not all in the collection (e.g. it was recreated)"""
+        chunk_ids = manifest.chunk_ids()
+        owners = {point_id: url for url, ids in chunk_ids.items() for point_id in ids}
+        ids = list(owners)
+        stored = set()
+        for start in range(0, len(ids), 1000):
+            points = self.qdrant_client.retrieve(self.collection_name, ids=ids[start:start + 1000], with_payload=False)
+            stored.update(uuid.UUID(str(point.id)).hex for point in points)
+        return {url for point_id, url in owners.items() if uuid.UUID(point_id).hex not in stored}
+    
+    def _fetch_changed(self, manifest: IngestManifest, job: dict, unstored: set = frozenset()) -> str:
+        """Fetch stage with the manifest: skip PDFs that did not change since they were ingested"""
+        entry = None if self.force_rescrape or job['url'] in unstored else manifest.get(job['url'])
+        try:
+            filepath = self._fetch_job(job, headers=conditional_headers(entry))
+        except NotModified:
+            raise SkipDocument("Unchanged since last run (304 Not Modified)")
+        
+        download = get_downloader().last_result()
+        if download is not None and download.path == str(filepath):
+            job['etag'], job['last_modified'] = download.etag, download.last_modified
+        job['sha256'] = file_sha256(filepath)
+        job['filepath'] = str(filepath)
+        if entry and entry['sha256'] == job['sha256']:
+            manifest.update_validators(job['url'], job.get('etag'), job.get('last_modified'))
+            raise SkipDocument("Unchanged since last run (same SHA-256)")
+        return filepath
+    
+    def _record_stored(self, manifest: IngestManifest, job: dict, chunk_ids: list):
+        """Remember a stored (and published) document"""
+        manifest.record(
+            job['url'], job['sha256'], chunk_ids,
+            etag=job.get('etag'), last_modified=job.get('last_modified'), filepath=job.get('filepath')
+        )
+    
+    def ingest(self, jobs: list, workers: dict = None) -> dict:
+        """Download, extract, chunk, embed and store PDFs through the staged pipeline
         
-        # Insert points into Qdrant
-        if points:
-            self.qdrant_client.upsert(
-                collection_name=self.collection_name,
-                points=points
-            )
-            print(f"  Stored {len(points)} chunks in Qdrant")
+        Unchanged listings and documents are skipped using the ingestion
+        manifest in the output directory, unless force_rescrape is set.
+        
+        Args:
+            jobs: Dicts with 'url', 'title', 'filename' and 'meta' (keyword
+                arguments for _extra_payload)
+            workers: Optional worker count per stage (see ingest_pipeline)
+        
+        Returns:
+            Final per-stage progress
+        """
+        # Start every run with fresh cookies (the downloader outlives runs in the backend)
+        get_downloader().reset_cookies(self.base_url)
+        
+        manifest = IngestManifest(self.output_dir / "ingest_manifest.db", self.collection_name)
+        links_hash = listing_hash(jobs)
+        # The manifest only counts for documents whose chunks are still in the collection
+        unstored = set() if self.force_rescrape else self._unstored_documents(manifest)
+        if unstored:
+            print(f"  ⚠ {len(unstored)} documents in the manifest are missing from {self.collection_name}, re-ingesting them")
+        if not self.force_rescrape and jobs and manifest.listing_hash() == links_hash \
+                and {job['url'] for job in jobs} <= manifest.known_urls() - unstored:
+            print(f"  ✓ Listing unchanged since last run ({len(jobs)} documents already ingested), nothing to do")
+            return {"total": len(jobs), "unchanged": True}
+        
+        writer = self._writer()
+        pipeline = IngestPipeline(
+            fetch=lambda job: self._fetch_changed(manifest, job, unstored),
+            chunk=self.chunk_document,
+            writer=writer,
+            payload=self._extra_payload,
+            workers=workers,
+            progress_callback=self.progress_callback,
+            on_stored=lambda job, chunk_ids: self._record_stored(manifest, job, chunk_ids),
+            split=self._split_job
+        )
+        progress = pipeline.run(jobs)
+        
+        # Replaced versions were retired when their documents were published
+        try:
+            writer.collect_garbage()
+        except Exception as e:
+            print(f"  ⚠ Could not delete retired chunks: {e}")
+        if writer.dedup_index is not None:
+            stats = writer.dedup_index.stats()
+            print(f"  📊 {self.collection_name}: {stats['stored']} chunks stored, {stats['aliased']} linked as "
+                  f"near-duplicates ({stats['reduction']:.1%} smaller index)")
+        
+        # Only a run that handled every document may short-circuit the next one
+        if not any(progress[stage]["failed"] for stage in ("fetch", "extract", "chunk", "embed", "upsert")):
+            manifest.record_listing(links_hash)
+        return progress
     
     def sanitize_filename(self, url: str, title: str) -> str:
         """Create a safe filename from URL and title"""
@@ -801,58 +833,41 @@ class BNMScraper:
             print("="*60 + "\n")
             return
         
-        # Process each PDF
-        for idx, pdf_info in enumerate(tqdm(pdf_links, desc="Processing PDFs"), 1):
+        # Queue every PDF for the ingestion pipeline
+        jobs = []
+        for idx, pdf_info in enumerate(pdf_links, 1):
             pdf_url = pdf_info['url']
             pdf_title = pdf_info['text']
             date = pdf_info.get('date', '')
             doc_type = pdf_info.get('type', '')
             
-            print(f"\n[{idx}/{len(pdf_links)}] Processing: {pdf_title}")
+            print(f"\n[{idx}/{len(pdf_links)}] Queued: {pdf_title}")
             if date:
                 print(f"  Date: {date}")
             if doc_type:
                 print(f"  Type: {doc_type}")
             print(f"  URL: {pdf_url}")
             
-            try:
-                # Validate URL before attempting download
-                url_lower = pdf_url.lower()
-                # Skip if URL looks like a page, not a direct PDF
-                if not url_lower.endswith('.pdf') and not '.pdf?' in url_lower:
-                    # Check if it's a known page pattern
-                    page_patterns = ['/download-forms', '/download', '/forms']
-                    if any(pattern in url_lower for pattern in page_patterns):
-                        print(f"  ⚠ Skipping: URL appears to be a page, not a direct PDF link")
-                        print(f"     URL: {pdf_url}")
-                        print(f"     This is likely a page containing PDF links, not a PDF itself")
-                        continue
-                
-                # Download PDF
-                filename = self.sanitize_filename(pdf_url, pdf_title)
-                filepath = self.download_pdf(pdf_url, filename)
-                print(f"  Downloaded: {filename}")
-                
-                # Extract text with page numbers
-                page_texts = self.extract_text_with_pages(filepath)
-                if not page_texts:
-                    print(f"  Warning: No text extracted from {filename}")
-                    continue
-                
-                # Chunk text with page tracking
-                chunked_data = self.chunk_text_with_pages(page_texts)
-                if not chunked_data:
-                    print(f"  Warning: No chunks created from {filename}")
+            # Validate URL before attempting download
+            url_lower = pdf_url.lower()
+            # Skip if URL looks like a page, not a direct PDF
+            if not url_lower.endswith('.pdf') and not '.pdf?' in url_lower:
+                # Check if it's a known page pattern
+                page_patterns = ['/download-forms', '/download', '/forms']
+                if any(pattern in url_lower for pattern in page_patterns):
+                    print(f"  ⚠ Skipping: URL appears to be a page, not a direct PDF link")
+                    print(f"     URL: {pdf_url}")
+                    print(f"     This is likely a page containing PDF links, not a PDF itself")
                     continue
-                
-                print(f"  Extracted {len(chunked_data)} text chunks with page numbers")
-                
-                # Store in Qdrant with metadata
-                self.store_in_qdrant(pdf_url, pdf_title, chunked_data, filepath, date, doc_type)
-                
-            except Exception as e:
-                print(f"  Error processing {pdf_url}: {e}")
-                continue
+            
+            jobs.append({
+                'url': pdf_url,
+                'title': pdf_title,
+                'filename': self.sanitize_filename(pdf_url, pdf_title),
+                'meta': {'date': date, 'doc_type': doc_type}
+            })
+        
+        self.ingest(jobs)
         
         print(f"\n[SUCCESS] Scraping complete! PDFs stored in: {self.output_dir}")
         if self.qdrant_path:
@@ -889,7 +904,7 @@ class IIFAScraper(BNMScraper):
         # Initialize sentence transformer for embeddings
         print("Loading embedding model...")
         try:
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.embedding_model = SentenceTransformer(self.embedding_model_name)
         except Exception as e:
             print(f"Error loading embedding model: {e}")
             print("This might be due to protobuf version conflict.")
@@ -919,6 +934,7 @@ class IIFAScraper(BNMScraper):
                 )
             else:
                 print(f"Collection {self.collection_name} already exists")
+            self._ensure_payload_indexes()
         except Exception as e:
             print(f"Error setting up collection: {e}")
             raise
@@ -1126,36 +1142,31 @@ class IIFAScraper(BNMScraper):
         
         return unique_links
     
-    def download_pdf(self, url: str, filename: str) -> str:
-        """Download PDF file"""
+    def download_pdf(self, url: str, filename: str, headers: dict = None) -> str:
+        """Download PDF file (pooled, rate-limited; see downloader.py)
+        
+        Args:
+            headers: Optional extra request headers (e.g. conditional validators)
+        
+        Raises:
+            NotModified: A conditional request came back 304
+        """
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'application/pdf,application/octet-stream,*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'identity',
-                'Referer': self.base_url,
-                'Connection': 'keep-alive'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=60, stream=True, allow_redirects=True)
-            response.raise_for_status()
+            filepath = self.output_dir / filename
+            response = get_downloader().download(url, str(filepath), referer=self.base_url, headers=headers)
             
             # Check if response is actually a PDF
-            first_bytes = response.content[:4] if len(response.content) >= 4 else b''
-            if first_bytes != b'%PDF':
-                content_type = response.headers.get('Content-Type', '').lower()
-                if 'text/html' in content_type:
+            if response.first_bytes != b'%PDF':
+                if 'text/html' in response.content_type:
+                    filepath.unlink()
                     raise ValueError("Server returned HTML instead of PDF")
             
-            filepath = self.output_dir / filename
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            
             if filepath.stat().st_size == 0:
                 raise ValueError("Downloaded file is empty")
             
             return str(filepath)
+        except NotModified:
+            raise
         except Exception as e:
             print(f"  Error downloading PDF: {e}")
             raise
@@ -1199,74 +1210,53 @@ class IIFAScraper(BNMScraper):
             resolution_number: Optional resolution number
             source_type: Type of source ('ebook' or 'resolution')
         """
-        points = []
-        
-        # Handle both old format (list of strings) and new format (list of dicts)
-        for idx, chunk_data in enumerate(text_chunks):
-            if isinstance(chunk_data, dict):
-                # New format with page numbers
-                chunk_text = chunk_data.get('text', '')
-                page_number = chunk_data.get('page_number')
-                chunk_idx = chunk_data.get('chunk_index', idx)
-            else:
-                # Old format (backward compatibility)
-                chunk_text = chunk_data
-                page_number = None
-                chunk_idx = idx
-            
-            if not chunk_text.strip():
-                continue
-            
-            # Generate embedding
-            try:
-                embedding = self.embedding_model.encode(chunk_text).tolist()
-            except Exception as e:
-                print(f"  Error encoding chunk {idx}: {e}")
-                continue
-            
-            # Create unique ID
-            chunk_id = hashlib.md5(f"{pdf_url}_{chunk_idx}".encode()).hexdigest()
-            
-            # Create point with metadata
-            payload = {
-                'pdf_url': pdf_url,
-                'pdf_title': pdf_title,
-                'chunk_index': chunk_idx,
-                'chunk_text': chunk_text,
-                'filepath': filepath,
-                'total_chunks': len(text_chunks),
-                'source': 'IIFA',
-                'source_type': source_type  # 'ebook' or 'resolution'
-            }
-            
-            # Add page number if available
-            if page_number is not None:
-                payload['page_number'] = page_number
-            
-            # Add optional metadata
-            if date:
-                payload['date'] = date
-            if resolution_number:
-                payload['resolution_number'] = resolution_number
-            
-            point = PointStruct(
-                id=chunk_id,
-                vector=embedding,
-                payload=payload
+        try:
+            stored = self._writer().store(
+                pdf_url, pdf_title, text_chunks, filepath,
+                extra_payload=self._extra_payload(date=date, resolution_number=resolution_number,
+                                                  source_type=source_type)
             )
-            points.append(point)
-        
-        # Insert points into Qdrant
-        if points:
-            try:
-                self.qdrant_client.upsert(
-                    collection_name=self.collection_name,
-                    points=points
-                )
-                print(f"  Stored {len(points)} chunks in Qdrant")
-            except Exception as e:
-                print(f"  Error storing chunks in Qdrant: {e}")
-                raise
+        except Exception as e:
+            print(f"  Error storing chunks in Qdrant: {e}")
+            raise
+        if stored:
+            print(f"  Stored {stored} chunks in Qdrant")
+    
+    def _extra_payload(self, date: str = "", resolution_number: str = "", source_type: str = "ebook",
+                       source_document: str = "") -> dict:
+        """Source-specific chunk payload (empty values are left out)"""
+        return {
+            'source': 'IIFA',
+            'source_type': source_type,  # 'ebook' or 'resolution'
+            'date': date,
+            'resolution_number': resolution_number,
+            'source_document': source_document  # E-Book URL for its per-resolution sections
+        }
+    
+    def _split_job(self, job: dict, page_texts: list):
+        """One logical document per resolution for the E-Book (see ebook_splitter)"""
+        if job.get('meta', {}).get('source_type') != "ebook":
+            return None
+        sections = split_resolutions(page_texts)
+        if sum(1 for section in sections if section['resolution_number']) < 2:
+            print("  Warning: No resolution headings found in the E-Book, storing it as one document")
+            return None
+        
+        split = []
+        for section in sections:
+            number = section['resolution_number']
+            split.append(({
+                'url': f"{job['url']}#resolution-{number}" if number else f"{job['url']}#front-matter",
+                'title': f"IIFA {section['title']}" if number else f"{job['title']} (front matter)",
+                'filename': job['filename'],
+                'meta': {
+                    'date': section['date'],
+                    'resolution_number': number,
+                    'source_type': "ebook",
+                    'source_document': job['url']
+                }
+            }, section['pages']))
+        return split
     
     def sanitize_filename(self, url: str, title: str) -> str:
         """Create a safe filename from URL and title"""
@@ -1296,111 +1286,54 @@ class IIFAScraper(BNMScraper):
             f.write(str(soup.prettify()))
         print(f"  Debug: Saved page HTML to {debug_html_path}")
         
-        # Find and download E-Book
+        jobs = []
+        
+        # Find the E-Book
         ebook_url = self.find_ebook_link(soup, self.base_url)
-        if ebook_url:
-            print(f"\n[1/2] Processing E-Book: {ebook_url}")
-            try:
-                filename = self.sanitize_filename(ebook_url, "IIFA_Resolutions_E-Book")
-                filepath = self.download_pdf(ebook_url, filename)
-                print(f"  Downloaded: {filename}")
-                
-                # Extract text with page numbers
-                page_texts = self.extract_text_with_pages(filepath)
-                if page_texts:
-                    chunked_data = self.chunk_text_with_pages(page_texts)
-                    print(f"  Extracted {len(chunked_data)} text chunks with page numbers")
-                    self.store_in_qdrant(
-                        pdf_url=ebook_url,
-                        pdf_title="IIFA Resolutions E-Book",
-                        text_chunks=chunked_data,
-                        filepath=filepath,
-                        source_type="ebook"
-                    )
-                else:
-                    print(f"  Warning: No text extracted from {filename}")
-            except Exception as e:
-                print(f"  Error processing E-Book: {e}")
-        else:
+        if not ebook_url:
             print("\n  Warning: E-Book link not found. Trying with Selenium...")
             if SELENIUM_AVAILABLE:
                 soup = self.get_page_content(self.base_url, use_selenium=True)
                 ebook_url = self.find_ebook_link(soup, self.base_url)
                 if ebook_url:
                     print(f"  Found E-Book with Selenium: {ebook_url}")
-                    try:
-                        filename = self.sanitize_filename(ebook_url, "IIFA_Resolutions_E-Book")
-                        filepath = self.download_pdf(ebook_url, filename)
-                        print(f"  Downloaded: {filename}")
-                        
-                        page_texts = self.extract_text_with_pages(filepath)
-                        if page_texts:
-                            chunked_data = self.chunk_text_with_pages(page_texts)
-                            print(f"  Extracted {len(chunked_data)} text chunks with page numbers")
-                            self.store_in_qdrant(
-                                pdf_url=ebook_url,
-                                pdf_title="IIFA Resolutions E-Book",
-                                text_chunks=chunked_data,
-                                filepath=filepath, 
-                                               source_type="ebook")
-                    except Exception as e:
-                        print(f"  Error processing E-Book: {e}")
-        
-        # Find and process individual resolution PDFs
+        if ebook_url:
+            print(f"\n[1/2] Queued E-Book: {ebook_url}")
+            jobs.append({
+                'url': ebook_url,
+                'title': "IIFA Resolutions E-Book",
+                'filename': self.sanitize_filename(ebook_url, "IIFA_Resolutions_E-Book"),
+                'meta': {'source_type': "ebook"}
+            })
+        
+        # Find individual resolution PDFs
         print(f"\n[2/2] Finding individual resolution PDFs...")
         resolution_links = self.find_resolution_pdf_links(soup, self.base_url)
         print(f"Found {len(resolution_links)} resolution PDF links")
         
-        if resolution_links:
-            for idx, pdf_info in enumerate(tqdm(resolution_links, desc="Processing Resolutions"), 1):
-                pdf_url = pdf_info['url']
-                pdf_title = pdf_info['text']
-                date = pdf_info.get('date', '')
-                resolution_num = pdf_info.get('resolution_number', '')
-                
-                print(f"\n[{idx}/{len(resolution_links)}] Processing: {pdf_title}")
-                if date:
-                    print(f"  Date: {date}")
-                if resolution_num:
-                    print(f"  Resolution #: {resolution_num}")
-                print(f"  URL: {pdf_url}")
-                
-                try:
-                    filename = self.sanitize_filename(pdf_url, pdf_title)
-                    filepath = self.download_pdf(pdf_url, filename)
-                    print(f"  Downloaded: {filename}")
-                    
-                    # Extract text with page numbers
-                    page_texts = self.extract_text_with_pages(filepath)
-                    if not page_texts:
-                        print(f"  Warning: No text extracted from {filename}")
-                        continue
-                    
-                    # Chunk text with page tracking
-                    chunked_data = self.chunk_text_with_pages(page_texts)
-                    if not chunked_data:
-                        print(f"  Warning: No chunks created from {filename}")
-                        continue
-                    
-                    print(f"  Extracted {len(chunked_data)} text chunks with page numbers")
-                    self.store_in_qdrant(
-                        pdf_url=pdf_url,
-                        pdf_title=pdf_title,
-                        text_chunks=chunked_data,
-                        filepath=filepath,
-                        date=date,
-                        resolution_number=resolution_num,
-                        source_type="resolution"
-                    )
-                    
-                except Exception as e:
-                    import traceback
-                    error_msg = str(e) if str(e) else repr(e)
-                    print(f"  Error processing {pdf_url}: {error_msg}")
-                    # Print full traceback for debugging
-                    print(f"  Full error details:")
-                    traceback.print_exc()
-                    continue
+        for idx, pdf_info in enumerate(resolution_links, 1):
+            pdf_url = pdf_info['url']
+            pdf_title = pdf_info['text']
+            date = pdf_info.get('date', '')
+            resolution_num = pdf_info.get('resolution_number', '')
+            
+            print(f"\n[{idx}/{len(resolution_links)}] Queued: {pdf_title}")
+            if date:
+                print(f"  Date: {date}")
+            if resolution_num:
+                print(f"  Resolution #: {resolution_num}")
+            print(f"  URL: {pdf_url}")
+            
+            jobs.append({
+                'url': pdf_url,
+                'title': pdf_title,
+                'filename': self.sanitize_filename(pdf_url, pdf_title),
+                'meta': {'date': date, 'resolution_number': resolution_num, 'source_type': "resolution"}
+            })
+        
+        # The E-Book goes first and is by far the largest: it is extracted in page
+        # ranges and split into one document per resolution, resolutions stream behind it
+        self.ingest(jobs)
         
         print(f"\n[SUCCESS] IIFA scraping complete! PDFs stored in: {self.output_dir}")
         if self.qdrant_path:
@@ -1437,7 +1370,7 @@ class SCScraper(BNMScraper):
         # Initialize sentence transformer for embeddings
         print("Loading embedding model...")
         try:
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+            self.embedding_model = SentenceTransformer(self.embedding_model_name)
         except Exception as e:
             print(f"Error loading embedding model: {e}")
             print("This might be due to protobuf version conflict.")
@@ -1467,6 +1400,7 @@ class SCScraper(BNMScraper):
                 )
             else:
                 print(f"Collection {self.collection_name} already exists")
+            self._ensure_payload_indexes()
         except Exception as e:
             print(f"Error setting up collection: {e}")
             raise
@@ -1600,38 +1534,33 @@ class SCScraper(BNMScraper):
         
         return unique_links
     
-    def download_pdf(self, url: str, filename: str) -> str:
-        """Download PDF file"""
+    def download_pdf(self, url: str, filename: str, headers: dict = None) -> str:
+        """Download PDF file (pooled, rate-limited; see downloader.py)
+        
+        Args:
+            headers: Optional extra request headers (e.g. conditional validators)
+        
+        Raises:
+            NotModified: A conditional request came back 304
+        """
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'application/pdf,application/octet-stream,*/*',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'identity',
-                'Referer': self.base_url,
-                'Connection': 'keep-alive'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=60, stream=True, allow_redirects=True)
-            response.raise_for_status()
+            filepath = self.output_dir / filename
+            response = get_downloader().download(url, str(filepath), referer=self.base_url, headers=headers)
             
             # Check if response is actually a PDF
-            first_bytes = response.content[:4] if len(response.content) >= 4 else b''
-            content_type = response.headers.get('Content-Type', '').lower()
+            first_bytes = response.first_bytes
+            content_type = response.content_type
             
             # Some SC documents might not have .pdf extension but are PDFs
             if first_bytes != b'%PDF' and 'application/pdf' not in content_type:
                 # Check if it's HTML (error page)
                 if 'text/html' in content_type or first_bytes == b'<!DO' or first_bytes == b'<htm':
+                    filepath.unlink()
                     raise ValueError("Server returned HTML instead of PDF")
                 # If content-type suggests PDF, proceed anyway
                 if 'pdf' not in content_type and 'octet-stream' not in content_type:
                     print(f"  Warning: Content-Type is {content_type}, may not be a PDF")
             
-            filepath = self.output_dir / filename
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
-            
             if filepath.stat().st_size == 0:
                 raise ValueError("Downloaded file is empty")
             
@@ -1643,6 +1572,8 @@ class SCScraper(BNMScraper):
                     # Don't raise, just warn - some files might be valid but have different headers
             
             return str(filepath)
+        except NotModified:
+            raise
         except Exception as e:
             print(f"  Error downloading PDF: {e}")
             raise
@@ -1685,74 +1616,25 @@ class SCScraper(BNMScraper):
             date: Optional date string
             resolution_number: Optional resolution number
         """
-        points = []
-        
-        # Handle both old format (list of strings) and new format (list of dicts)
-        for idx, chunk_data in enumerate(text_chunks):
-            if isinstance(chunk_data, dict):
-                # New format with page numbers
-                chunk_text = chunk_data.get('text', '')
-                page_number = chunk_data.get('page_number')
-                chunk_idx = chunk_data.get('chunk_index', idx)
-            else:
-                # Old format (backward compatibility)
-                chunk_text = chunk_data
-                page_number = None
-                chunk_idx = idx
-            
-            if not chunk_text.strip():
-                continue
-            
-            # Generate embedding
-            try:
-                embedding = self.embedding_model.encode(chunk_text).tolist()
-            except Exception as e:
-                print(f"  Error encoding chunk {idx}: {e}")
-                continue
-            
-            # Create unique ID
-            chunk_id = hashlib.md5(f"{pdf_url}_{chunk_idx}".encode()).hexdigest()
-            
-            # Create point with metadata
-            payload = {
-                'pdf_url': pdf_url,
-                'pdf_title': pdf_title,
-                'chunk_index': chunk_idx,
-                'chunk_text': chunk_text,
-                'filepath': filepath,
-                'total_chunks': len(text_chunks),
-                'source': 'SC',
-                'source_type': 'resolution'
-            }
-            
-            # Add page number if available
-            if page_number is not None:
-                payload['page_number'] = page_number
-            
-            # Add optional metadata
-            if date:
-                payload['date'] = date
-            if resolution_number:
-                payload['resolution_number'] = resolution_number
-            
-            point = PointStruct(
-                id=chunk_id,
-                vector=embedding,
-                payload=payload
+        try:
+            stored = self._writer().store(
+                pdf_url, pdf_title, text_chunks, filepath,
+                extra_payload=self._extra_payload(date=date, resolution_number=resolution_number)
             )
-            points.append(point)
-        
-        # Insert points into Qdrant
-        if points:
-            try:
-                self.qdrant_client.upsert(
-                    collection_name=self.collection_name,
-                    points=points
-                )
-                print(f"  Stored {len(points)} chunks in Qdrant")
-            except Exception as e:
-                print(f"  Error storing chunks in Qdrant: {e}")
-                raise
+        except Exception as e:
+            print(f"  Error storing chunks in Qdrant: {e}")
+            raise
+        if stored:
+            print(f"  Stored {stored} chunks in Qdrant")
+    
+    def _extra_payload(self, date: str = "", resolution_number: str = "") -> dict:
+        """Source-specific chunk payload (empty values are left out)"""
+        return {
+            'source': 'SC',
+            'source_type': 'resolution',
+            'date': date,
+            'resolution_number': resolution_number
+        }
     
     def sanitize_filename(self, url: str, title: str) -> str:
         """Create a safe filename from URL and title"""
@@ -1807,56 +1689,29 @@ class SCScraper(BNMScraper):
                 print("Tip: The page might require JavaScript. Install Selenium: pip install selenium webdriver-manager")
             return
         
-        # Process each PDF
-        for idx, pdf_info in enumerate(tqdm(pdf_links, desc="Processing PDFs"), 1):
+        # Queue every PDF for the ingestion pipeline
+        jobs = []
+        for idx, pdf_info in enumerate(pdf_links, 1):
             pdf_url = pdf_info['url']
             pdf_title = pdf_info['text']
             date = pdf_info.get('date', '')
             resolution_num = pdf_info.get('resolution_number', '')
             
-            print(f"\n[{idx}/{len(pdf_links)}] Processing: {pdf_title}")
+            print(f"\n[{idx}/{len(pdf_links)}] Queued: {pdf_title}")
             if date:
                 print(f"  Date: {date}")
             if resolution_num:
                 print(f"  Resolution #: {resolution_num}")
             print(f"  URL: {pdf_url}")
             
-            try:
-                filename = self.sanitize_filename(pdf_url, pdf_title)
-                filepath = self.download_pdf(pdf_url, filename)
-                print(f"  Downloaded: {filename}")
-                
-                # Extract text with page numbers
-                page_texts = self.extract_text_with_pages(filepath)
-                if not page_texts:
-                    print(f"  Warning: No text extracted from {filename}")
-                    continue
-                
-                # Chunk text with page tracking
-                chunked_data = self.chunk_text_with_pages(page_texts)
-                if not chunked_data:
-                    print(f"  Warning: No chunks created from {filename}")
-                    continue
-                
-                print(f"  Extracted {len(chunked_data)} text chunks with page numbers")
-                
-                self.store_in_qdrant(
-                    pdf_url=pdf_url,
-                    pdf_title=pdf_title,
-                    text_chunks=chunked_data,
-                    filepath=filepath,
-                    date=date,
-                    resolution_number=resolution_num
-                )
-                
-            except Exception as e:
-                import traceback
-                error_msg = str(e) if str(e) else repr(e)
-                print(f"  Error processing {pdf_url}: {error_msg}")
-                # Print full traceback for debugging
-                print(f"  Full error details:")
-                traceback.print_exc()
-                continue
+            jobs.append({
+                'url': pdf_url,
+                'title': pdf_title,
+                'filename': self.sanitize_filename(pdf_url, pdf_title),
+                'meta': {'date': date, 'resolution_number': resolution_num}
+            })
+        
+        self.ingest(jobs)
         
         print(f"\n[SUCCESS] SC scraping complete! PDFs stored in: {self.output_dir}")
         if self.qdrant_path:
@@ -1872,6 +1727,7 @@ def main():
     
     # Check for command line arguments
     use_server = "--server" in sys.argv or "-s" in sys.argv
+    force = "--force" in sys.argv  # Ignore the ingestion manifest and re-ingest everything
     qdrant_url = "http://localhost:6333" if use_server else None
     
     # Check which source to scrape
@@ -1897,6 +1753,7 @@ def main():
             output_dir="pdfs/bnm",
             qdrant_url=qdrant_url
         )
+        bnm_scraper.force_rescrape = force
         bnm_scraper.scrape_and_store()
     
     # Scrape IIFA if requested
@@ -1910,6 +1767,7 @@ def main():
             output_dir="pdfs/iifa",
             qdrant_url=qdrant_url
         )
+        iifa_scraper.force_rescrape = force
         iifa_scraper.scrape_and_store()
     
     # Scrape SC if requested
@@ -1923,6 +1781,7 @@ def main():
             output_dir="pdfs/sc",
             qdrant_url=qdrant_url
         )
+        sc_scraper.force_rescrape = force
         sc_scraper.scrape_and_store()
     
     if not scrape_bnm and not scrape_iifa and not scrape_sc:
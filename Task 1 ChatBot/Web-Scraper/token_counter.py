@@ -0,0 +1,153 @@
+"""
+Token counts for chunk payloads.
+
+Chunks are stored with a 'token_count' so the backend can pack prompt
+context by tokens without tokenizing anything at query time. Counts come
+from the served model's Hugging Face tokenizer when TOKENIZER_NAME is set
+(e.g. "microsoft/phi-4"), otherwise from a script-aware approximation that
+is far closer than a fixed characters-per-token ratio for mixed English,
+Malay and Arabic text.
+
+Backfill existing collections:
+    python token_counter.py --collection bnm_pdfs --qdrant-url http://localhost:6333
+"""
+
+import argparse
+import math
+import os
+import re
+from typing import Optional
+
+try:
+    from transformers import AutoTokenizer
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
+
+# Name stored in the payload when counts are approximated
+APPROXIMATE_TOKENIZER = "approx-v1"
+
+_PIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_ARABIC_RE = re.compile(r"[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]")
+
+
+def approximate_token_count(text: str) -> int:
+    """Estimate BPE tokens from words and scripts
+
+    Short Latin words are usually one token and longer ones split roughly
+    every 4 characters; Arabic script splits about every 2 characters;
+    digit runs every 3; each punctuation mark or symbol is its own token.
+    """
+    tokens = 0
+    for piece in _PIECE_RE.findall(text):
+        if not piece[0].isalnum() and piece[0] != '_':
+            tokens += 1
+        elif _ARABIC_RE.search(piece):
+            tokens += math.ceil(len(piece) / 2)
+        elif piece.isdigit():
+            tokens += math.ceil(len(piece) / 3)
+        elif len(piece) <= 6:
+            tokens += 1
+        else:
+            tokens += math.ceil(len(piece) / 4)
+    return tokens
+
+
+class TokenCounter:
+    """Counts tokens with a Hugging Face tokenizer, or approximately"""
+
+    def __init__(self, tokenizer_name: Optional[str] = None):
+        """
+        Args:
+            tokenizer_name: Hugging Face tokenizer of the served model (optional)
+        """
+        self.name = APPROXIMATE_TOKENIZER
+        self._tokenizer = None
+        if tokenizer_name:
+            if not TRANSFORMERS_AVAILABLE:
+                print(f"Note: transformers not available, using approximate token counts instead of '{tokenizer_name}'")
+            else:
+                try:
+                    self._tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+                    self.name = tokenizer_name
+                except Exception as e:
+                    print(f"⚠ Could not load tokenizer '{tokenizer_name}': {e}. Using approximate token counts")
+
+    @property
+    def exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        """Number of tokens in text (without special tokens)"""
+        if not text:
+            return 0
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False))
+        return approximate_token_count(text)
+
+
+_token_counter: Optional[TokenCounter] = None
+
+
+def get_token_counter(tokenizer_name: Optional[str] = None) -> TokenCounter:
+    """Shared counter, created on first use for tokenizer_name or TOKENIZER_NAME"""
+    global _token_counter
+    if _token_counter is None:
+        _token_counter = TokenCounter(tokenizer_name or os.getenv("TOKENIZER_NAME") or None)
+    return _token_counter
+
+
+def backfill_token_counts(client, collection_name: str, batch_size: int = 256) -> int:
+    """Add 'token_count' to points stored before it was part of the payload
+
+    Returns:
+        Number of points updated
+    """
+    from qdrant_client.models import Filter, IsEmptyCondition, PayloadField
+
+    counter = get_token_counter()
+    missing = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key='token_count'))])
+    updated = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=missing,
+            limit=batch_size,
+            offset=offset,
+            with_payload=['chunk_text'],
+            with_vectors=False
+        )
+        for point in points:
+            client.set_payload(
+                collection_name=collection_name,
+                payload={
+                    'token_count': counter.count(point.payload.get('chunk_text', '')),
+                    'tokenizer': counter.name
+                },
+                points=[point.id],
+                wait=False
+            )
+        updated += len(points)
+        if offset is None:
+            break
+    return updated
+
+
+def main():
+    from qdrant_client import QdrantClient
+
+    parser = argparse.ArgumentParser(description="Store token counts on existing chunks")
+    parser.add_argument("--collection", required=True)
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL"))
+    parser.add_argument("--qdrant-path", default=os.getenv("QDRANT_PATH", "./qdrant_db"))
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.qdrant_url) if args.qdrant_url else QdrantClient(path=args.qdrant_path)
+    updated = backfill_token_counts(client, args.collection)
+    print(f"Stored token counts ({get_token_counter().name}) on {updated} chunks in '{args.collection}'")
+
+
+if __name__ == "__main__":
+    main()
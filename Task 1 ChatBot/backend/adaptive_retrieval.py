@@ -0,0 +1,91 @@
+"""
+Adaptive top-k for document retrieval.
+Instead of a fixed candidate count, the score distribution of the first
+search decides: a clear drop (score gap or elbow) ends the result list
+early, while a flat distribution that filled the first search is searched
+again with more candidates. Per-collection noise floors, calibrated from
+sample queries, drop results that score no better than unrelated text.
+"""
+import json
+import os
+import statistics
+from typing import Dict, List, Optional, Tuple
+
+# Decisions reported in metrics and logs
+CUT_GAP = "gap"
+CUT_ELBOW = "elbow"
+AMBIGUOUS = "flat"
+KEEP_ALL = "keep"
+
+
+def find_cutoff(
+    scores: List[float],
+    max_k: int,
+    min_k: int = 1,
+    gap_threshold: float = 0.08,
+    elbow_threshold: float = 0.05
+) -> Tuple[Optional[int], str]:
+    """
+    Where the top of a score list ends
+
+    Args:
+        scores: Similarity scores, best first
+        max_k: Most results wanted
+        min_k: Never cut below this many
+        gap_threshold: Drop between neighbours that counts as a clear gap
+        elbow_threshold: Distance below the first-to-last chord that counts as an elbow
+
+    Returns:
+        Tuple of (result count or None to keep max_k, decision)
+    """
+    min_k = min(min_k, max_k)
+    # One score past max_k shows whether the list drops right after it
+    window = scores[:max_k + 1]
+    if len(window) <= min_k + 1:
+        return None, KEEP_ALL
+
+    # Score gap: one step much larger than the typical step
+    gaps = [window[i] - window[i + 1] for i in range(len(window) - 1)]
+    candidates = range(min_k - 1, min(max_k, len(gaps)))
+    widest = max(candidates, key=lambda i: gaps[i])
+    if gaps[widest] >= gap_threshold and gaps[widest] >= 2 * statistics.median(gaps):
+        return widest + 1, CUT_GAP
+
+    # Elbow: the point furthest below the straight line from first to last score
+    last = len(window) - 1
+    slope = (window[last] - window[0]) / last
+    depth = [window[0] + slope * i - window[i] for i in range(len(window))]
+    elbow = max(range(min_k, min(max_k, last)), key=lambda i: depth[i], default=None)
+    if elbow is not None and depth[elbow] >= elbow_threshold:
+        return elbow, CUT_ELBOW
+
+    if window[0] - window[-1] < gap_threshold:
+        return None, AMBIGUOUS
+    return None, KEEP_ALL
+
+
+def load_calibration(path: str) -> Dict[str, float]:
+    """Per-collection score floors written by `benchmark.py calibrate-retrieval` ({} if missing)"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {name: float(floor) for name, floor in json.load(f).get("score_floors", {}).items()}
+    except (OSError, ValueError) as e:
+        print(f"⚠ Could not read retrieval calibration {path}: {e}")
+        return {}
+
+
+def calibrate_floors(scores_by_collection: Dict[str, List[List[float]]], rank: int = 20) -> Dict[str, float]:
+    """
+    Noise floor per collection: the median score at `rank` across sample queries
+
+    Results that score below what the rank-th neighbour of a typical query
+    gets are not meaningfully related to the question.
+    """
+    floors = {}
+    for collection, runs in scores_by_collection.items():
+        at_rank = [run[rank - 1] for run in runs if len(run) >= rank]
+        if at_rank:
+            floors[collection] = round(statistics.median(at_rank), 4)
+    return floors
@@ -0,0 +1,674 @@
+"""Benchmark script for backend performance work
+
+Run against local services (Qdrant, Ollama, the API) - not part of the app.
+
+Usage:
+    python benchmark.py payload-indexes --sizes 10000 100000 1000000
+    python benchmark.py stages --repeat 5
+    python benchmark.py ollama-warmup --repeat 5
+    python benchmark.py ollama-pool --backends 3 --requests 60 --concurrency 12
+    python benchmark.py prompt-cache --repeat 3
+    python benchmark.py compression --generate
+    python benchmark.py calibrate-retrieval
+    python benchmark.py adaptive-topk
+    python benchmark.py chunking --pdf-dir ../Web-Scraper/pdfs
+"""
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+from config import settings
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """Percentile of a list of timings (nearest rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def _time_calls(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Call func repeat times and return latency stats in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'p50': statistics.median(timings),
+        'p95': _percentile(timings, 95),
+        'mean': statistics.mean(timings),
+    }
+
+
+def _print_stats(label: str, stats: Dict[str, float]):
+    print(f"  {label:<40} p50={stats['p50']:8.2f}ms  p95={stats['p95']:8.2f}ms  mean={stats['mean']:8.2f}ms")
+
+
+# ---------------------------------------------------------------------------
+# Payload indexes
+# ---------------------------------------------------------------------------
+
+def benchmark_payload_indexes(sizes: List[int], qdrant_url: str, dim: int = 384, repeat: int = 50):
+    """Filtered search/scroll latency with and without payload indexes"""
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import (
+        Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, PayloadSchemaType
+    )
+
+    client = QdrantClient(url=qdrant_url, timeout=300)
+    collection_name = "benchmark_payload_indexes"
+    rng = random.Random(42)
+
+    def random_vector():
+        return [rng.uniform(-1, 1) for _ in range(dim)]
+
+    for size in sizes:
+        print(f"\n=== {size:,} points ===")
+        if collection_name in [col.name for col in client.get_collections().collections]:
+            client.delete_collection(collection_name)
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=dim, distance=Distance.COSINE)
+        )
+
+        # Roughly 20 turns per session, 5 sessions per user
+        num_sessions = max(1, size // 20)
+        batch_size = 1000
+        start = time.perf_counter()
+        for offset in range(0, size, batch_size):
+            points = []
+            for i in range(offset, min(offset + batch_size, size)):
+                session = i % num_sessions
+                points.append(PointStruct(
+                    id=str(uuid.uuid4()),
+                    vector=random_vector(),
+                    payload={
+                        'user_id': f"user-{session // 5}",
+                        'session_id': f"session-{session}",
+                        'chunk_index': i // num_sessions,
+                        'pdf_title': f"Document {session}",
+                    }
+                ))
+            client.upsert(collection_name=collection_name, points=points, wait=False)
+        print(f"  Inserted in {time.perf_counter() - start:.1f}s")
+
+        session_filter = Filter(must=[
+            FieldCondition(key="session_id", match=MatchValue(value=f"session-{num_sessions // 2}"))
+        ])
+        first_chunk_filter = Filter(must=[
+            FieldCondition(key="chunk_index", match=MatchValue(value=0))
+        ])
+        query_vector = random_vector()
+
+        def run_queries(label: str):
+            _print_stats(f"search session_id ({label})", _time_calls(
+                lambda: client.search(
+                    collection_name=collection_name,
+                    query_vector=query_vector,
+                    query_filter=session_filter,
+                    limit=5
+                ), repeat))
+            _print_stats(f"scroll session_id ({label})", _time_calls(
+                lambda: client.scroll(
+                    collection_name=collection_name,
+                    scroll_filter=session_filter,
+                    limit=50,
+                    with_vectors=False
+                ), repeat))
+            _print_stats(f"scroll chunk_index=0 ({label})", _time_calls(
+                lambda: client.scroll(
+                    collection_name=collection_name,
+                    scroll_filter=first_chunk_filter,
+                    limit=100,
+                    with_vectors=False
+                ), repeat))
+
+        # Wait for the optimizer before measuring
+        while client.get_collection(collection_name).status != "green":
+            time.sleep(1)
+        run_queries("no index")
+
+        for field_name, field_schema in [
+            ('user_id', PayloadSchemaType.KEYWORD),
+            ('session_id', PayloadSchemaType.KEYWORD),
+            ('chunk_index', PayloadSchemaType.INTEGER),
+        ]:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+                wait=True
+            )
+        while client.get_collection(collection_name).status != "green":
+            time.sleep(1)
+        run_queries("indexed")
+
+    client.delete_collection(collection_name)
+
+
+# ---------------------------------------------------------------------------
+# Request stages
+# ---------------------------------------------------------------------------
+
+DEFAULT_QUESTIONS = [
+    "What is the Shariah ruling on sukuk?",
+    "What are the requirements for murabahah financing?",
+    "How is zakat calculated on business assets?",
+]
+
+
+def benchmark_stages(questions: List[str], repeat: int = 5, user_id: str = "benchmark-user"):
+    """ask_question wall-clock latency: sequential stages vs the concurrent stage graph"""
+    from rag_service import RAGService
+    from models import CollectionType
+
+    rag_service = RAGService()
+
+    for concurrent in (False, True):
+        settings.enable_concurrent_stages = concurrent
+        label = "concurrent" if concurrent else "sequential"
+        timings = []
+        per_stage: Dict[str, List[float]] = {}
+        for run in range(repeat):
+            for question in questions:
+                start = time.perf_counter()
+                result = rag_service.ask_question(
+                    question=question,
+                    collections=[CollectionType.ALL],
+                    max_results=5,
+                    min_score=0.5,
+                    user_id=user_id,
+                    session_id=f"benchmark-{label}-{run}"
+                )
+                timings.append((time.perf_counter() - start) * 1000)
+                for stage, ms in (result.get('stage_timings') or {}).items():
+                    per_stage.setdefault(stage, []).append(ms)
+
+        print(f"\n=== {label} ({len(timings)} requests) ===")
+        _print_stats("ask_question wall clock", {
+            'p50': statistics.median(timings),
+            'p95': _percentile(timings, 95),
+            'mean': statistics.mean(timings),
+        })
+        for stage, values in per_stage.items():
+            print(f"  {stage:<40} mean={statistics.mean(values):8.2f}ms")
+
+    rag_service.conversation_memory.close()
+
+
+# ---------------------------------------------------------------------------
+# Ollama warm-up / connection reuse
+# ---------------------------------------------------------------------------
+
+def benchmark_ollama_warmup(prompt: str, repeat: int = 5):
+    """Cold-start vs warm latency, and a fresh connection per call vs the pooled session"""
+    import requests
+    from ollama_llm import OllamaLLM
+
+    llm = OllamaLLM(
+        base_url=settings.ollama_url,
+        model=settings.ollama_model,
+        keep_alive=settings.ollama_keep_alive or None,
+        num_predict=settings.ollama_num_predict or None,
+        min_num_ctx=settings.ollama_min_num_ctx,
+        max_num_ctx=settings.ollama_max_num_ctx,
+        request_timeout=settings.ollama_request_timeout
+    )
+
+    # keep_alive=0 unloads the model, so the next request pays the load cost
+    requests.post(
+        f"{llm.base_url}api/generate",
+        json={"model": llm.model, "keep_alive": 0},
+        timeout=llm.request_timeout
+    )
+    start = time.perf_counter()
+    llm.invoke(prompt)
+    print(f"\n  {'first request (cold model)':<40} {(time.perf_counter() - start) * 1000:8.2f}ms")
+
+    _print_stats("pooled session (warm model)", _time_calls(lambda: llm.invoke(prompt), repeat))
+
+    # Same request without connection reuse
+    def fresh_connection():
+        payload = {
+            "model": llm.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": False,
+            "options": {"num_ctx": llm.min_num_ctx, "num_predict": llm.num_predict},
+        }
+        with requests.Session() as session:
+            session.post(llm.chat_url, json=payload, timeout=llm.request_timeout).raise_for_status()
+
+    _print_stats("new connection per request", _time_calls(fresh_connection, repeat))
+
+
+# ---------------------------------------------------------------------------
+# Ollama backend pool (against local fake servers)
+# ---------------------------------------------------------------------------
+
+def _start_fake_ollama(delay: float, parallel: int = 1, failing: bool = False) -> ThreadingHTTPServer:
+    """Local stand-in for Ollama: /api/tags and a fixed-latency /api/chat that,
+    like OLLAMA_NUM_PARALLEL, only generates `parallel` answers at a time"""
+    slots = threading.Semaphore(parallel)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._send(500 if failing else 200, {"models": [{"name": settings.ollama_model}]})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if failing:
+                self._send(500, {"error": "simulated backend failure"})
+                return
+            with slots:
+                time.sleep(delay)
+            self._send(200, {
+                "message": {"role": "assistant", "content": "ok"},
+                "done": True,
+                "prompt_eval_count": 10,
+                "eval_count": 1,
+            })
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark_ollama_pool(backends: int, requests_count: int, concurrency: int, delay: float, parallel: int, failing: int):
+    """Throughput and request distribution across several fake Ollama backends"""
+    from ollama_llm import OllamaLLM
+
+    servers = [_start_fake_ollama(delay, parallel, failing=i < failing) for i in range(backends)]
+    urls = [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+
+    # Baseline on one healthy backend, then the whole pool (failing ones included)
+    runs = [[urls[-1]], urls] if backends > 1 else [urls]
+    for chosen in runs:
+        count = len(chosen)
+        llm = OllamaLLM(
+            base_url=",".join(chosen),
+            model=settings.ollama_model,
+            keep_alive=None,
+            health_check_interval=1.0,
+            failure_threshold=2,
+            ejection_seconds=60.0
+        )
+
+        def one_request(i: int):
+            try:
+                llm.invoke(f"benchmark question {i}", session_key=f"session-{i % 10}")
+                return True
+            except ValueError:
+                return False
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(one_request, range(requests_count)))
+        elapsed = time.perf_counter() - start
+        llm.pool.close()
+
+        print(f"\n=== {count} backend(s): {requests_count} requests, concurrency {concurrency} ===")
+        print(f"  {'throughput':<40} {requests_count / elapsed:8.2f} req/s  ({sum(outcomes)} ok)")
+        for stats in llm.pool.get_stats():
+            print(f"  {stats['url']:<40} requests={stats['total_requests']:<5} failures={stats['total_failures']:<5} available={stats['available']}")
+
+    for server in servers:
+        server.shutdown()
+
+
+# ---------------------------------------------------------------------------
+# Prompt layout vs Ollama prompt cache
+# ---------------------------------------------------------------------------
+
+def benchmark_prompt_cache(questions: List[str], repeat: int = 3, sources: int = 3):
+    """Prefill (prompt_eval_count / prompt_eval_duration) for each prompt template version.
+
+    Every request uses a different question and different source text, as in
+    production; only a template's fixed system prefix can be served from cache.
+    """
+    from ollama_llm import OllamaLLM
+    from prompt_templates import PROMPT_TEMPLATES, get_prompt_template
+
+    llm = OllamaLLM(
+        base_url=settings.ollama_url,
+        model=settings.ollama_model,
+        keep_alive=settings.ollama_keep_alive or None,
+        num_predict=16,  # Only prefill is measured
+        min_num_ctx=settings.ollama_min_num_ctx,
+        max_num_ctx=settings.ollama_max_num_ctx,
+        request_timeout=settings.ollama_request_timeout
+    )
+    llm.warm_up()
+
+    versions = sorted({version for _, version in PROMPT_TEMPLATES})
+    for version in versions:
+        template = get_prompt_template(settings.use_compact_prompt, sources, version)
+        counts, durations, totals = [], [], []
+        for i in range(repeat * len(questions)):
+            question = questions[i % len(questions)]
+            context = "\n\n".join(
+                f"[{n}] Source {n} of run {i}: {uuid.uuid4().hex} " + "Murabahah is a cost-plus sale. " * 20
+                for n in range(1, sources + 1)
+            )
+            system, prompt = template.render(context, "", question, sources)
+            start = time.perf_counter()
+            _, raw = llm.invoke_with_metadata(prompt, system=system)
+            totals.append((time.perf_counter() - start) * 1000)
+            if i == 0:
+                continue  # The first request fills the cache
+            counts.append(raw.get('prompt_eval_count') or 0)
+            durations.append((raw.get('prompt_eval_duration') or 0) / 1e6)
+
+        print(f"\n  {template.key} (system prefix {len(template.system or '')} chars)")
+        print(f"  {'prompt tokens evaluated':<40} mean={statistics.mean(counts):8.1f}")
+        print(f"  {'prompt eval time':<40} mean={statistics.mean(durations):8.2f}ms  p95={_percentile(durations, 95):8.2f}ms")
+        print(f"  {'request latency':<40} mean={statistics.mean(totals):8.2f}ms")
+
+
+# ---------------------------------------------------------------------------
+# Context compression (fixed evaluation set)
+# ---------------------------------------------------------------------------
+
+def _grounded(text: str, facts: List[List[str]]) -> float:
+    """Fraction of facts (each a list of alternative phrases) present in text"""
+    if not facts:
+        return 1.0
+    lowered = text.lower()
+    return sum(1 for alternatives in facts if any(phrase.lower() in lowered for phrase in alternatives)) / len(facts)
+
+
+def benchmark_compression(eval_path: str, generate: bool = False, max_results: int = 5, min_score: float = 0.3):
+    """Prompt tokens, prefill time and grounding with and without context compression"""
+    from rag_service import RAGService
+    from models import CollectionType
+    from model_cascade import check_citations
+
+    with open(eval_path, encoding="utf-8") as f:
+        eval_set = json.load(f)["questions"]
+
+    rag_service = RAGService()
+    collections = rag_service._get_collections_to_search([CollectionType.ALL])
+
+    # Retrieve once so both runs see the same documents
+    retrieved = []
+    for item in eval_set:
+        query_vector = rag_service._get_query_embedding(item["question"])
+        docs = rag_service._retrieve_documents(item["question"], collections, max_results, min_score,
+                                               query_embedding=query_vector)
+        retrieved.append((item, query_vector, docs))
+
+    for compress in (False, True):
+        settings.enable_context_compression = compress
+        label = "compressed" if compress else "full chunks"
+        prompt_tokens, build_ms, context_grounding = [], [], []
+        prefill_ms, answer_grounding, citation_failures = [], [], 0
+        for item, query_vector, docs in retrieved:
+            if not docs:
+                continue
+            start = time.perf_counter()
+            prompt_info = rag_service._build_prompt(item["question"], docs, [], query_vector=query_vector)
+            build_ms.append((time.perf_counter() - start) * 1000)
+            if not prompt_info:
+                continue
+            prompt_tokens.append(prompt_info["prompt_tokens"] or 0)
+            context_grounding.append(_grounded(prompt_info["prompt"], item["facts"]))
+
+            if generate:
+                generation = rag_service._generate_answer(prompt_info)
+                usage = getattr(rag_service.llm, "last_response", None) or {}
+                if usage.get("prompt_eval_duration"):
+                    prefill_ms.append(usage["prompt_eval_duration"] / 1e6)
+                answer_grounding.append(_grounded(generation["answer"], item["facts"]))
+                if check_citations(generation, prompt_info["citation_map"]):
+                    citation_failures += 1
+
+        print(f"\n=== {label} ({len(prompt_tokens)} questions) ===")
+        print(f"  {'prompt tokens':<40} mean={statistics.mean(prompt_tokens):8.1f}")
+        print(f"  {'prompt build time':<40} mean={statistics.mean(build_ms):8.2f}ms")
+        print(f"  {'facts present in context':<40} mean={statistics.mean(context_grounding):8.2%}")
+        if generate:
+            if prefill_ms:
+                print(f"  {'prompt eval time':<40} mean={statistics.mean(prefill_ms):8.2f}ms")
+            print(f"  {'facts present in answer':<40} mean={statistics.mean(answer_grounding):8.2%}")
+            print(f"  {'answers failing citation checks':<40} {citation_failures}/{len(answer_grounding)}")
+
+    rag_service.conversation_memory.close()
+
+
+# ---------------------------------------------------------------------------
+# Adaptive top-k (score-distribution cut-offs)
+# ---------------------------------------------------------------------------
+
+def calibrate_retrieval(questions: List[str], output: str, rank: int = 20):
+    """Write per-collection score floors (median score at `rank`) for adaptive top-k"""
+    from rag_service import RAGService
+    from models import CollectionType
+    from adaptive_retrieval import calibrate_floors
+
+    rag_service = RAGService()
+    collections = rag_service._get_collections_to_search([CollectionType.ALL])
+    scores_by_collection: Dict[str, List[List[float]]] = {name: [] for name in collections}
+    for question in questions:
+        query_vector = rag_service._get_query_embedding(question)
+        for name in collections:
+            hits = rag_service.qdrant_client.search(collection_name=name, query_vector=query_vector, limit=rank)
+            scores_by_collection[name].append([hit.score for hit in hits])
+
+    floors = calibrate_floors(scores_by_collection, rank=rank)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"rank": rank, "questions": len(questions), "score_floors": floors}, f, indent=2)
+    for name, floor in sorted(floors.items()):
+        print(f"  {name:<40} floor={floor:.4f}")
+    print(f"Wrote {len(floors)} score floors to {output}")
+    rag_service.conversation_memory.close()
+
+
+def benchmark_adaptive_topk(questions: List[str], max_results: int = 5, min_score: float = 0.3, repeat: int = 3):
+    """Chunks per prompt, prompt tokens and retrieval latency with fixed vs adaptive top-k"""
+    from rag_service import RAGService
+    from models import CollectionType
+
+    rag_service = RAGService()
+    collections = rag_service._get_collections_to_search([CollectionType.ALL])
+    vectors = {question: rag_service._get_query_embedding(question) for question in questions}
+
+    for adaptive in (False, True):
+        settings.enable_adaptive_top_k = adaptive
+        label = "adaptive top-k" if adaptive else "fixed top-k"
+        chunks, prompt_tokens, latencies = [], [], []
+        for question in questions:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                docs = rag_service._retrieve_documents(question, collections, max_results, min_score,
+                                                       query_embedding=vectors[question])
+                latencies.append((time.perf_counter() - start) * 1000)
+            chunks.append(len(docs))
+            prompt_info = rag_service._build_prompt(question, docs, [], query_vector=vectors[question]) if docs else None
+            if prompt_info:
+                prompt_tokens.append(prompt_info["prompt_tokens"] or 0)
+
+        print(f"\n=== {label} ({len(questions)} questions) ===")
+        print(f"  {'chunks per prompt':<40} mean={statistics.mean(chunks):8.2f} min={min(chunks)} max={max(chunks)}")
+        if prompt_tokens:
+            print(f"  {'prompt tokens':<40} mean={statistics.mean(prompt_tokens):8.1f}")
+        _print_stats("retrieval latency", {
+            "mean": statistics.mean(latencies),
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+        })
+
+    rag_service.conversation_memory.close()
+
+
+# ---------------------------------------------------------------------------
+# Chunking strategies
+# ---------------------------------------------------------------------------
+
+def benchmark_chunking(eval_path: str, pdf_dir: str, limit: int, ks: List[int]):
+    """Index size and fact recall at k: 500-word windows vs per-source sentence windows
+
+    Local PDFs are chunked both ways and searched in in-memory collections;
+    a question's recall at k is the fraction of its facts found in the top k
+    chunks (same fact lists as the compression evaluation set).
+    """
+    import sys
+    from pathlib import Path
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+    from sentence_transformers import SentenceTransformer
+
+    scraper_path = Path(__file__).parent.parent / "Web-Scraper"
+    if str(scraper_path) not in sys.path:
+        sys.path.insert(0, str(scraper_path))
+    from chunking import DEFAULT_CHUNKING, chunk_document
+    from ingest_pipeline import extract_pages
+    from scraper_config import get_chunking_config
+    from token_counter import get_token_counter
+
+    with open(eval_path, encoding="utf-8") as f:
+        eval_set = json.load(f)["questions"]
+    pdfs = sorted(Path(pdf_dir).rglob("*.pdf"))[:limit]
+    if not pdfs:
+        print(f"No PDFs found under {pdf_dir}")
+        return
+    # pdfs/<source id>/... decides the per-source settings
+    documents = [(pdf.relative_to(pdf_dir).parts[0], extract_pages(str(pdf))) for pdf in pdfs]
+    print(f"Corpus: {len(documents)} PDFs, {sum(len(pages) for _, pages in documents)} pages, "
+          f"{len(eval_set)} questions")
+
+    model = SentenceTransformer('all-MiniLM-L6-v2')
+    question_vectors = model.encode([item["question"] for item in eval_set]).tolist()
+    token_counter = get_token_counter()
+    strategies = {
+        "words (500 / 50)": lambda source: {"strategy": "words", "chunk_size": 500, "overlap": 50},
+        "sentences (per source)": lambda source: get_chunking_config(source) or DEFAULT_CHUNKING,
+    }
+
+    client = QdrantClient(":memory:")
+    for label, config_for in strategies.items():
+        texts = [chunk["text"] for source, pages in documents for chunk in chunk_document(pages, **config_for(source))]
+        vectors = model.encode(texts, batch_size=64).tolist()
+        collection_name = "chunking_benchmark"
+        if client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+        client.create_collection(collection_name, vectors_config=VectorParams(size=len(vectors[0]), distance=Distance.COSINE))
+        client.upsert(collection_name, [PointStruct(id=i, vector=vector, payload={"text": text})
+                                        for i, (text, vector) in enumerate(zip(texts, vectors))])
+
+        recall = {k: [] for k in ks}
+        context_tokens = {k: [] for k in ks}
+        for item, vector in zip(eval_set, question_vectors):
+            hits = [hit.payload["text"] for hit in client.search(collection_name, vector, limit=max(ks))]
+            for k in ks:
+                recall[k].append(_grounded(" ".join(hits[:k]), item["facts"]))
+                context_tokens[k].append(sum(token_counter.count(text) for text in hits[:k]))
+
+        tokens = [token_counter.count(text) for text in texts]
+        print(f"\n=== {label} ===")
+        print(f"  {'chunks indexed':<40} {len(texts)}")
+        print(f"  {'tokens per chunk':<40} mean={statistics.mean(tokens):8.1f} max={max(tokens)}")
+        for k in ks:
+            print(f"  {f'fact recall @{k}':<40} mean={statistics.mean(recall[k]):8.2%}  "
+                  f"context tokens mean={statistics.mean(context_tokens[k]):8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    payload_parser = subparsers.add_parser("payload-indexes", help="Filtered search/scroll with and without payload indexes")
+    payload_parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    payload_parser.add_argument("--qdrant-url", default=settings.qdrant_url or "http://localhost:6333")
+    payload_parser.add_argument("--dim", type=int, default=384)
+    payload_parser.add_argument("--repeat", type=int, default=50)
+
+    stages_parser = subparsers.add_parser("stages", help="Sequential vs concurrent ask_question stages")
+    stages_parser.add_argument("--questions", nargs="+", default=DEFAULT_QUESTIONS)
+    stages_parser.add_argument("--repeat", type=int, default=5)
+
+    warmup_parser = subparsers.add_parser("ollama-warmup", help="Cold vs warm model and pooled vs fresh connections")
+    warmup_parser.add_argument("--prompt", default="Reply with the single word: ok")
+    warmup_parser.add_argument("--repeat", type=int, default=5)
+
+    pool_parser = subparsers.add_parser("ollama-pool", help="Least-loaded routing across local fake Ollama servers")
+    pool_parser.add_argument("--backends", type=int, default=3)
+    pool_parser.add_argument("--requests", type=int, default=60)
+    pool_parser.add_argument("--concurrency", type=int, default=12)
+    pool_parser.add_argument("--delay", type=float, default=0.2, help="Seconds each fake generation takes")
+    pool_parser.add_argument("--parallel", type=int, default=1, help="Concurrent generations per fake server")
+    pool_parser.add_argument("--failing", type=int, default=0, help="How many of the backends always fail")
+
+    cache_parser = subparsers.add_parser("prompt-cache", help="Prompt eval cost per prompt template version")
+    cache_parser.add_argument("--questions", nargs="+", default=DEFAULT_QUESTIONS)
+    cache_parser.add_argument("--repeat", type=int, default=3)
+    cache_parser.add_argument("--sources", type=int, default=3)
+
+    compression_parser = subparsers.add_parser("compression", help="Context compression on the fixed evaluation set")
+    compression_parser.add_argument("--eval-set", default="compression_eval.json")
+    compression_parser.add_argument("--generate", action="store_true", help="Also generate answers (needs the LLM)")
+
+    calibrate_parser = subparsers.add_parser("calibrate-retrieval", help="Per-collection score floors for adaptive top-k")
+    calibrate_parser.add_argument("--questions", nargs="+", default=DEFAULT_QUESTIONS)
+    calibrate_parser.add_argument("--rank", type=int, default=20)
+    calibrate_parser.add_argument("--output", default=settings.retrieval_calibration_file)
+
+    adaptive_parser = subparsers.add_parser("adaptive-topk", help="Chunks per prompt and latency, fixed vs adaptive top-k")
+    adaptive_parser.add_argument("--questions", nargs="+", default=None, help="Defaults to the compression evaluation set")
+    adaptive_parser.add_argument("--repeat", type=int, default=3)
+
+    chunking_parser = subparsers.add_parser("chunking", help="Fact recall at k and index size per chunking strategy")
+    chunking_parser.add_argument("--eval-set", default="compression_eval.json")
+    chunking_parser.add_argument("--pdf-dir", default="../Web-Scraper/pdfs")
+    chunking_parser.add_argument("--limit", type=int, default=50, help="Number of PDFs to index")
+    chunking_parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10])
+
+    args = parser.parse_args()
+
+    if args.command == "payload-indexes":
+        benchmark_payload_indexes(args.sizes, args.qdrant_url, dim=args.dim, repeat=args.repeat)
+    elif args.command == "stages":
+        benchmark_stages(args.questions, repeat=args.repeat)
+    elif args.command == "ollama-warmup":
+        benchmark_ollama_warmup(args.prompt, repeat=args.repeat)
+    elif args.command == "ollama-pool":
+        benchmark_ollama_pool(args.backends, args.requests, args.concurrency, args.delay, args.parallel, args.failing)
+    elif args.command == "prompt-cache":
+        benchmark_prompt_cache(args.questions, repeat=args.repeat, sources=args.sources)
+    elif args.command == "compression":
+        benchmark_compression(args.eval_set, generate=args.generate)
+    elif args.command == "calibrate-retrieval":
+        calibrate_retrieval(args.questions, args.output, rank=args.rank)
+    elif args.command == "adaptive-topk":
+        questions = args.questions
+        if not questions:
+            with open("compression_eval.json", encoding="utf-8") as f:
+                questions = [item["question"] for item in json.load(f)["questions"]] + DEFAULT_QUESTIONS
+        benchmark_adaptive_topk(questions, repeat=args.repeat)
+    elif args.command == "chunking":
+        benchmark_chunking(args.eval_set, args.pdf_dir, args.limit, args.k)
+
+
+if __name__ == "__main__":
+    main()
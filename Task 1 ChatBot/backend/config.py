@@ -15,8 +15,27 @@ class Settings(BaseSettings):
     llm_temperature: float = 0.7
     
     # Ollama Configuration (if using direct Ollama)
-    ollama_url: str = "http://localhost:11434"  # Base URL for Ollama
+    ollama_url: str = "http://localhost:11434"  # Base URL for Ollama (comma-separated for several backends)
     ollama_model: str = "phi4:14b"  # Model name to use
+    ollama_keep_alive: str = "30m"  # How long Ollama keeps the model loaded between requests ("-1" = forever)
+    ollama_num_predict: int = 1024  # Max tokens generated per answer (0 = Ollama default)
+    ollama_min_num_ctx: int = 2048  # Smallest context window requested
+    ollama_max_num_ctx: int = 16384  # Largest context window requested (prompts are bucketed in between)
+    ollama_warm_up: bool = True  # Load the model at startup instead of on the first question
+    ollama_pool_size: int = 10  # Pooled keep-alive HTTP connections to Ollama
+    ollama_request_timeout: float = 120.0  # Timeout per Ollama request in seconds
+    ollama_debug_logging: bool = False  # Dump full Ollama request/response payloads
+    ollama_health_check_interval: float = 15.0  # Seconds between /api/tags checks of each backend
+    ollama_failure_threshold: int = 3  # Consecutive failures before a backend is ejected
+    ollama_ejection_seconds: float = 30.0  # How long an ejected backend gets no traffic
+    ollama_sticky_sessions: bool = True  # Keep a chat session on the same backend (reuses Ollama's prompt cache)
+    
+    # Model Cascade (Ollama only)
+    enable_model_cascade: bool = True  # Send simple factoid questions to the small model
+    ollama_small_model: str = "llama3.2:3b"  # Fast model for simple questions ("" disables the cascade)
+    cascade_max_question_words: int = 12  # Longer questions always go to the large model
+    cascade_min_top_score: float = 0.75  # Top source must score at least this for the small model
+    cascade_score_margin: float = 0.1  # Other sources within this margin of the top count as competing
     
     # API Gateway Configuration (deprecated - use ollama instead)
     api_gateway_token_url: str = ""
@@ -40,7 +59,7 @@ class Settings(BaseSettings):
     enable_reranking: bool = False  # Enable cross-encoder re-ranking
     enable_query_expansion: bool = False  # Generate query variations
     enable_diversity_filtering: bool = True  # Use MMR for diverse results
-    enable_context_compression: bool = False  # Summarize context before LLM
+    enable_context_compression: bool = False  # Keep only the sentences closest to the question (extractive)
     enable_hybrid_search: bool = False  # Combine vector + keyword search
     
     # Multi-stage retrieval parameters
@@ -48,21 +67,64 @@ class Settings(BaseSettings):
     final_retrieval_count: int = 5  # Final count after filtering/re-ranking
     diversity_threshold: float = 0.7  # MMR lambda (0=diversity, 1=relevance)
     
+    # Adaptive top-k (how many chunks to keep, read from the score distribution)
+    enable_adaptive_top_k: bool = True  # Cut at a clear score gap/elbow; search deeper when the top scores are flat
+    adaptive_min_results: int = 2  # Never cut below this many chunks
+    adaptive_gap_threshold: float = 0.08  # Score drop between neighbours that counts as a clear gap
+    adaptive_elbow_threshold: float = 0.05  # Distance below the first-to-last score line that counts as an elbow
+    adaptive_max_candidates: int = 40  # Candidates per collection when the top scores are flat
+    adaptive_extra_results: int = 3  # Extra chunks allowed in the prompt for flat (ambiguous) score lists
+    retrieval_calibration_file: str = "retrieval_calibration.json"  # Per-collection score floors (benchmark.py calibrate-retrieval)
+    enable_resolution_filter: bool = True  # Questions naming a resolution number search that resolution first
+    
     # Context management
     max_context_length: int = 4000  # Maximum context size in characters (reduced for smaller payloads)
+    max_context_tokens: int = 1500  # Token budget for retrieved context, packed by each chunk's stored token_count (0 = use max_context_length)
+    compression_token_budget: int = 800  # Context tokens kept by compression (capped by max_context_tokens)
+    tokenizer_name: str = ""  # Hugging Face tokenizer of the served model, for chunks stored without token_count (empty = approximate)
     enable_smart_truncation: bool = True  # Smart context prioritization
     use_compact_prompt: bool = True  # Use shorter, more compact prompt template
+    prompt_template_version: int = 2  # 1 = context before instructions, 2 = fixed system prefix (cacheable by Ollama)
     
     # Performance optimizations
     enable_page_lookup: bool = True  # Enable automatic PDF page number lookup (can be slow)
     page_lookup_timeout: int = 10  # Timeout per page lookup in seconds
     max_page_lookup_time: float = 15.0  # Maximum total time for all page lookups in seconds
     
+    # Request pipeline (stages of ask_question)
+    enable_concurrent_stages: bool = True  # Overlap independent stages (False = sequential baseline)
+    memory_stage_timeout: float = 5.0  # Seconds before conversation memory search is skipped
+    retrieval_stage_timeout: float = 30.0  # Seconds before document retrieval is abandoned
+    generation_stage_timeout: float = 300.0  # Seconds before LLM generation is abandoned
+    bookkeeping_stage_timeout: float = 10.0  # Seconds for the audit write / memory store
+    
+    # Request Deadline (stage timeouts above are capped by the remaining budget)
+    request_deadline_seconds: float = 180.0  # Default end-to-end budget for /ask (0 = none; clients may send timeout_ms)
+    qdrant_search_timeout: int = 10  # Seconds per Qdrant search
+    deadline_min_memory_seconds: float = 5.0  # Skip conversation memory search with less time left
+    deadline_min_rerank_seconds: float = 20.0  # Skip MMR / re-ranking with less time left
+    deadline_full_context_seconds: float = 30.0  # Shorten the prompt context with less time left
+    deadline_reduced_context_ratio: float = 0.5  # Fraction of the context budget kept when shortening
+    deadline_min_generation_seconds: float = 5.0  # Don't start (or escalate) an LLM call with less time left
+    deadline_min_page_lookup_seconds: float = 3.0  # Skip page lookup with less time left
+    
+    # LLM Admission Control
+    enable_llm_admission_control: bool = True  # Gate LLM calls through the scheduler
+    llm_max_concurrency: int = 2  # Generations sent to the LLM at the same time
+    llm_max_queue_size: int = 32  # Requests allowed to wait for a slot (more get HTTP 429)
+    llm_queue_timeout: float = 60.0  # Seconds a request may wait for a slot (then HTTP 503)
+    enable_single_flight: bool = True  # Identical concurrent questions share one retrieval/generation
+    
     # Caching configuration
     enable_caching: bool = True  # Enable caching for PDF content, page lookups, and embeddings
     cache_max_size: int = 1000  # Maximum items per cache
     cache_ttl_hours: float = 24.0  # Cache time-to-live in hours
     
+    # Conversation memory persistence
+    enable_deferred_memory_writes: bool = True  # Queue memory writes and batch them in a background thread
+    memory_write_batch_size: int = 32  # Maximum turns embedded/upserted per batch
+    memory_flush_interval: float = 0.5  # Seconds the writer waits for a batch to fill
+    
     # Available collections
     collections: list[str] = ["bnm_pdfs", "iifa_resolutions", "sc_resolutions"]
     
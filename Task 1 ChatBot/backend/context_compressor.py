@@ -0,0 +1,164 @@
+"""
+Extractive, query-focused compression of retrieved chunks.
+Sentences are scored against the query vector (one batched encode for all
+chunks) and the best ones are kept under a token budget. Every chunk keeps
+at least its best sentence and sentences stay in their original order, so
+citation numbering and source order are unchanged.
+"""
+import re
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from metrics import get_metrics
+
+
+# Sentence ends (Latin and Arabic punctuation) or line breaks
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?؟۔])\s+|\n+')
+
+# Marks text dropped between kept sentences
+GAP_MARKER = "…"
+
+
+def split_sentences(text: str, min_chars: int = 20) -> List[str]:
+    """Split text into sentences, merging fragments shorter than min_chars into the next one"""
+    sentences = []
+    pending = ""
+    for part in SENTENCE_BOUNDARY.split(text):
+        part = part.strip()
+        if not part:
+            continue
+        pending = f"{pending} {part}" if pending else part
+        if len(pending) >= min_chars:
+            sentences.append(pending)
+            pending = ""
+    if pending:
+        if sentences:
+            sentences[-1] = f"{sentences[-1]} {pending}"
+        else:
+            sentences.append(pending)
+    return sentences
+
+
+class ContextCompressor:
+    """
+    Keeps the sentences of retrieved chunks that are closest to the query
+
+    Sentence token costs are taken in proportion from the chunk's stored
+    token_count, so compressing does not tokenize anything.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], np.ndarray],
+        count_tokens: Callable[[str], int],
+        min_sentence_chars: int = 20
+    ):
+        """
+        Args:
+            encode: Batch sentence encoder returning one row per sentence
+            count_tokens: Token counter for chunks stored without token_count
+            min_sentence_chars: Shorter fragments are merged into the next sentence
+        """
+        self.encode = encode
+        self.count_tokens = count_tokens
+        self.min_sentence_chars = min_sentence_chars
+
+    def compress(
+        self,
+        query_vector: List[float],
+        docs: List[Dict[str, Any]],
+        token_budget: int
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Compress retrieved docs to about token_budget tokens
+
+        Args:
+            query_vector: Embedding of the question
+            docs: Retrieved docs (best first) with 'content' and 'metadata'
+            token_budget: Tokens to keep across all docs
+
+        Returns:
+            Tuple of (docs with compressed 'content' and 'metadata.token_count',
+            stats with tokens/sentences before and after)
+        """
+        # (doc index, sentence index, text, tokens) for every sentence
+        sentences: List[Tuple[int, int, str, float]] = []
+        tokens_before = 0
+        for doc_idx, doc in enumerate(docs):
+            content = doc['content']
+            doc_tokens = doc['metadata'].get('token_count')
+            if doc_tokens is None:
+                doc_tokens = self.count_tokens(content)
+            tokens_before += doc_tokens
+            for sent_idx, sentence in enumerate(split_sentences(content, self.min_sentence_chars)):
+                sentences.append((doc_idx, sent_idx, sentence, doc_tokens * len(sentence) / max(1, len(content))))
+
+        stats = {
+            'tokens_before': tokens_before,
+            'tokens_after': tokens_before,
+            'sentences_before': len(sentences),
+            'sentences_after': len(sentences),
+        }
+        if tokens_before <= token_budget or not sentences:
+            return docs, stats
+
+        scores = self._score([sentence for _, _, sentence, _ in sentences], query_vector)
+
+        # Every doc keeps its best sentence so each source stays citable
+        kept = set()
+        used = 0.0
+        best_per_doc: Dict[int, int] = {}
+        for i, (doc_idx, _, _, _) in enumerate(sentences):
+            if doc_idx not in best_per_doc or scores[i] > scores[best_per_doc[doc_idx]]:
+                best_per_doc[doc_idx] = i
+        for i in best_per_doc.values():
+            kept.add(i)
+            used += sentences[i][3]
+
+        # Then the highest-scoring sentences overall while they fit
+        for i in np.argsort(-scores):
+            i = int(i)
+            if i in kept:
+                continue
+            if used + sentences[i][3] > token_budget:
+                continue
+            kept.add(i)
+            used += sentences[i][3]
+
+        compressed = []
+        for doc_idx, doc in enumerate(docs):
+            doc_sentences = [(sent_idx, sentence, tokens) for i, (d, sent_idx, sentence, tokens) in enumerate(sentences)
+                             if d == doc_idx and i in kept]
+            if not doc_sentences:
+                compressed.append(doc)
+                continue
+            parts = []
+            previous = -1
+            for sent_idx, sentence, _ in doc_sentences:
+                if sent_idx != previous + 1:
+                    parts.append(GAP_MARKER)
+                parts.append(sentence)
+                previous = sent_idx
+            total_sentences = sum(1 for d, _, _, _ in sentences if d == doc_idx)
+            if previous != total_sentences - 1:
+                parts.append(GAP_MARKER)
+            metadata = dict(doc['metadata'], token_count=int(round(sum(tokens for _, _, tokens in doc_sentences))))
+            compressed.append(dict(doc, content=" ".join(parts), metadata=metadata))
+
+        stats['tokens_after'] = int(round(used))
+        stats['sentences_after'] = len(kept)
+        get_metrics().observe(
+            "context_compression_ratio",
+            used / max(1, tokens_before),
+            buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+            help_text="Fraction of retrieved context tokens kept by compression"
+        )
+        return compressed, stats
+
+    def _score(self, sentences: List[str], query_vector: List[float]) -> np.ndarray:
+        """Cosine similarity of each sentence to the query (one batched encode)"""
+        sentence_vecs = np.asarray(self.encode(sentences), dtype=np.float32)
+        query_vec = np.asarray(query_vector, dtype=np.float32)
+        norms = np.linalg.norm(sentence_vecs, axis=1) * max(np.linalg.norm(query_vec), 1e-12)
+        return sentence_vecs @ query_vec / np.maximum(norms, 1e-12)
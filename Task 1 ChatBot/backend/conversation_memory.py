@@ -1,21 +1,35 @@
 """Conversation memory service using Qdrant"""
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+import threading
+import time
 import uuid
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, FilterSelector
+)
 from sentence_transformers import SentenceTransformer
 from config import settings
+from session_index import SessionIndex
+from qdrant_indexes import ensure_payload_indexes, CONVERSATION_PAYLOAD_INDEXES
 
 class ConversationMemory:
     """Manages conversation history in Qdrant"""
     
     COLLECTION_NAME = "conversation_memory"
+    MAX_WRITE_ATTEMPTS = 3
+    # Seconds before a failed write is retried, doubled after every further failure
+    WRITE_RETRY_BACKOFF = 5.0
     
-    def __init__(self):
-        """Initialize conversation memory service"""
+    def __init__(self, embedding_model: Optional[SentenceTransformer] = None):
+        """
+        Initialize conversation memory service
+        
+        Args:
+            embedding_model: Shared all-MiniLM-L6-v2 model (loads its own if omitted)
+        """
         # Initialize embedding model (same as RAG service)
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.embedding_model = embedding_model or SentenceTransformer('all-MiniLM-L6-v2')
         
         # Initialize Qdrant client
         if settings.qdrant_url:
@@ -25,6 +39,26 @@ class ConversationMemory:
         
         # Ensure collection exists
         self._ensure_collection()
+        
+        # Session/turn index used for history listing
+        self.session_index = SessionIndex()
+        self._backfill_session_index()
+        
+        # Write-behind queue: turns are embedded and upserted in batches by a
+        # background thread. Reads flush the matching pending turns first so a
+        # session always sees its own writes.
+        self._pending: List[Dict[str, Any]] = []
+        self._in_flight: List[Dict[str, Any]] = []
+        self._queue_condition = threading.Condition()
+        self._stopped = False
+        self._writer_thread = None
+        if settings.enable_deferred_memory_writes:
+            self._writer_thread = threading.Thread(
+                target=self._writer_loop,
+                name="conversation-memory-writer",
+                daemon=True
+            )
+            self._writer_thread.start()
     
     def _ensure_collection(self):
         """Create conversation memory collection if it doesn't exist"""
@@ -44,9 +78,41 @@ class ConversationMemory:
                 print(f"✓ Created conversation memory collection: {self.COLLECTION_NAME}")
             else:
                 print(f"✓ Conversation memory collection exists: {self.COLLECTION_NAME}")
+            
+            # Declare (or migrate) indexes for the user/session filters
+            ensure_payload_indexes(self.qdrant_client, self.COLLECTION_NAME, CONVERSATION_PAYLOAD_INDEXES)
         except Exception as e:
             print(f"✗ Error ensuring collection: {e}")
     
+    def _backfill_session_index(self):
+        """Populate an empty session index from existing conversation points"""
+        try:
+            if not self.session_index.is_empty():
+                return
+            
+            total = 0
+            offset = None
+            while True:
+                points, offset = self.qdrant_client.scroll(
+                    collection_name=self.COLLECTION_NAME,
+                    limit=256,
+                    offset=offset,
+                    with_payload=['conversation_id', 'user_id', 'session_id', 'question', 'answer', 'timestamp'],
+                    with_vectors=False
+                )
+                total += self.session_index.record_turns(
+                    {**point.payload, 'conversation_id': point.payload.get('conversation_id') or str(point.id)}
+                    for point in points
+                    if point.payload and point.payload.get('timestamp')
+                )
+                if offset is None:
+                    break
+            
+            if total:
+                print(f"✓ Indexed {total} existing conversation turns for session history")
+        except Exception as e:
+            print(f"⚠ Could not backfill session index: {e}")
+    
     def store_conversation(
         self,
         user_id: str,
@@ -58,6 +124,10 @@ class ConversationMemory:
         """
         Store a conversation turn in Qdrant
         
+        With deferred memory writes enabled the turn is queued and written by
+        the background writer in a batch; reads for the same session flush it
+        first.
+        
         Args:
             user_id: Unique identifier for the user
             session_id: Session identifier (chat ID)
@@ -71,9 +141,6 @@ class ConversationMemory:
         # Create conversation text (combine question and answer for better retrieval)
         conversation_text = f"Q: {question}\nA: {answer}"
         
-        # Generate embedding
-        embedding = self.embedding_model.encode(conversation_text).tolist()
-        
         # Create unique ID
         conversation_id = str(uuid.uuid4())
         
@@ -92,25 +159,169 @@ class ConversationMemory:
         if metadata:
             payload.update(metadata)
         
-        # Create point
-        point = PointStruct(
-            id=conversation_id,
-            vector=embedding,
-            payload=payload
-        )
+        # Index the turn right away so history listing reflects it immediately
+        try:
+            self.session_index.record_turn(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                session_id=session_id,
+                question=question,
+                answer=answer,
+                timestamp=payload['timestamp']
+            )
+        except Exception as e:
+            print(f"⚠ Failed to index conversation turn {conversation_id}: {e}")
+        
+        turn = {'payload': payload, 'attempts': 0}
+        
+        if self._writer_thread is None:
+            # Synchronous mode: embed and upsert before returning
+            self._write_batch([turn], raise_errors=True)
+            return conversation_id
+        
+        with self._queue_condition:
+            self._pending.append(turn)
+            self._queue_condition.notify_all()
+        
+        return conversation_id
+    
+    def _writer_loop(self):
+        """Background thread that drains pending turns in batches"""
+        batch_size = max(1, settings.memory_write_batch_size)
+        flush_interval = max(0.0, settings.memory_flush_interval)
+        
+        while True:
+            with self._queue_condition:
+                while not self._stopped and not self._due_turns():
+                    # Turns waiting to retry a failed write are picked up once due
+                    next_retry = min((turn['retry_at'] for turn in self._pending), default=None)
+                    self._queue_condition.wait(
+                        timeout=None if next_retry is None else max(0.0, next_retry - time.monotonic())
+                    )
+                if not self._pending and self._stopped:
+                    return
+                
+                # Give concurrent requests a short window to join the batch
+                deadline = time.monotonic() + flush_interval
+                while len(self._pending) < batch_size and not self._stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._queue_condition.wait(timeout=remaining)
+                
+                # Retries still backing off stay queued, unless the writer is stopping
+                batch = (self._pending if self._stopped else self._due_turns())[:batch_size]
+                self._pending = [turn for turn in self._pending if all(turn is not taken for taken in batch)]
+                self._in_flight.extend(batch)
+            
+            if batch:
+                self._write_batch(batch)
+                with self._queue_condition:
+                    for turn in batch:
+                        self._in_flight.remove(turn)
+                    self._queue_condition.notify_all()
+    
+    def _write_batch(self, turns: List[Dict[str, Any]], raise_errors: bool = False):
+        """Embed and upsert a batch of conversation turns in one round-trip"""
+        if not turns:
+            return
         
-        # Insert into Qdrant
         try:
+            texts = [turn['payload']['conversation_text'] for turn in turns]
+            embeddings = self.embedding_model.encode(texts)
+            
+            points = [
+                PointStruct(
+                    id=turn['payload']['conversation_id'],
+                    vector=embedding.tolist(),
+                    payload=turn['payload']
+                )
+                for turn, embedding in zip(turns, embeddings)
+            ]
+            
             self.qdrant_client.upsert(
                 collection_name=self.COLLECTION_NAME,
-                points=[point]
+                points=points
             )
-            return conversation_id
+            print(f"  💾 Stored {len(points)} conversation turn(s) in memory")
         except Exception as e:
             print(f"Error upserting conversation to Qdrant: {e}")
             import traceback
             print(traceback.format_exc())
-            raise
+            if raise_errors:
+                raise
+            
+            # Re-queue failed turns a limited number of times, backing off between attempts
+            retry = []
+            for turn in turns:
+                turn['attempts'] += 1
+                if turn['attempts'] < self.MAX_WRITE_ATTEMPTS:
+                    turn['retry_at'] = time.monotonic() + self.WRITE_RETRY_BACKOFF * 2 ** (turn['attempts'] - 1)
+                    retry.append(turn)
+                else:
+                    print(f"✗ Dropping conversation {turn['payload']['conversation_id']} after {turn['attempts']} failed writes")
+            if retry:
+                with self._queue_condition:
+                    self._pending.extend(retry)
+                    self._queue_condition.notify_all()
+    
+    def _due_turns(self) -> List[Dict[str, Any]]:
+        """Pending turns not backing off after a failed write (call with the queue lock held)"""
+        now = time.monotonic()
+        return [turn for turn in self._pending if turn.get('retry_at', 0.0) <= now]
+    
+    def _flush_pending(self, user_id: Optional[str] = None, session_id: Optional[str] = None):
+        """
+        Write pending turns matching the filter before a read (read-your-writes)
+        
+        Matching turns still queued are written synchronously in the caller's
+        thread; matching turns already picked up by the writer are waited on.
+        Turns whose write fails go back to the queue, as in the background
+        writer; turns backing off after a failed write are left to the writer.
+        """
+        def matches(turn: Dict[str, Any]) -> bool:
+            payload = turn['payload']
+            if user_id and payload.get('user_id') != user_id:
+                return False
+            if session_id and payload.get('session_id') != session_id:
+                return False
+            return True
+        
+        with self._queue_condition:
+            batch = [turn for turn in self._due_turns() if matches(turn)]
+            if batch:
+                self._pending = [turn for turn in self._pending if all(turn is not taken for taken in batch)]
+                self._in_flight.extend(batch)
+        
+        if batch:
+            try:
+                # Failures are logged and re-queued; the read goes ahead either way
+                self._write_batch(batch)
+            finally:
+                with self._queue_condition:
+                    for turn in batch:
+                        self._in_flight.remove(turn)
+                    self._queue_condition.notify_all()
+        
+        with self._queue_condition:
+            while any(matches(turn) for turn in self._in_flight):
+                self._queue_condition.wait(timeout=1.0)
+    
+    def flush(self):
+        """Write all pending conversation turns"""
+        self._flush_pending()
+    
+    def close(self):
+        """Flush pending writes and stop the background writer"""
+        if self._writer_thread is None:
+            return
+        with self._queue_condition:
+            self._stopped = True
+            self._queue_condition.notify_all()
+        self._writer_thread.join(timeout=30)
+        self._writer_thread = None
+        # Anything re-queued after the writer exited
+        self._flush_pending()
     
     def get_relevant_conversations(
         self,
@@ -118,7 +329,8 @@ class ConversationMemory:
         user_id: Optional[str] = None,
         session_id: Optional[str] = None,
         limit: int = 5,
-        score_threshold: float = 0.5
+        score_threshold: float = 0.5,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         Retrieve relevant past conversations based on current question
@@ -129,13 +341,18 @@ class ConversationMemory:
             session_id: Filter by session ID (optional)
             limit: Maximum number of conversations to retrieve
             score_threshold: Minimum similarity score (default: 0.5, lower to get more results)
+            query_embedding: Precomputed embedding of current_question (optional)
         
         Returns:
             List of relevant conversations with metadata
         """
         try:
-            # Generate embedding for current question
-            query_embedding = self.embedding_model.encode(current_question).tolist()
+            # Make sure this user's/session's own recent turns are searchable
+            self._flush_pending(user_id=user_id, session_id=session_id)
+            
+            # Generate embedding for current question unless the caller has one
+            if query_embedding is None:
+                query_embedding = self.embedding_model.encode(current_question).tolist()
             
             # Build filter
             query_filter = None
@@ -188,7 +405,8 @@ class ConversationMemory:
     def get_session_history(
         self,
         session_id: str,
-        limit: int = 50
+        limit: int = 50,
+        offset: int = 0
     ) -> List[Dict[str, Any]]:
         """
         Get all conversations in a session (chronological order)
@@ -196,42 +414,22 @@ class ConversationMemory:
         Args:
             session_id: Session identifier
             limit: Maximum number of conversations
+            offset: Number of conversations to skip (for paging)
         
         Returns:
             List of conversations in chronological order
         """
-        # Search with session filter
-        scroll_result = self.qdrant_client.scroll(
-            collection_name=self.COLLECTION_NAME,
-            scroll_filter=Filter(
-                must=[FieldCondition(key="session_id", match=MatchValue(value=session_id))]
-            ),
+        return self.session_index.get_session_history(
+            session_id=session_id,
             limit=limit,
-            with_payload=True,
-            with_vectors=False
+            offset=offset
         )
-        
-        points = scroll_result[0]
-        
-        # Convert to list and sort by timestamp
-        conversations = []
-        for point in points:
-            conversations.append({
-                'conversation_id': point.payload.get('conversation_id'),
-                'question': point.payload.get('question'),
-                'answer': point.payload.get('answer'),
-                'timestamp': point.payload.get('timestamp'),
-            })
-        
-        # Sort by timestamp (oldest first)
-        conversations.sort(key=lambda x: x.get('timestamp', ''))
-        
-        return conversations
     
     def get_recent_sessions(
         self,
         user_id: Optional[str] = None,
-        limit: int = 20
+        limit: int = 20,
+        offset: int = 0
     ) -> List[Dict[str, Any]]:
         """
         Get recent chat sessions with their first question and timestamp
@@ -239,80 +437,41 @@ class ConversationMemory:
         Args:
             user_id: Filter by user ID (optional)
             limit: Maximum number of sessions
+            offset: Number of sessions to skip (for paging)
         
         Returns:
-            List of sessions with metadata
+            List of sessions with metadata, most recently active first
         """
-        # Build filter
-        query_filter = None
-        if user_id:
-            query_filter = Filter(
-                must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))]
-            )
-        
-        # Scroll through all conversations
-        scroll_result = self.qdrant_client.scroll(
-            collection_name=self.COLLECTION_NAME,
-            scroll_filter=query_filter,
-            limit=1000,  # Get many to find unique sessions
-            with_payload=True,
-            with_vectors=False
+        return self.session_index.get_recent_sessions(
+            user_id=user_id,
+            limit=limit,
+            offset=offset
         )
-        
-        points = scroll_result[0]
-        
-        # Group by session_id and get first question for each
-        sessions_dict = {}
-        for point in points:
-            session_id = point.payload.get('session_id')
-            if not session_id:
-                continue
-            
-            timestamp = point.payload.get('timestamp', '')
-            question = point.payload.get('question', '')
-            
-            # If we haven't seen this session, or this is earlier, store it
-            if session_id not in sessions_dict:
-                sessions_dict[session_id] = {
-                    'session_id': session_id,
-                    'title': question[:50] + ('...' if len(question) > 50 else ''),
-                    'timestamp': timestamp,
-                    'user_id': point.payload.get('user_id')
-                }
-            else:
-                # Keep the earliest timestamp
-                if timestamp < sessions_dict[session_id]['timestamp']:
-                    sessions_dict[session_id]['timestamp'] = timestamp
-                    sessions_dict[session_id]['title'] = question[:50] + ('...' if len(question) > 50 else '')
-        
-        # Convert to list and sort by timestamp (newest first)
-        sessions = list(sessions_dict.values())
-        sessions.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-        
-        return sessions[:limit]
     
     def delete_session(self, session_id: str) -> bool:
         """Delete all conversations in a session"""
+        # Drop queued turns so they are not written after the delete
+        with self._queue_condition:
+            self._pending = [
+                turn for turn in self._pending
+                if turn['payload'].get('session_id') != session_id
+            ]
+        self._flush_pending(session_id=session_id)
+        
         try:
-            # Find all points with this session_id
-            scroll_result = self.qdrant_client.scroll(
+            deleted_turns = self.session_index.delete_session(session_id)
+            
+            self.qdrant_client.delete(
                 collection_name=self.COLLECTION_NAME,
-                scroll_filter=Filter(
-                    must=[FieldCondition(key="session_id", match=MatchValue(value=session_id))]
-                ),
-                limit=1000,
-                with_payload=False,
-                with_vectors=False
+                points_selector=FilterSelector(
+                    filter=Filter(
+                        must=[FieldCondition(key="session_id", match=MatchValue(value=session_id))]
+                    )
+                )
             )
             
-            point_ids = [point.id for point in scroll_result[0]]
-            
-            if point_ids:
-                self.qdrant_client.delete(
-                    collection_name=self.COLLECTION_NAME,
-                    points_selector=point_ids
-                )
-                print(f"✓ Deleted {len(point_ids)} conversations for session {session_id}")
+            if deleted_turns:
+                print(f"✓ Deleted {deleted_turns} conversations for session {session_id}")
                 return True
             return False
         except Exception as e:
@@ -0,0 +1,67 @@
+"""Request deadline shared by every stage of a question"""
+import threading
+import time
+from typing import List, Optional
+
+
+class Deadline:
+    """
+    Time budget for one request
+
+    Stages ask how much time is left and size their own timeouts from it, or
+    skip / degrade themselves when too little remains. Degradations are
+    recorded so the response can report them.
+    """
+
+    def __init__(self, budget_seconds: Optional[float]):
+        """
+        Args:
+            budget_seconds: Total time allowed for the request (None = unbounded)
+        """
+        self.budget_seconds = budget_seconds
+        self.expires_at = time.monotonic() + budget_seconds if budget_seconds else None
+        self._degraded: List[str] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None when there is no deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def has(self, seconds: float) -> bool:
+        """Whether at least this many seconds are left"""
+        remaining = self.remaining()
+        return remaining is None or remaining >= seconds
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Timeout for a single operation: the stage's own cap, bounded by the time left"""
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        if cap is None:
+            return remaining
+        return min(cap, remaining)
+
+    def degrade(self, stage: str, reason: str):
+        """Record that a stage was skipped or reduced to fit the budget"""
+        with self._lock:
+            if stage in self._degraded:
+                return
+            self._degraded.append(stage)
+        print(f"  ⏳ Degraded '{stage}': {reason}")
+
+    def cut_short(self, *stages: str) -> bool:
+        """Whether the budget ran out or any of these stages was degraded"""
+        with self._lock:
+            degraded = any(stage in self._degraded for stage in stages)
+        return degraded or self.expired()
+
+    @property
+    def degraded(self) -> List[str]:
+        with self._lock:
+            return list(self._degraded)
@@ -360,6 +360,13 @@ class GenericScraper(BNMScraper):
             if driver:
                 driver.quit()
     
+    def _fetch_job(self, job: dict, headers: dict = None) -> str:
+        """Download an ingestion job's PDF (through the form for form-based sources)"""
+        if self.scraping_strategy == "form_based":
+            # Form submissions cannot be conditional; the content hash still skips unchanged PDFs
+            return self.download_pdf_from_form(job['pdf_info'], job['filename'])
+        return super()._fetch_job(job, headers=headers)
+    
     def scrape_and_store(self, use_selenium: bool = None):
         """Main method to scrape PDFs and store in Qdrant"""
         print(f"Scraping PDFs from: {self.base_url} (Strategy: {self.scraping_strategy})")
@@ -597,61 +604,32 @@ class GenericScraper(BNMScraper):
             print("="*60 + "\n")
             return
         
-        # Process each PDF
+        # Queue every PDF for the ingestion pipeline
+        jobs = []
         for idx, pdf_info in enumerate(pdf_links, 1):
-            try:
-                print(f"\n[{idx}/{len(pdf_links)}] Processing: {pdf_info.get('text', 'Unknown')}")
-                
-                # Generate filename
-                title = pdf_info.get('text', 'Untitled')
-                url = pdf_info.get('url', '')
-                
-                # Verify URL is valid before processing
-                if not url or url.strip() in ['', 'about:blank', '#']:
-                    print(f"  ⚠ Skipping invalid URL: {url}")
-                    continue
-                
-                if not url.startswith(('http://', 'https://')):
-                    print(f"  ⚠ Skipping non-HTTP URL: {url}")
-                    continue
-                
-                filename = self.sanitize_filename(url, title)
-                
-                # Download PDF
-                if self.scraping_strategy == "form_based":
-                    filepath = self.download_pdf_from_form(pdf_info, filename)
-                else:
-                    # Verify URL is valid before downloading
-                    if url.startswith(('http://', 'https://')):
-                        filepath = self.download_pdf(url, filename)
-                    else:
-                        print(f"  ⚠ Skipping invalid URL: {url}")
-                        continue
-                
-                # Extract text with page numbers and store
-                page_texts = self.extract_text_with_pages(filepath)
-                if page_texts:
-                    # Chunk text with page tracking
-                    chunked_data = self.chunk_text_with_pages(page_texts)
-                    if chunked_data:
-                        self.store_in_qdrant(
-                            pdf_url=url,
-                            pdf_title=title,
-                            text_chunks=chunked_data,  # Pass list of dicts with 'text' and 'page_number'
-                            filepath=filepath,
-                            date=pdf_info.get('date', ''),
-                            doc_type=pdf_info.get('type', '')
-                        )
-                        print(f"  ✓ Stored {len(chunked_data)} chunks with page numbers")
-                    else:
-                        print(f"  ⚠ No chunks created from PDF")
-                else:
-                    print(f"  ⚠ No text extracted from PDF")
-                    
-            except Exception as e:
-                print(f"  ✗ Error processing PDF: {e}")
-                import traceback
-                traceback.print_exc()
+            print(f"\n[{idx}/{len(pdf_links)}] Queued: {pdf_info.get('text', 'Unknown')}")
+            
+            title = pdf_info.get('text', 'Untitled')
+            url = pdf_info.get('url', '')
+            
+            # Verify URL is valid before processing
+            if not url or url.strip() in ['', 'about:blank', '#']:
+                print(f"  ⚠ Skipping invalid URL: {url}")
+                continue
+            
+            if not url.startswith(('http://', 'https://')):
+                print(f"  ⚠ Skipping non-HTTP URL: {url}")
                 continue
+            
+            jobs.append({
+                'url': url,
+                'title': title,
+                'filename': self.sanitize_filename(url, title),
+                'meta': {'date': pdf_info.get('date', ''), 'doc_type': pdf_info.get('type', '')},
+                'pdf_info': pdf_info
+            })
+        
+        # Form downloads each drive a browser, so fetch those one at a time
+        self.ingest(jobs, workers={'fetch': 1} if self.scraping_strategy == "form_based" else None)
         
         print(f"\n[SUCCESS] Collection name: {self.collection_name}")
\ No newline at end of file
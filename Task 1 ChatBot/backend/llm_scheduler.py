@@ -0,0 +1,194 @@
+"""
+Admission control for LLM calls.
+Limits concurrent generations, queues the rest by priority and rejects
+early when the queue is full or a request has waited too long.
+"""
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from metrics import get_metrics
+
+
+# Lower rank is served first
+PRIORITY_RANKS = {
+    'interactive': 0,
+    'batch': 1,
+}
+
+
+class LLMSaturatedError(Exception):
+    """Raised when an LLM request cannot be admitted"""
+
+    def __init__(self, message: str, status_code: int, queue_position: int, retry_after: int):
+        """
+        Args:
+            message: Human-readable reason
+            status_code: 429 when the queue is full, 503 when the wait timed out
+            queue_position: Position in the queue (1 = next to run)
+            retry_after: Suggested seconds before retrying
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.queue_position = queue_position
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    """
+    Bounded-concurrency gate in front of the LLM
+
+    At most ``max_concurrent`` generations run at once. Further requests wait
+    in a priority queue (interactive before batch, FIFO within a class) of at
+    most ``max_queue_size`` entries, for at most ``queue_timeout`` seconds.
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_queue_size: int = 32, queue_timeout: float = 60.0):
+        """
+        Args:
+            max_concurrent: Generations allowed to run at the same time
+            max_queue_size: Requests allowed to wait; more are rejected with 429
+            queue_timeout: Seconds a request may wait before it is rejected with 503
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue_size = max_queue_size
+        self.queue_timeout = queue_timeout
+
+        self._condition = threading.Condition()
+        self._active = 0
+        self._waiting = []  # heap of (rank, sequence)
+        self._sequence = itertools.count()
+        self._service_times = deque(maxlen=50)  # Recent generation durations in seconds
+        self._metrics = get_metrics()
+
+    @contextmanager
+    def slot(self, priority: str = 'interactive', timeout: Optional[float] = None) -> Iterator[float]:
+        """
+        Hold a generation slot for the duration of the block
+
+        Args:
+            priority: 'interactive' or 'batch'
+            timeout: Maximum queue wait (default: queue_timeout)
+
+        Yields:
+            Seconds spent waiting in the queue
+
+        Raises:
+            LLMSaturatedError: If the request is not admitted
+        """
+        waited = self._acquire(priority, self.queue_timeout if timeout is None else min(timeout, self.queue_timeout))
+        started = time.perf_counter()
+        try:
+            yield waited
+        finally:
+            self._release(time.perf_counter() - started)
+
+    def _acquire(self, priority: str, queue_timeout: float) -> float:
+        if priority not in PRIORITY_RANKS:
+            priority = 'interactive'
+        labels = {'priority': priority}
+        enqueued = time.perf_counter()
+
+        with self._condition:
+            # Fast path: free slot and nobody ahead
+            if self._active < self.max_concurrent and not self._waiting:
+                self._active += 1
+                self._update_gauges()
+                self._metrics.observe("llm_queue_wait_seconds", 0.0, labels, "Time spent waiting for an LLM slot")
+                return 0.0
+
+            if len(self._waiting) >= self.max_queue_size:
+                position = len(self._waiting) + 1
+                self._metrics.inc("llm_requests_rejected_total", labels={**labels, 'reason': 'queue_full'},
+                                  help_text="LLM requests rejected by admission control")
+                raise LLMSaturatedError(
+                    f"LLM queue is full ({len(self._waiting)} waiting)",
+                    status_code=429,
+                    queue_position=position,
+                    retry_after=self._estimate_wait(position)
+                )
+
+            entry = (PRIORITY_RANKS[priority], next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            self._update_gauges()
+            deadline = enqueued + queue_timeout
+            try:
+                while not (self._waiting[0] == entry and self._active < self.max_concurrent):
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        position = self._position(entry)
+                        self._metrics.inc("llm_requests_rejected_total", labels={**labels, 'reason': 'wait_timeout'},
+                                          help_text="LLM requests rejected by admission control")
+                        raise LLMSaturatedError(
+                            f"Timed out after {queue_timeout:.0f}s waiting for the LLM (queue position {position})",
+                            status_code=503,
+                            queue_position=position,
+                            retry_after=self._estimate_wait(position)
+                        )
+                    self._condition.wait(remaining)
+                heapq.heappop(self._waiting)
+                self._active += 1
+            finally:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                self._update_gauges()
+                # The next waiter may be able to run now
+                self._condition.notify_all()
+
+        waited = time.perf_counter() - enqueued
+        self._metrics.observe("llm_queue_wait_seconds", waited, labels, "Time spent waiting for an LLM slot")
+        return waited
+
+    def _release(self, service_time: float):
+        with self._condition:
+            self._active -= 1
+            self._service_times.append(service_time)
+            self._update_gauges()
+            self._condition.notify_all()
+        self._metrics.observe("llm_generation_seconds", service_time, help_text="Time spent in LLM generation")
+
+    def _position(self, entry) -> int:
+        """1-based queue position of a waiting entry"""
+        return 1 + sum(1 for other in self._waiting if other < entry)
+
+    def _estimate_wait(self, position: int) -> int:
+        """Seconds until a request at this position would likely get a slot"""
+        average = sum(self._service_times) / len(self._service_times) if self._service_times else 10.0
+        return max(1, int(math.ceil(average * position / self.max_concurrent)))
+
+    def _update_gauges(self):
+        self._metrics.set_gauge("llm_in_flight", self._active, help_text="LLM generations currently running")
+        self._metrics.set_gauge("llm_queue_depth", len(self._waiting), help_text="LLM requests waiting for a slot")
+
+    def get_stats(self) -> dict:
+        """Current scheduler state"""
+        with self._condition:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue_size': self.max_queue_size,
+                'in_flight': self._active,
+                'queued': len(self._waiting),
+            }
+
+
+# Global LLM scheduler instance
+_llm_scheduler: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Get or create the global LLM scheduler"""
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        from config import settings
+        _llm_scheduler = LLMScheduler(
+            max_concurrent=settings.llm_max_concurrency,
+            max_queue_size=settings.llm_max_queue_size,
+            queue_timeout=settings.llm_queue_timeout
+        )
+    return _llm_scheduler
@@ -2,8 +2,8 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse
+from typing import Any, Dict, List, Optional
 import traceback
 import sys
 import uuid
@@ -23,10 +23,12 @@ from pydantic import BaseModel, Field
 from audit_logging import get_audit_logger
 from rag_service import RAGService
 from conversation_memory import ConversationMemory
+from llm_scheduler import LLMSaturatedError
+from metrics import get_metrics
 from config import settings
 from scraper_config import (
     add_custom_source, delete_custom_source, 
-    get_source, get_all_sources, update_custom_source
+    get_source, get_all_sources, update_custom_source, get_chunking_config
 )
 from scheduler_service import (
     add_schedule, update_schedule, delete_schedule, get_all_schedules,
@@ -45,7 +47,8 @@ scraper_status = {
     "status_message": "Idle",
     "last_run": None,
     "last_success": None,
-    "error": None
+    "error": None,
+    "stage_progress": None
 }
 
 # Thread pool for background scraper jobs
@@ -80,8 +83,12 @@ async def lifespan(app: FastAPI):
     
     yield
     
-    # Shutdown (if needed)
-    # Cleanup code can go here
+    # Shutdown: write any queued conversation turns
+    if conversation_memory:
+        try:
+            conversation_memory.close()
+        except Exception as e:
+            print(f"Failed to flush conversation memory: {e}")
 
 
 # Initialize FastAPI app with lifespan
@@ -170,6 +177,12 @@ async def get_cache_stats():
         }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics_endpoint():
+    """Backend metrics (LLM queue wait, in-flight generations, rejections) in Prometheus text format"""
+    return PlainTextResponse(get_metrics().render())
+
+
 @app.post("/cache/clear")
 async def clear_cache():
     """Clear all caches"""
@@ -197,6 +210,12 @@ async def ask_question(request: QuestionRequest):
     - **collections**: Which collections to search (default: all)
     - **max_results**: Maximum number of references (default: 5)
     - **min_score**: Minimum similarity score threshold (default: 0.5)
+    - **priority**: LLM scheduling priority, 'interactive' or 'batch' (default: interactive)
+    - **timeout_ms**: End-to-end time budget; stages that don't fit are skipped
+      or reduced and listed in degraded_stages (default: server setting)
+    
+    Returns 429 (queue full) or 503 (queue wait timed out) with a Retry-After
+    header when the LLM is saturated.
     """
     if not rag_service:
         raise HTTPException(
@@ -236,15 +255,23 @@ async def ask_question(request: QuestionRequest):
                     converted_collections.append(col)
             request.collections = converted_collections if converted_collections else [CollectionType.ALL]
         
-        # Call RAG service with conversation memory
-        result = rag_service.ask_question(
-            question=request.question,
-            collections=request.collections,
-            max_results=request.max_results,
-            min_score=request.min_score,
-            user_id=request.user_id,
-            session_id=request.session_id,
-            use_memory=True
+        # Call RAG service with conversation memory. It blocks (embedding, Qdrant,
+        # waiting for an LLM slot), so run it off the event loop.
+        priority = request.priority.value if request.priority else "interactive"
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(
+            None,
+            lambda: rag_service.ask_question(
+                question=request.question,
+                collections=request.collections,
+                max_results=request.max_results,
+                min_score=request.min_score,
+                user_id=request.user_id,
+                session_id=request.session_id,
+                use_memory=True,
+                priority=priority,
+                timeout_ms=request.timeout_ms
+            )
         )
         
         # Calculate response time
@@ -259,11 +286,24 @@ async def ask_question(request: QuestionRequest):
             collections_searched=result['collections_searched'],
             failed_collections=result.get('failed_collections'),
             citation_map=result.get('citation_map'),
-            response_time_ms=response_time_ms
+            response_time_ms=response_time_ms,
+            stage_timings=result.get('stage_timings'),
+            model_route=result.get('model_route'),
+            degraded_stages=result.get('degraded_stages')
         )
         
         return response
     
+    except LLMSaturatedError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail={
+                "message": str(e),
+                "queue_position": e.queue_position,
+                "retry_after": e.retry_after
+            },
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -513,7 +553,8 @@ async def test_token():
                 "message": "Ollama connection ready",
                 "ollama_url": ollama_llm.base_url,
                 "chat_url": ollama_llm.chat_url,
-                "model": ollama_llm.model
+                "model": ollama_llm.model,
+                "backends": ollama_llm.pool.get_stats()
             }
         # Check if using API Gateway (deprecated)
         elif hasattr(rag_service.llm, 'api_gateway_llm'):
@@ -588,8 +629,17 @@ async def test_chat(request: dict):
         }
 
 
-def run_scraper(source: str, use_selenium: bool = False):
-    """Run scraper in background thread"""
+def _update_stage_progress(stage_progress: Dict[str, Any]):
+    """Ingestion pipeline progress callback"""
+    scraper_status["stage_progress"] = stage_progress
+
+
+def run_scraper(source: str, use_selenium: bool = False, force: bool = False):
+    """Run scraper in background thread
+    
+    Args:
+        force: Re-ingest every document, even if unchanged since the last run
+    """
     global scraper_status
     
     try:
@@ -598,6 +648,7 @@ def run_scraper(source: str, use_selenium: bool = False):
         scraper_status["progress"] = 0.0
         scraper_status["status_message"] = f"Starting {source} scraper..."
         scraper_status["error"] = None
+        scraper_status["stage_progress"] = None
         
         # Add Web-Scraper to path
         scraper_path = Path(__file__).parent.parent / "Web-Scraper"
@@ -673,6 +724,9 @@ def run_scraper(source: str, use_selenium: bool = False):
                     form_button_selector=source_config.get("form_button_selector")
                 )
             
+            scraper.progress_callback = _update_stage_progress
+            scraper.force_rescrape = force
+            scraper.chunking = get_chunking_config(source) or scraper.chunking
             scraper.scrape_and_store(use_selenium=use_selenium)
             scraper_status["progress"] = 1.0
             
@@ -724,6 +778,9 @@ def run_scraper(source: str, use_selenium: bool = False):
                         qdrant_path=qdrant_path
                     )
                 
+                scraper.progress_callback = _update_stage_progress
+                scraper.force_rescrape = force
+                scraper.chunking = get_chunking_config(source_id) or scraper.chunking
                 scraper.scrape_and_store(use_selenium=use_selenium)
                 scraper_status["progress"] = current_source / total_sources
         else:
@@ -742,6 +799,7 @@ def run_scraper(source: str, use_selenium: bool = False):
         scraper_status["is_running"] = False
         scraper_status["current_job"] = None
         scraper_status["progress"] = None
+        scraper_status["stage_progress"] = None
         scraper_status["last_run"] = datetime.now()
 
 
@@ -755,7 +813,8 @@ async def get_scraper_status():
         status_message=scraper_status["status_message"],
         last_run=scraper_status["last_run"],
         last_success=scraper_status["last_success"],
-        error=scraper_status["error"]
+        error=scraper_status["error"],
+        stage_progress=scraper_status["stage_progress"]
     )
 
 
@@ -781,7 +840,7 @@ async def start_scraper_job(request: ScraperJobRequest):
     job_id = str(uuid.uuid4())
     
     # Submit to thread pool
-    executor.submit(run_scraper, request.source, request.use_selenium)
+    executor.submit(run_scraper, request.source, request.use_selenium, request.force)
     
     return ScraperJobResponse(
         job_id=job_id,
@@ -1150,7 +1209,8 @@ async def get_audit_statistics():
 @app.get("/conversations/recent")
 async def get_recent_conversations(
     user_id: Optional[str] = None,
-    limit: int = 20
+    limit: int = 20,
+    offset: int = 0
 ):
     """Get recent chat sessions"""
     if not conversation_memory:
@@ -1162,7 +1222,8 @@ async def get_recent_conversations(
     try:
         sessions = conversation_memory.get_recent_sessions(
             user_id=user_id,
-            limit=limit
+            limit=limit,
+            offset=offset
         )
         return {"sessions": sessions}
     except Exception as e:
@@ -1173,7 +1234,7 @@ async def get_recent_conversations(
 
 
 @app.get("/conversations/{session_id}")
-async def get_session_conversations(session_id: str):
+async def get_session_conversations(session_id: str, limit: int = 50, offset: int = 0):
     """Get all conversations in a session"""
     if not conversation_memory:
         raise HTTPException(
@@ -1182,7 +1243,11 @@ async def get_session_conversations(session_id: str):
         )
     
     try:
-        conversations = conversation_memory.get_session_history(session_id)
+        conversations = conversation_memory.get_session_history(
+            session_id,
+            limit=limit,
+            offset=offset
+        )
         return {"conversations": conversations}
     except Exception as e:
         raise HTTPException(
@@ -0,0 +1,129 @@
+"""
+In-process metrics for the backend.
+Counters, gauges and histograms rendered in the Prometheus text format.
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+# Default histogram buckets in seconds (queue waits and LLM calls)
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class _Histogram:
+    """Cumulative-bucket histogram for one label set"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.total += value
+
+
+class MetricsRegistry:
+    """Thread-safe registry of named metrics"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.help: Dict[str, Tuple[str, str]] = {}  # name -> (type, help text)
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self.histogram_buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def _declare(self, name: str, metric_type: str, help_text: str):
+        if name not in self.help:
+            self.help[name] = (metric_type, help_text)
+
+    def inc(self, name: str, amount: float = 1.0, labels: Optional[Dict[str, str]] = None, help_text: str = ""):
+        """Increment a counter"""
+        with self.lock:
+            self._declare(name, "counter", help_text)
+            series = self.counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0.0) + amount
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None, help_text: str = ""):
+        """Set a gauge to a value"""
+        with self.lock:
+            self._declare(name, "gauge", help_text)
+            self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        labels: Optional[Dict[str, str]] = None,
+        help_text: str = "",
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        """Record a value in a histogram"""
+        with self.lock:
+            self._declare(name, "histogram", help_text)
+            buckets = self.histogram_buckets.setdefault(name, buckets)
+            series = self.histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = _Histogram(buckets)
+            series[key].observe(value)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self.lock:
+            for name in sorted(self.help):
+                metric_type, help_text = self.help[name]
+                if help_text:
+                    lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+
+                if metric_type == "histogram":
+                    for key, histogram in self.histograms.get(name, {}).items():
+                        cumulative = 0
+                        for bound, count in zip(histogram.buckets, histogram.counts):
+                            cumulative += count
+                            lines.append(f"{name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                        lines.append(f"{name}_sum{_format_labels(key)} {histogram.total}")
+                        lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+                else:
+                    series = self.counters if metric_type == "counter" else self.gauges
+                    for key, value in series.get(name, {}).items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry
+_metrics: Optional[MetricsRegistry] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Get or create the global metrics registry"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry()
+    return _metrics
@@ -0,0 +1,80 @@
+"""
+Small/large model routing for answer generation.
+Short factoid questions answered by one strong source go to a small, fast
+model; everything else (and any small-model answer that fails the citation
+checks) goes to the large model.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+
+
+SMALL_ROUTE = "small"
+LARGE_ROUTE = "large"
+
+# Words that signal explanation, comparison or synthesis rather than a lookup
+SYNTHESIS_WORDS = (
+    'why', 'how', 'explain', 'describe', 'compare', 'comparison', 'difference',
+    'differ', 'versus', 'vs', 'analyse', 'analyze', 'discuss', 'evaluate',
+    'summarize', 'summarise', 'implications', 'relationship', 'pros', 'cons',
+)
+
+
+def is_complex_query(query: str) -> bool:
+    """Retrieval heuristic: long or open-ended questions get a wider candidate pool"""
+    query_length = len(query.split())
+    return query_length > 10 or '?' in query or any(
+        word in query.lower() for word in ['what', 'how', 'why', 'explain', 'describe']
+    )
+
+
+def choose_model_route(question: str, retrieved_docs: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """
+    Decide which model should answer
+
+    Args:
+        question: The user's question
+        retrieved_docs: Documents retrieved for the question (best first)
+
+    Returns:
+        Tuple of (route, reason) where route is SMALL_ROUTE or LARGE_ROUTE
+    """
+    words = [word.strip('?.,!:;"\'()').lower() for word in question.split()]
+    if len(words) > settings.cascade_max_question_words:
+        return LARGE_ROUTE, f"question has {len(words)} words"
+
+    synthesis = [word for word in words if word in SYNTHESIS_WORDS]
+    if synthesis:
+        return LARGE_ROUTE, f"synthesis question ('{synthesis[0]}')"
+
+    if not retrieved_docs:
+        return LARGE_ROUTE, "no sources"
+
+    scores = sorted((doc.get('similarity_score', 0.0) for doc in retrieved_docs), reverse=True)
+    if scores[0] < settings.cascade_min_top_score:
+        return LARGE_ROUTE, f"top source score {scores[0]:.2f} < {settings.cascade_min_top_score}"
+
+    # One clear winner: the runner-up is well behind the top source
+    strong_sources = [score for score in scores if score >= scores[0] - settings.cascade_score_margin]
+    if len(strong_sources) > 1:
+        return LARGE_ROUTE, f"{len(strong_sources)} sources within {settings.cascade_score_margin} of the top score"
+
+    return SMALL_ROUTE, f"factoid question, one strong source ({scores[0]:.2f})"
+
+
+def check_citations(generation: Dict[str, Any], citation_map: Dict[int, int]) -> Optional[str]:
+    """
+    Validate a generated answer before accepting it from the small model
+
+    Returns:
+        None if the answer passes, otherwise the failure reason
+    """
+    if not generation or not generation.get('success'):
+        return "generation_error"
+
+    cited = {int(num) for num in generation.get('cited_numbers', set()) if str(num).isdigit()}
+    if not cited:
+        return "no_citations"
+    if any(num not in citation_map for num in cited):
+        return "invalid_citation"
+    return None
@@ -13,6 +13,12 @@ class CollectionType(str, Enum):
     ALL = "all"
 
 
+class RequestPriority(str, Enum):
+    """Scheduling class for LLM generation"""
+    INTERACTIVE = "interactive"  # Chat users, served first
+    BATCH = "batch"  # Evaluation and bulk jobs
+
+
 class SourceReference(BaseModel):
     """Reference to a source document chunk"""
     pdf_title: str = Field(..., description="Title of the PDF document")
@@ -28,6 +34,7 @@ class SourceReference(BaseModel):
     resolution_number: Optional[str] = Field(None, description="Resolution number (for resolutions)")
     source: Optional[str] = Field(None, description="Source collection name")
     retrieved_at: Optional[str] = Field(None, description="Timestamp when this source was retrieved (ISO format)")
+    duplicate_sources: Optional[List[Dict[str, Any]]] = Field(None, description="Other documents containing the same passage (pdf_title, pdf_url, page_number)")
 
 
 class QuestionRequest(BaseModel):
@@ -57,6 +64,16 @@ class QuestionRequest(BaseModel):
         default=None,
         description="Session identifier (chat ID) for conversation memory"
     )
+    priority: Optional[RequestPriority] = Field(
+        default=RequestPriority.INTERACTIVE,
+        description="LLM scheduling priority: 'interactive' (default) or 'batch'"
+    )
+    timeout_ms: Optional[int] = Field(
+        default=None,
+        ge=1000,
+        le=600000,
+        description="End-to-end time budget in milliseconds (default: server setting)"
+    )
 
 
 class QuestionResponse(BaseModel):
@@ -69,6 +86,9 @@ class QuestionResponse(BaseModel):
     failed_collections: Optional[List[str]] = Field(None, description="Collections that failed to search (if any)")
     citation_map: Optional[Dict[int, int]] = Field(None, description="Map of citation numbers to reference indices (1-indexed citation to 0-indexed reference)")
     response_time_ms: Optional[int] = Field(None, description="Response time in milliseconds")
+    stage_timings: Optional[Dict[str, float]] = Field(None, description="Wall-clock time per request stage in milliseconds")
+    model_route: Optional[str] = Field(None, description="Model that answered: 'small', 'large' or 'escalated' (small, then large)")
+    degraded_stages: Optional[List[str]] = Field(None, description="Stages skipped or reduced to meet the time budget (if any)")
 
 
 class HealthResponse(BaseModel):
@@ -127,12 +147,14 @@ class ScraperStatus(BaseModel):
     last_run: Optional[datetime] = None
     last_success: Optional[datetime] = None
     error: Optional[str] = None
+    stage_progress: Optional[Dict[str, Any]] = None  # Ingestion pipeline: documents active/done/failed per stage
 
 
 class ScraperJobRequest(BaseModel):
     """Request to start a scraper job"""
     source: str = Field(..., description="Source to scrape: 'bnm', 'iifa', 'sc', or 'all'")
     use_selenium: bool = Field(default=False, description="Use Selenium for JavaScript rendering")
+    force: bool = Field(default=False, description="Re-ingest every document, even if unchanged since the last run")
 
 
 class ScraperJobResponse(BaseModel):
@@ -1,90 +1,290 @@
 """Direct Ollama LLM client"""
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from ollama_pool import OllamaPool, parse_backend_urls
+from typing import Optional, Dict, Any, List
 import json
-import pprint
-import copy
+import math
+import random
+import time
 
 
 class OllamaLLM:
     """LLM client that connects directly to Ollama"""
     
+    # Allowed num_ctx sizes. Ollama reloads the model whenever num_ctx changes,
+    # so prompts are bucketed into a few sizes instead of using exact values.
+    CONTEXT_BUCKETS = (2048, 4096, 8192, 16384, 32768)
+    
+    # Conservative characters-per-token estimate used to size num_ctx
+    CHARS_PER_TOKEN = 3.0
+    
+    # Retry backoff: base * 2^(attempt-1) seconds with full jitter, capped
+    RETRY_BACKOFF_BASE = 1.0
+    RETRY_BACKOFF_MAX = 16.0
+    
     def __init__(
         self,
         base_url: str,
-        model: str = "phi4:14b"
+        model: str = "phi4:14b",
+        keep_alive: Optional[str] = "30m",
+        num_predict: Optional[int] = 1024,
+        min_num_ctx: int = 2048,
+        max_num_ctx: int = 16384,
+        pool_size: int = 10,
+        request_timeout: float = 120.0,
+        debug_logging: bool = False,
+        health_check_interval: float = 15.0,
+        failure_threshold: int = 3,
+        ejection_seconds: float = 30.0,
+        sticky_sessions: bool = True
     ):
         """
         Initialize Ollama LLM client
         
         Args:
-            base_url: Base URL for Ollama (e.g., http://localhost:11434)
+            base_url: Base URL for Ollama (e.g., http://localhost:11434), or several
+                comma-separated URLs to spread requests across backends
             model: Model name to use (default: phi4:14b)
+            keep_alive: How long Ollama keeps the model loaded after a request (e.g. "30m", "-1")
+            num_predict: Cap on generated tokens per request (None = Ollama default)
+            min_num_ctx: Smallest context window requested
+            max_num_ctx: Largest context window requested
+            pool_size: Maximum pooled keep-alive connections to Ollama
+            request_timeout: Timeout per HTTP request in seconds
+            debug_logging: Dump full request/response payloads
+            health_check_interval: Seconds between backend health checks
+            failure_threshold: Consecutive failures before a backend is ejected
+            ejection_seconds: How long an ejected backend gets no traffic
+            sticky_sessions: Keep a conversation on the same backend
         """
-        # Ensure base_url ends with /
-        if not base_url.endswith('/'):
-            base_url += '/'
+        backend_urls = parse_backend_urls(base_url)
+        if not backend_urls:
+            raise ValueError("No Ollama URL configured")
         
-        self.base_url = base_url
-        self.chat_url = f"{base_url}api/chat"
+        # First backend, kept for display and single-backend callers
+        self.base_url = backend_urls[0]
+        self.chat_url = f"{self.base_url}api/chat"
         self.model = model
+        self.keep_alive = keep_alive
+        self.num_predict = num_predict
+        self.min_num_ctx = min_num_ctx
+        self.max_num_ctx = max_num_ctx
+        self.request_timeout = request_timeout
+        self.debug_logging = debug_logging
+        
+        # Pooled HTTP session: reuses TCP connections across requests and threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(backend_urls), pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        
+        # Least-loaded routing across backends (a pool of one for a single URL)
+        self.pool = OllamaPool(
+            backend_urls,
+            health_check_interval=health_check_interval,
+            failure_threshold=failure_threshold,
+            ejection_seconds=ejection_seconds,
+            sticky_sessions=sticky_sessions,
+            session=self.session
+        )
         
         # Test connection
-        print(f"  Connecting to Ollama at: {self.base_url}")
-        try:
-            # Simple health check - try to list models
-            health_url = f"{base_url}api/tags"
-            response = requests.get(health_url, timeout=5)
-            if response.status_code == 200:
-                print(f"  ✓ Connected to Ollama successfully")
-            else:
-                print(f"  ⚠ Ollama health check returned status {response.status_code}")
-        except Exception as e:
-            print(f"  ⚠ Could not verify Ollama connection: {e}")
-            print(f"  Will attempt to use Ollama anyway")
+        for backend in self.pool.backends:
+            print(f"  Connecting to Ollama at: {backend.base_url}")
+            try:
+                # Simple health check - try to list models
+                response = self.session.get(f"{backend.base_url}api/tags", timeout=5)
+                if response.status_code == 200:
+                    print(f"  ✓ Connected to Ollama successfully")
+                else:
+                    print(f"  ⚠ Ollama health check returned status {response.status_code}")
+            except Exception as e:
+                print(f"  ⚠ Could not verify Ollama connection: {e}")
+                print(f"  Will attempt to use Ollama anyway")
+    
+    def warm_up(self, model: Optional[str] = None, prompt_tokens: Optional[int] = None) -> Optional[float]:
+        """
+        Load the model into memory on every backend ahead of the first question
+        
+        A chat request with no messages makes Ollama load the model (and apply
+        keep_alive) without generating anything. Ollama reloads the model when
+        num_ctx changes, so it is loaded with the context window that prompts
+        of ``prompt_tokens`` tokens will request.
+        
+        Args:
+            model: Model to load instead of the configured one (optional)
+            prompt_tokens: Typical prompt size in tokens (default: use max_num_ctx)
+        
+        Returns:
+            Seconds taken by the slowest backend, or None if every warm-up failed
+        """
+        model = model or self.model
+        payload = {
+            "model": model,
+            "messages": [],
+            "stream": False,
+            "options": {"num_ctx": self._build_options([], prompt_tokens)["num_ctx"] if prompt_tokens else self.max_num_ctx}
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        
+        slowest = None
+        for backend in self.pool.backends:
+            start = time.perf_counter()
+            try:
+                response = self.session.post(backend.chat_url, json=payload, timeout=self.request_timeout)
+                response.raise_for_status()
+                elapsed = time.perf_counter() - start
+                print(f"  ✓ Warmed up Ollama model {model} on {backend.base_url} in {elapsed:.1f}s (keep_alive: {self.keep_alive})")
+                slowest = max(slowest or 0.0, elapsed)
+            except Exception as e:
+                print(f"  ⚠ Ollama warm-up failed on {backend.base_url}: {e}")
+        return slowest
     
-    def invoke(self, prompt: str, max_retries: int = 2) -> str:
+    def has_model(self, model: str) -> Optional[bool]:
+        """
+        Whether every backend has the model pulled (checked against /api/tags)
+        
+        Returns:
+            True/False, or None if no backend could be asked
+        """
+        # Ollama lists untagged models as "name:latest"
+        wanted = model if ':' in model else f"{model}:latest"
+        answered = False
+        for backend in self.pool.backends:
+            try:
+                response = self.session.get(f"{backend.base_url}api/tags", timeout=5)
+                response.raise_for_status()
+                names = {m.get("name") for m in response.json().get("models", [])}
+            except Exception as e:
+                print(f"  ⚠ Could not list Ollama models on {backend.base_url}: {e}")
+                continue
+            answered = True
+            if wanted not in names:
+                print(f"  ⚠ Ollama model {model} is not pulled on {backend.base_url}")
+                return False
+        return True if answered else None
+    
+    def estimate_tokens(self, text: str) -> int:
+        """Rough token count for sizing the context window"""
+        return int(math.ceil(len(text) / self.CHARS_PER_TOKEN))
+    
+    def _build_options(self, messages: List[Dict[str, str]], prompt_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Generation options sized from the actual prompt (its token count when the caller knows it)"""
+        if prompt_tokens is None:
+            prompt_tokens = sum(self.estimate_tokens(msg.get("content", "")) for msg in messages)
+        # Room for the answer plus chat-template overhead
+        needed = prompt_tokens + (self.num_predict or 1024) + 256
+        
+        num_ctx = self.max_num_ctx
+        for bucket in self.CONTEXT_BUCKETS:
+            if self.min_num_ctx <= bucket <= self.max_num_ctx and bucket >= needed:
+                num_ctx = bucket
+                break
+        num_ctx = max(num_ctx, self.min_num_ctx)
+        
+        if needed > num_ctx:
+            print(f"  ⚠ Prompt needs ~{needed} tokens but num_ctx is capped at {num_ctx}; Ollama will truncate the oldest tokens")
+        
+        options: Dict[str, Any] = {"num_ctx": num_ctx}
+        if self.num_predict:
+            options["num_predict"] = self.num_predict
+        return options
+    
+    def invoke(
+        self,
+        prompt: str,
+        max_retries: int = 2,
+        session_key: Optional[str] = None,
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        system: Optional[str] = None,
+        prompt_tokens: Optional[int] = None
+    ) -> str:
         """
         Invoke the LLM with a prompt
         
         Args:
             prompt: The prompt/question to send to the LLM
             max_retries: Maximum number of retry attempts for transient errors
+            session_key: Conversation key for sticky backend routing (optional)
+            model: Model to use instead of the configured one (optional)
+            timeout: Total seconds for the call including retries (optional)
+            system: System message; prompt is then sent as the user message (optional)
+            prompt_tokens: Known prompt size in tokens, for sizing num_ctx (optional)
             
         Returns:
             The LLM's response text
         """
-        response_text, _ = self.invoke_with_metadata(prompt, max_retries)
+        response_text, _ = self.invoke_with_metadata(prompt, max_retries, session_key, model, timeout, system,
+                                                     prompt_tokens)
         return response_text
     
-    def invoke_with_metadata(self, prompt: str, max_retries: int = 2):
+    def invoke_with_metadata(
+        self,
+        prompt: str,
+        max_retries: int = 2,
+        session_key: Optional[str] = None,
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        system: Optional[str] = None,
+        prompt_tokens: Optional[int] = None
+    ):
         """
         Invoke the LLM with a prompt and return both content and raw response
         
+        Each attempt is routed to the least-loaded healthy backend, so a retry
+        after a backend failure usually lands on a different backend.
+        With ``timeout``, attempts and backoff share that budget: each request
+        gets at most the time left and no retry starts once it is spent.
+        Without ``system`` the prompt is split into system and user messages
+        heuristically.
+        
         Args:
             prompt: The prompt/question to send to the LLM
             max_retries: Maximum number of retry attempts for transient errors
+            session_key: Conversation key for sticky backend routing (optional)
+            model: Model to use instead of the configured one (optional)
+            timeout: Total seconds for the call including retries (optional)
+            system: System message, sent as-is so its cached prefix can be reused (optional)
+            prompt_tokens: Known prompt size in tokens, for sizing num_ctx (optional)
             
         Returns:
             Tuple of (response_text, raw_response_dict)
         """
+        model = model or self.model
+        expires_at = time.monotonic() + timeout if timeout is not None else None
         # Retry logic for transient errors
         last_error = None
+        failed_backend = None  # Retries avoid the backend that just failed
+        last_lease = None
         for attempt in range(max_retries + 1):
             if attempt > 0:
-                print(f"  Retry attempt {attempt}/{max_retries}...")
-                import time
-                time.sleep(2)  # Brief delay before retry
+                # Exponential backoff with jitter so retries don't pile onto a busy server
+                delay = random.uniform(0, min(self.RETRY_BACKOFF_MAX, self.RETRY_BACKOFF_BASE * 2 ** (attempt - 1)))
+                if expires_at is not None and time.monotonic() + delay >= expires_at:
+                    raise ValueError(f"Ollama request timed out: deadline reached before retry {attempt}. Last error: {last_error}")
+                print(f"  Retry attempt {attempt}/{max_retries} in {delay:.1f}s...")
+                time.sleep(delay)
+                failed_backend = last_lease.backend if last_lease is not None and last_lease.failed else None
             
-            # Prepare request
-            headers = {
-                'Content-Type': 'application/json',
-            }
+            request_timeout = self.request_timeout
+            if expires_at is not None:
+                request_timeout = min(request_timeout, max(0.1, expires_at - time.monotonic()))
+            # A timeout shortened to the caller's deadline says nothing about the backend
+            deadline_capped = request_timeout < self.request_timeout
             
             # Prepare payload - Ollama API format
             # Split prompt into system message and user message if it contains system instructions
             # Check if prompt starts with system-like instructions
-            if prompt.startswith("You are") or "CRITICAL" in prompt[:500] or "SOURCE DOCUMENTS" in prompt:
+            if system is not None:
+                messages = [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": prompt}
+                ]
+            elif prompt.startswith("You are") or "CRITICAL" in prompt[:500] or "SOURCE DOCUMENTS" in prompt:
                 # Extract system message (first part before SOURCE DOCUMENTS or Question)
                 system_parts = []
                 user_parts = []
@@ -135,216 +335,185 @@ class OllamaLLM:
                 ]
             
             payload = {
-                "model": self.model,
+                "model": model,
                 "messages": messages,
                 "stream": False
             }
             
-            # Check total prompt length (sum of all message contents)
-            total_length = sum(len(msg.get("content", "")) for msg in messages)
-            max_prompt_length = 32000  # Increased significantly - Ollama can handle large prompts
-            
-            # Never truncate if it contains SOURCE DOCUMENTS - that's critical context
-            if total_length > max_prompt_length:
-                if "SOURCE DOCUMENTS" in prompt or "SOURCE DOCUMENT" in prompt:
-                    print(f"  ⚠ Warning: Prompt is {total_length} chars but contains SOURCE DOCUMENTS - keeping full prompt (may be slow)")
-                else:
-                    print(f"  ⚠ Warning: Prompt is {total_length} chars, truncating to {max_prompt_length}")
-                    # Truncate the last user message only
-                    if messages and len(messages) > 0:
-                        last_msg = messages[-1]
-                        if "content" in last_msg:
-                            last_msg["content"] = last_msg["content"][:max_prompt_length] + "... [truncated]"
+            payload["options"] = self._build_options(messages, prompt_tokens)
+            if self.keep_alive is not None:
+                payload["keep_alive"] = self.keep_alive
             
-            try:
-                # Debug: Log full request details
-                print(f"\n{'='*80}")
-                print(f"  📤 OLLAMA REQUEST DEBUG")
-                print(f"{'='*80}")
-                print(f"  URL: {self.chat_url}")
-                print(f"  Method: POST")
-                print(f"  Model: {self.model}")
-                print(f"  Prompt length: {len(prompt)} characters")
-                
-                print(f"\n  📋 HEADERS:")
-                pprint.pprint(headers, indent=4, width=100)
-                
-                # Show payload with truncated content if too long
-                safe_payload = payload.copy()
-                if 'messages' in safe_payload and len(safe_payload['messages']) > 0:
-                    content = safe_payload['messages'][0].get('content', '')
-                    if len(content) > 500:
-                        safe_payload['messages'][0]['content'] = content[:500] + f"\n... [truncated, total length: {len(content)} chars]"
-                
-                print(f"\n  📦 PAYLOAD (Pretty Print):")
-                pprint.pprint(safe_payload, indent=4, width=100)
-                
-                print(f"\n  📦 PAYLOAD (JSON):")
-                print(json.dumps(payload, indent=2, ensure_ascii=False))
-                print(f"{'='*80}\n")
-                
-                response = requests.post(
-                    self.chat_url,
-                    headers=headers,
-                    json=payload,
-                    timeout=120  # Increased timeout for LLM responses
-                )
-                
-                # Debug: Log response details
-                print(f"  📥 OLLAMA RESPONSE DEBUG")
-                print(f"  Status Code: {response.status_code}")
-                print(f"  Response Headers: {dict(response.headers)}")
-                
-                # Check response status
-                if response.status_code != 200:
-                    error_detail = f"HTTP {response.status_code}"
-                    
-                    try:
-                        error_body = response.json()
-                        print(f"\n  ❌ ERROR RESPONSE BODY:")
-                        pprint.pprint(error_body, indent=4, width=100)
-                        print(f"{'='*80}\n")
-                        
-                        if isinstance(error_body, dict):
-                            if 'error' in error_body:
-                                error_message = error_body['error']
-                                error_detail = f"Ollama Error: {error_message}"
-                            elif 'message' in error_body:
-                                error_message = error_body['message']
-                                error_detail = f"Ollama Error: {error_message}"
-                            else:
-                                error_detail = f"Ollama Error: {error_body}"
-                    except:
-                        error_text = response.text[:500]
-                        error_detail += f": {error_text}"
+            with self.pool.route(session_key, exclude=failed_backend) as lease:
+                last_lease = lease
+                try:
+                    print(f"  📤 Ollama request ({lease.backend.base_url}): model={model}, prompt={len(system or '') + len(prompt)} chars, options={payload['options']}")
+                    if self.debug_logging:
+                        print(json.dumps(payload, indent=2, ensure_ascii=False))
                     
-                    print(f"  ✗ Ollama error: {error_detail}")
+                    response = self.session.post(
+                        lease.chat_url,
+                        json=payload,
+                        timeout=request_timeout
+                    )
                     
-                    # Retry on 500 errors (might be transient)
-                    if response.status_code == 500 and attempt < max_retries:
-                        last_error = error_detail
-                        print(f"  Server error detected, will retry...")
-                        continue
-                    
-                    raise ValueError(f"Ollama returned error: {error_detail}")
-                
-                response.raise_for_status()
-                result = response.json()
-                
-                # Log response structure for debugging
-                print(f"  ✓ Received response (keys: {list(result.keys()) if isinstance(result, dict) else 'not a dict'})")
-                
-                # Show response but truncate very long content FOR DISPLAY ONLY
-                # Use deepcopy to avoid modifying the original result
-                safe_result = copy.deepcopy(result)
-                if isinstance(safe_result, dict) and 'message' in safe_result:
-                    msg = safe_result['message']
-                    if isinstance(msg, dict) and 'content' in msg:
-                        content = msg['content']
-                        if len(content) > 500:
-                            safe_result['message']['content'] = content[:500] + f"\n... [truncated, total length: {len(content)} chars]"
-                
-                print(f"\n  📥 SUCCESS RESPONSE BODY (Pretty Print):")
-                pprint.pprint(safe_result, indent=4, width=100, depth=3)
-                
-                print(f"\n  📥 SUCCESS RESPONSE BODY (JSON):")
-                print(json.dumps(result, indent=2, ensure_ascii=False))
-                print(f"{'='*80}\n")
-                
-                # Extract message content from response
-                # Ollama response format: {"message": {"role": "assistant", "content": "..."}, ...}
-                content = None
-                if isinstance(result, dict):
-                    # Primary format: message.content (Ollama format)
-                    if 'message' in result:
-                        message_obj = result['message']
-                        if isinstance(message_obj, dict):
-                            content = message_obj.get('content')
-                            if content and content.strip():
-                                print(f"  ✓ Extracted content from message.content ({len(content)} chars)")
-                        else:
-                            # message is a string
-                            content = str(message_obj)
-                            if content and content.strip() != '{}':
-                                pass
-                            else:
-                                content = None
+                    # Check response status
+                    if response.status_code != 200:
+                        error_detail = f"HTTP {response.status_code}"
+                        
+                        try:
+                            error_body = response.json()
+                            
+                            if isinstance(error_body, dict):
+                                if 'error' in error_body:
+                                    error_message = error_body['error']
+                                    error_detail = f"Ollama Error: {error_message}"
+                                elif 'message' in error_body:
+                                    error_message = error_body['message']
+                                    error_detail = f"Ollama Error: {error_message}"
+                                else:
+                                    error_detail = f"Ollama Error: {error_body}"
+                        except:
+                            error_text = response.text[:500]
+                            error_detail += f": {error_text}"
+                        
+                        print(f"  ✗ Ollama error: {error_detail}")
+                        
+                        if response.status_code >= 500:
+                            lease.fail(error_detail)
+                        
+                        # Retry on 500 errors (might be transient)
+                        if response.status_code == 500 and attempt < max_retries:
+                            last_error = error_detail
+                            print(f"  Server error detected, will retry...")
+                            continue
+                        
+                        raise ValueError(f"Ollama returned error: {error_detail}")
                     
-                    # Other possible formats
-                    if not content:
-                        if 'content' in result:
-                            content = result['content']
-                            if content and content.strip():
-                                pass
-                            else:
-                                content = None
+                    response.raise_for_status()
+                    result = response.json()
                     
-                    if not content:
-                        if 'text' in result:
-                            content = result['text']
-                            if content and content.strip():
-                                pass
-                            else:
-                                content = None
+                    # Log a one-line summary; the full body only when debugging
+                    if isinstance(result, dict):
+                        print(
+                            f"  📥 Ollama response: prompt_eval_count={result.get('prompt_eval_count')}, "
+                            f"eval_count={result.get('eval_count')}, "
+                            f"load_duration={result.get('load_duration', 0) / 1e9:.2f}s, "
+                            f"total_duration={result.get('total_duration', 0) / 1e9:.2f}s"
+                        )
+                    if self.debug_logging:
+                        print(json.dumps(result, indent=2, ensure_ascii=False))
                     
-                    if not content:
-                        if 'response' in result:
-                            content = result['response']
-                            if content and content.strip():
-                                pass
+                    # Extract message content from response
+                    # Ollama response format: {"message": {"role": "assistant", "content": "..."}, ...}
+                    content = None
+                    if isinstance(result, dict):
+                        # Primary format: message.content (Ollama format)
+                        if 'message' in result:
+                            message_obj = result['message']
+                            if isinstance(message_obj, dict):
+                                content = message_obj.get('content')
+                                if content and content.strip():
+                                    print(f"  ✓ Extracted content from message.content ({len(content)} chars)")
                             else:
-                                content = None
+                                # message is a string
+                                content = str(message_obj)
+                                if content and content.strip() != '{}':
+                                    pass
+                                else:
+                                    content = None
+                        
+                        # Other possible formats
+                        if not content:
+                            if 'content' in result:
+                                content = result['content']
+                                if content and content.strip():
+                                    pass
+                                else:
+                                    content = None
+                        
+                        if not content:
+                            if 'text' in result:
+                                content = result['text']
+                                if content and content.strip():
+                                    pass
+                                else:
+                                    content = None
+                        
+                        if not content:
+                            if 'response' in result:
+                                content = result['response']
+                                if content and content.strip():
+                                    pass
+                                else:
+                                    content = None
+                        
+                        # Log the full response for debugging if no content found
+                        if not content:
+                            print(f"  ⚠ Could not extract content from response. Keys: {list(result.keys())}")
+                            print(f"  Full response preview: {str(result)[:500]}")
+                            # Return the whole response as string if format is unknown
+                            content = str(result)
                     
-                    # Log the full response for debugging if no content found
                     if not content:
-                        print(f"  ⚠ Could not extract content from response. Keys: {list(result.keys())}")
-                        print(f"  Full response preview: {str(result)[:500]}")
-                        # Return the whole response as string if format is unknown
                         content = str(result)
+                    
+                    # Return both content and raw response for token usage extraction
+                    return content, result
                 
-                if not content:
-                    content = str(result)
-                
-                # Return both content and raw response for token usage extraction
-                return content, result
+                except ValueError as e:
+                    # Re-raise immediately for non-retryable errors
+                    raise
+                except requests.exceptions.ConnectTimeout:
+                    if deadline_capped:
+                        lease.cancel()
+                    else:
+                        lease.fail("connect timeout")
+                    last_error = "Timed out connecting to Ollama."
+                    if attempt < max_retries:
+                        continue
+                    raise ValueError(last_error)
+                except requests.exceptions.Timeout:
+                    # A read timeout means Ollama is busy generating; retrying would only add load
+                    if deadline_capped:
+                        lease.cancel()
+                    else:
+                        lease.fail("read timeout")
+                    raise ValueError("Ollama request timed out. The LLM may be taking too long to respond.")
+                except requests.exceptions.RequestException as e:
+                    error_msg = f"Ollama request failed"
+                    if hasattr(e, 'response') and e.response is not None:
+                        try:
+                            error_body = e.response.json()
+                            if isinstance(error_body, dict):
+                                if 'error' in error_body:
+                                    error_msg = f"Ollama Error: {error_body['error']}"
+                                elif 'message' in error_body:
+                                    error_msg = f"Ollama Error: {error_body['message']}"
+                                else:
+                                    error_msg += f": {error_body}"
+                        except:
+                            error_msg += f": {e.response.text[:500]}"
+                    else:
+                        error_msg += f": {str(e)}"
+                    
+                    last_error = error_msg
+                    lease.fail(error_msg)
+                    # Retry on 500 errors (might be transient)
+                    if attempt < max_retries and hasattr(e, 'response') and e.response and e.response.status_code == 500:
+                        print(f"  Server error detected, will retry...")
+                        continue
+                    # Unreachable backend: the retry is routed to another one
+                    if attempt < max_retries and isinstance(e, requests.exceptions.ConnectionError) and len(self.pool.backends) > 1:
+                        print(f"  Backend {lease.backend.base_url} unreachable, will retry on another backend...")
+                        continue
+                    raise ValueError(error_msg)
+                except Exception as e:
+                    last_error = f"Failed to parse Ollama response: {e}"
+                    if attempt < max_retries:
+                        continue
+                    raise ValueError(last_error)
             
-            except ValueError as e:
-                # Re-raise immediately for non-retryable errors
-                raise
-            except requests.exceptions.Timeout:
-                last_error = "Ollama request timed out. The LLM may be taking too long to respond."
-                if attempt < max_retries:
-                    continue
-                raise ValueError(last_error)
-            except requests.exceptions.RequestException as e:
-                error_msg = f"Ollama request failed"
-                if hasattr(e, 'response') and e.response is not None:
-                    try:
-                        error_body = e.response.json()
-                        if isinstance(error_body, dict):
-                            if 'error' in error_body:
-                                error_msg = f"Ollama Error: {error_body['error']}"
-                            elif 'message' in error_body:
-                                error_msg = f"Ollama Error: {error_body['message']}"
-                            else:
-                                error_msg += f": {error_body}"
-                    except:
-                        error_msg += f": {e.response.text[:500]}"
-                else:
-                    error_msg += f": {str(e)}"
-                
-                last_error = error_msg
-                # Retry on 500 errors (might be transient)
-                if attempt < max_retries and hasattr(e, 'response') and e.response and e.response.status_code == 500:
-                    print(f"  Server error detected, will retry...")
-                    continue
-                raise ValueError(error_msg)
-            except Exception as e:
-                last_error = f"Failed to parse Ollama response: {e}"
-                if attempt < max_retries:
-                    continue
-                raise ValueError(last_error)
-        
         # If we get here, all retries failed
         raise ValueError(f"All retry attempts failed. Last error: {last_error}")
 
@@ -353,14 +522,36 @@ class OllamaLLM:
 class OllamaChatLLM:
     """LangChain-compatible wrapper for Ollama LLM"""
     
+    # Usage and timing fields copied from Ollama's response (durations in nanoseconds)
+    USAGE_FIELDS = (
+        'prompt_eval_count', 'eval_count',
+        'prompt_eval_duration', 'eval_duration',
+        'load_duration', 'total_duration'
+    )
+    
     def __init__(self, ollama_llm: OllamaLLM):
         self.ollama_llm = ollama_llm
         self.last_response = None  # Store last raw response for token usage extraction
     
-    def invoke(self, prompt: str):
+    def invoke(
+        self,
+        prompt: str,
+        session_key: Optional[str] = None,
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        system: Optional[str] = None,
+        prompt_tokens: Optional[int] = None
+    ):
         """Invoke method compatible with LangChain"""
         # Store raw response for token usage extraction
-        response_text, raw_response = self.ollama_llm.invoke_with_metadata(prompt)
+        response_text, raw_response = self.ollama_llm.invoke_with_metadata(
+            prompt,
+            session_key=session_key,
+            model=model,
+            timeout=timeout,
+            system=system,
+            prompt_tokens=prompt_tokens
+        )
         self.last_response = raw_response
         
         # Return object with .content attribute like LangChain ChatOpenAI
@@ -369,11 +560,12 @@ class OllamaChatLLM:
                 self.content = content
                 self.response_metadata = response_metadata or {}
         
-        # Extract token usage from raw response
+        # Extract token usage and timings from raw response. Callers should read
+        # these from response_metadata: last_response is shared across threads.
         metadata = {}
         if isinstance(raw_response, dict):
-            if 'prompt_eval_count' in raw_response:
-                metadata['prompt_eval_count'] = raw_response.get('prompt_eval_count')
-                metadata['eval_count'] = raw_response.get('eval_count')
+            for key in self.USAGE_FIELDS:
+                if key in raw_response:
+                    metadata[key] = raw_response.get(key)
         
         return Response(response_text, metadata)
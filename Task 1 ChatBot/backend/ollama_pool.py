@@ -0,0 +1,268 @@
+"""
+Pool of Ollama backends with health-aware, least-loaded routing.
+Requests go to the healthy backend with the fewest outstanding requests;
+failing backends are ejected for a while and re-admitted by a health check.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+from metrics import get_metrics
+
+
+def parse_backend_urls(value: str) -> List[str]:
+    """Split a comma-separated list of Ollama base URLs, normalised to end with /"""
+    urls = []
+    for url in value.split(','):
+        url = url.strip()
+        if not url:
+            continue
+        if not url.endswith('/'):
+            url += '/'
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+class OllamaBackend:
+    """One Ollama server and its routing state"""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.chat_url = f"{base_url}api/chat"
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def is_available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+
+class BackendLease:
+    """A single request's hold on a backend"""
+
+    def __init__(self, pool: "OllamaPool", backend: OllamaBackend):
+        self.pool = pool
+        self.backend = backend
+        self.failed = False
+        self.cancelled = False
+
+    @property
+    def chat_url(self) -> str:
+        return self.backend.chat_url
+
+    def fail(self, reason: str = ""):
+        """Count this request as a backend failure (towards ejection)"""
+        if not self.failed:
+            self.failed = True
+            self.pool.mark_failure(self.backend, reason)
+
+    def cancel(self):
+        """Count this request as neither success nor failure (the caller gave up, e.g. its deadline ran out)"""
+        self.cancelled = True
+
+
+class OllamaPool:
+    """
+    Least-outstanding-requests router over several Ollama backends
+
+    A backend is ejected for ``ejection_seconds`` after ``failure_threshold``
+    consecutive failed requests. A background thread checks ``/api/tags``
+    every ``health_check_interval`` seconds; backends that fail it receive no
+    traffic until they pass again.
+    With ``sticky_sessions`` a conversation keeps using the same backend while
+    that backend is healthy and not much busier than the least-loaded one,
+    so Ollama can reuse its cached prompt prefix for the session.
+    """
+
+    # A sticky backend may have this many more outstanding requests than the
+    # least-loaded one before the session is moved
+    STICKY_SLACK = 2
+    MAX_STICKY_SESSIONS = 10000
+
+    def __init__(
+        self,
+        base_urls: List[str],
+        health_check_interval: float = 15.0,
+        failure_threshold: int = 3,
+        ejection_seconds: float = 30.0,
+        sticky_sessions: bool = True,
+        session: Optional[requests.Session] = None
+    ):
+        """
+        Args:
+            base_urls: Ollama base URLs (e.g. http://gpu1:11434/)
+            health_check_interval: Seconds between /api/tags checks (0 = no background checks)
+            failure_threshold: Consecutive failures before a backend is ejected
+            ejection_seconds: How long an ejected backend is skipped
+            sticky_sessions: Route requests with the same session key to the same backend
+            session: HTTP session for health checks
+        """
+        if not base_urls:
+            raise ValueError("At least one Ollama backend URL is required")
+
+        self.backends = [OllamaBackend(url) for url in base_urls]
+        self.health_check_interval = health_check_interval
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self.sticky_sessions = sticky_sessions
+        self.session = session or requests.Session()
+
+        self._lock = threading.Lock()
+        self._sticky: "OrderedDict[str, OllamaBackend]" = OrderedDict()
+        self._next = 0  # Round-robin tie breaker
+        self._stop = threading.Event()
+        self._metrics = get_metrics()
+        self._health_thread = None
+
+        self._update_gauges()
+        if health_check_interval > 0 and len(self.backends) > 1:
+            self._health_thread = threading.Thread(
+                target=self._health_loop,
+                name="ollama-health-check",
+                daemon=True
+            )
+            self._health_thread.start()
+
+    def _choose(self, session_key: Optional[str], exclude: Optional[OllamaBackend]) -> OllamaBackend:
+        now = time.monotonic()
+        others = [backend for backend in self.backends if backend is not exclude] or self.backends
+        available = [backend for backend in others if backend.is_available(now)]
+        if not available:
+            # Everything is down: try the backend whose ejection ends first
+            # rather than failing without sending anything
+            available = [min(others, key=lambda backend: backend.ejected_until)]
+
+        least = min(backend.outstanding for backend in available)
+
+        if self.sticky_sessions and session_key:
+            sticky = self._sticky.get(session_key)
+            if (sticky in available and sticky.consecutive_failures == 0
+                    and sticky.outstanding <= least + self.STICKY_SLACK):
+                self._sticky.move_to_end(session_key)
+                return sticky
+
+        candidates = [backend for backend in available if backend.outstanding == least]
+        backend = candidates[self._next % len(candidates)]
+        self._next += 1
+
+        if self.sticky_sessions and session_key:
+            self._sticky[session_key] = backend
+            self._sticky.move_to_end(session_key)
+            while len(self._sticky) > self.MAX_STICKY_SESSIONS:
+                self._sticky.popitem(last=False)
+        return backend
+
+    @contextmanager
+    def route(
+        self,
+        session_key: Optional[str] = None,
+        exclude: Optional[OllamaBackend] = None
+    ) -> Iterator[BackendLease]:
+        """
+        Pick a backend and count the request against it for the duration of the block
+
+        ``exclude`` skips a backend (e.g. the one a retry is moving away from)
+        unless it is the only one.
+
+        Call lease.fail() for failures that should count towards ejection and
+        lease.cancel() for requests the caller abandoned; leaving the block
+        without either counts as a success.
+        """
+        with self._lock:
+            backend = self._choose(session_key, exclude)
+            backend.outstanding += 1
+            backend.total_requests += 1
+            self._update_gauges()
+        lease = BackendLease(self, backend)
+        try:
+            yield lease
+        finally:
+            with self._lock:
+                backend.outstanding -= 1
+                if not (lease.failed or lease.cancelled):
+                    backend.consecutive_failures = 0
+                self._update_gauges()
+            self._metrics.inc(
+                "ollama_backend_requests_total",
+                labels={'backend': backend.base_url,
+                        'outcome': 'failure' if lease.failed else 'cancelled' if lease.cancelled else 'success'},
+                help_text="Requests sent to each Ollama backend"
+            )
+
+    def mark_failure(self, backend: OllamaBackend, reason: str = ""):
+        """Record a failed request; ejects the backend after repeated failures"""
+        with self._lock:
+            backend.total_failures += 1
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.failure_threshold and len(self.backends) > 1:
+                self._eject(backend, reason or f"{backend.consecutive_failures} consecutive failures")
+
+    def _eject(self, backend: OllamaBackend, reason: str):
+        if time.monotonic() < backend.ejected_until:
+            return
+        backend.ejected_until = time.monotonic() + self.ejection_seconds
+        print(f"  ⚠ Ejecting Ollama backend {backend.base_url} for {self.ejection_seconds:.0f}s: {reason}")
+        self._update_gauges()
+
+    def check_health(self, backend: OllamaBackend) -> bool:
+        """Check a backend via /api/tags and update its state"""
+        try:
+            response = self.session.get(f"{backend.base_url}api/tags", timeout=5)
+            ok = response.status_code == 200
+        except requests.exceptions.RequestException:
+            ok = False
+
+        with self._lock:
+            if ok and not backend.healthy:
+                # Back after a failed health check; ejections for failed
+                # requests still run their course
+                print(f"  ✓ Ollama backend {backend.base_url} is healthy again")
+                backend.ejected_until = 0.0
+                backend.consecutive_failures = 0
+            elif not ok and backend.healthy:
+                print(f"  ⚠ Ollama backend {backend.base_url} failed its health check")
+            backend.healthy = ok
+            self._update_gauges()
+        return ok
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_check_interval):
+            for backend in self.backends:
+                self.check_health(backend)
+
+    def close(self):
+        """Stop background health checks"""
+        self._stop.set()
+
+    def _update_gauges(self):
+        now = time.monotonic()
+        for backend in self.backends:
+            labels = {'backend': backend.base_url}
+            self._metrics.set_gauge("ollama_backend_outstanding", backend.outstanding, labels,
+                                    "Requests in flight per Ollama backend")
+            self._metrics.set_gauge("ollama_backend_available", 1 if backend.is_available(now) else 0, labels,
+                                    "Whether an Ollama backend is receiving traffic")
+
+    def get_stats(self) -> List[Dict]:
+        """Routing state of every backend"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    'url': backend.base_url,
+                    'available': backend.is_available(now),
+                    'outstanding': backend.outstanding,
+                    'total_requests': backend.total_requests,
+                    'total_failures': backend.total_failures,
+                    'ejected_for_seconds': max(0.0, round(backend.ejected_until - now, 1)),
+                }
+                for backend in self.backends
+            ]
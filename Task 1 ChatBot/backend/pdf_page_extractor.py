@@ -115,6 +115,9 @@ def _get_pdf_from_url(url):
     if requests is None:
         raise ImportError("requests is required for URL support. Install it with: pip install requests")
     
+    # Split e-book sections share the file: "...E-Book.pdf#resolution-236"
+    url = url.split('#', 1)[0]
+    
     try:
         response = requests.get(url, timeout=30, stream=True)
         response.raise_for_status()
@@ -0,0 +1,84 @@
+"""Payload index declarations for Qdrant collections"""
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Any
+from qdrant_client import QdrantClient
+from qdrant_client.models import FieldCondition, Filter, MatchAny, PayloadSchemaType
+
+
+# DATETIME indexes need qdrant >= 1.8; fall back to no index on older clients
+_DATETIME = getattr(PayloadSchemaType, "DATETIME", None)
+
+# Fields filtered on in the document collections, declared with the scrapers
+# that create them (Web-Scraper/payload_indexes.py)
+scraper_path = Path(__file__).parent.parent / "Web-Scraper"
+if str(scraper_path) not in sys.path:
+    sys.path.insert(0, str(scraper_path))
+from payload_indexes import DOCUMENT_PAYLOAD_INDEXES
+
+# doc_state values the scrapers write for chunks that must not be served: a new
+# version not yet published, or one replaced by a newer version and awaiting
+# garbage collection (see Web-Scraper/qdrant_writer.py)
+HIDDEN_DOC_STATES = ["staged", "retired"]
+
+
+def live_chunks_filter(*must: FieldCondition) -> Filter:
+    """Filter for the live version of every document (and chunks stored before versioning)"""
+    return Filter(
+        must=list(must) or None,
+        must_not=[FieldCondition(key='doc_state', match=MatchAny(any=HIDDEN_DOC_STATES))]
+    )
+
+# Fields filtered on in the conversation memory collection
+CONVERSATION_PAYLOAD_INDEXES: Dict[str, Any] = {
+    'user_id': PayloadSchemaType.KEYWORD,
+    'session_id': PayloadSchemaType.KEYWORD,
+    'timestamp': _DATETIME,
+}
+
+
+def ensure_payload_indexes(
+    client: QdrantClient,
+    collection_name: str,
+    indexes: Dict[str, Any],
+    existing_schema: Optional[Dict[str, Any]] = None
+) -> List[str]:
+    """
+    Create any payload indexes missing from a collection
+
+    Safe to call on every startup: fields that are already indexed are skipped,
+    so existing collections are migrated in place.
+
+    Args:
+        client: Qdrant client
+        collection_name: Collection to index
+        indexes: Mapping of payload field -> PayloadSchemaType
+        existing_schema: Collection payload_schema if already fetched
+
+    Returns:
+        Names of the fields that were newly indexed
+    """
+    if existing_schema is None:
+        try:
+            existing_schema = client.get_collection(collection_name).payload_schema or {}
+        except Exception as e:
+            print(f"⚠ Could not read payload schema for {collection_name}: {e}")
+            existing_schema = {}
+
+    created = []
+    for field_name, field_schema in indexes.items():
+        if field_schema is None or field_name in existing_schema:
+            continue
+        try:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema
+            )
+            created.append(field_name)
+        except Exception as e:
+            print(f"⚠ Could not create payload index {collection_name}.{field_name}: {e}")
+
+    if created:
+        print(f"✓ Created payload indexes on {collection_name}: {', '.join(created)}")
+    return created
@@ -0,0 +1,58 @@
+"""Request-scoped query context shared by the stages of a question"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from deadline import Deadline
+
+
+class QueryContext:
+    """
+    Per-request state for a single question
+
+    The question vector is computed at most once (lazily, thread-safe) and then
+    shared by conversation-memory search, document search and the embedding
+    cache. Other per-request artifacts can be stashed in ``artifacts``. The
+    request's time budget travels with it as ``deadline``.
+    """
+
+    def __init__(
+        self,
+        question: str,
+        embed: Callable[[str], List[float]],
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ):
+        """
+        Args:
+            question: The user's question
+            embed: Function that turns text into an embedding vector
+            user_id: Unique identifier for the user (optional)
+            session_id: Session identifier (optional)
+            deadline: Time budget for the request (optional, default unbounded)
+        """
+        self.question = question
+        self.user_id = user_id
+        self.session_id = session_id
+        self.deadline = deadline or Deadline(None)
+        self.started_at = time.time()
+        self.artifacts: Dict[str, Any] = {}
+
+        self._embed = embed
+        self._query_vector: Optional[List[float]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def query_vector(self) -> List[float]:
+        """Embedding of the question, computed on first use"""
+        if self._query_vector is None:
+            with self._lock:
+                if self._query_vector is None:
+                    self._query_vector = self._embed(self.question)
+        return self._query_vector
+
+    @property
+    def elapsed_ms(self) -> int:
+        """Milliseconds since the request started"""
+        return int((time.time() - self.started_at) * 1000)
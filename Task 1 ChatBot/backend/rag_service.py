@@ -1,11 +1,14 @@
 """RAG (Retrieval Augmented Generation) service using LangChain and Qdrant"""
+import math
 import os
+import sys
 import time
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from qdrant_client import QdrantClient
+from qdrant_client.models import FieldCondition, MatchAny, MatchValue
 from sentence_transformers import SentenceTransformer
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Qdrant
@@ -18,6 +21,25 @@ from audit_logging import get_audit_logger
 from conversation_memory import ConversationMemory
 from pdf_page_extractor import extract_sentence_location
 from cache_manager import get_cache_manager
+from qdrant_indexes import ensure_payload_indexes, live_chunks_filter, DOCUMENT_PAYLOAD_INDEXES
+from query_context import QueryContext
+from stage_pipeline import StagePipeline
+from deadline import Deadline
+from llm_scheduler import LLMSaturatedError, get_llm_scheduler
+from single_flight import SingleFlight, normalize_question, make_key
+from prompt_templates import get_prompt_template
+from context_compressor import ContextCompressor
+from adaptive_retrieval import AMBIGUOUS, find_cutoff, load_calibration
+from resolution_filter import extract_resolution_numbers
+from model_cascade import SMALL_ROUTE, LARGE_ROUTE, is_complex_query, choose_model_route, check_citations
+from metrics import get_metrics
+
+# Token counting is shared with the ingest side (Web-Scraper)
+scraper_path = Path(__file__).parent.parent / "Web-Scraper"
+if str(scraper_path) not in sys.path:
+    sys.path.insert(0, str(scraper_path))
+from token_counter import get_token_counter, approximate_token_count
+
 # API Gateway imports are conditional (deprecated)
 
 # Try to import pdfplumber for page number lookup
@@ -38,7 +60,17 @@ class RAGService:
         self.qdrant_client = None
         self.vector_stores: Dict[str, Qdrant] = {}
         self.llm = None
-        self.conversation_memory = ConversationMemory()
+        self.conversation_memory = None
+        # Admission control for LLM calls (None = unlimited)
+        self.llm_scheduler = get_llm_scheduler() if settings.enable_llm_admission_control else None
+        # Identical concurrent questions share one retrieval / generation
+        self.retrieval_flight = SingleFlight("retrieval") if settings.enable_single_flight else None
+        self.generation_flight = SingleFlight("generation") if settings.enable_single_flight else None
+        self._template_token_counts: Dict[str, int] = {}
+        # Cleared at startup when the cascade's small model is not available
+        self._cascade_enabled = True
+        # Per-collection score floors from `benchmark.py calibrate-retrieval`
+        self.score_floors = load_calibration(settings.retrieval_calibration_file) if settings.enable_adaptive_top_k else {}
         self._initialize()
     
     def _initialize(self):
@@ -49,6 +81,15 @@ class RAGService:
         print("Loading embedding model...")
         self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
         
+        # Conversation memory shares the embedding model (same all-MiniLM-L6-v2)
+        self.conversation_memory = ConversationMemory(embedding_model=self.embedding_model)
+        
+        # Query-focused sentence selection for the prompt context
+        self.context_compressor = ContextCompressor(
+            encode=lambda sentences: self.embedding_model.encode(sentences, batch_size=64),
+            count_tokens=lambda text: get_token_counter(settings.tokenizer_name).count(text)
+        )
+        
         # Initialize HuggingFace embeddings for LangChain
         # Try to use langchain-huggingface if available, otherwise fall back to community
         try:
@@ -100,6 +141,8 @@ class RAGService:
                     )
                     self.vector_stores[collection_name] = vector_store
                     print(f"  ✓ Loaded collection: {collection_name}")
+                    # Migrate collections created before payload indexes were declared
+                    ensure_payload_indexes(self.qdrant_client, collection_name, DOCUMENT_PAYLOAD_INDEXES)
                 else:
                     print(f"  ⚠ Collection {collection_name} does not exist yet")
             except Exception as e:
@@ -113,8 +156,29 @@ class RAGService:
             print(f"  Initializing Ollama LLM (model: {settings.ollama_model})...")
             ollama_llm = OllamaLLM(
                 base_url=settings.ollama_url,
-                model=settings.ollama_model
+                model=settings.ollama_model,
+                keep_alive=settings.ollama_keep_alive or None,
+                num_predict=settings.ollama_num_predict or None,
+                min_num_ctx=settings.ollama_min_num_ctx,
+                max_num_ctx=settings.ollama_max_num_ctx,
+                pool_size=settings.ollama_pool_size,
+                request_timeout=settings.ollama_request_timeout,
+                debug_logging=settings.ollama_debug_logging,
+                health_check_interval=settings.ollama_health_check_interval,
+                failure_threshold=settings.ollama_failure_threshold,
+                ejection_seconds=settings.ollama_ejection_seconds,
+                sticky_sessions=settings.ollama_sticky_sessions
             )
+            # Load the model with the context window a full-context question requests
+            warm_up_tokens = self._typical_prompt_tokens(ollama_llm)
+            if settings.ollama_warm_up:
+                ollama_llm.warm_up(prompt_tokens=warm_up_tokens)
+            if settings.enable_model_cascade and settings.ollama_small_model:
+                # A missing small model would fail every routed question; fall back to the large model
+                if ollama_llm.has_model(settings.ollama_small_model) is False or \
+                        (settings.ollama_warm_up and ollama_llm.warm_up(model=settings.ollama_small_model, prompt_tokens=warm_up_tokens) is None):
+                    self._cascade_enabled = False
+                    print(f"  ⚠ Small model {settings.ollama_small_model} unavailable, model cascade disabled")
             self.llm = OllamaChatLLM(ollama_llm)
             print(f"  ✓ Ollama LLM ready")
         elif settings.llm_provider == "api_gateway":
@@ -150,6 +214,15 @@ class RAGService:
         
         print("RAG Service initialized successfully!")
     
+    @staticmethod
+    def _typical_prompt_tokens(ollama_llm: OllamaLLM) -> int:
+        """Estimated prompt tokens of a question whose sources fill the context budget"""
+        num_sources = 5  # Default max_results of a question
+        template = get_prompt_template(settings.use_compact_prompt, num_sources, settings.prompt_template_version)
+        system, prompt = template.render("", "", "", num_sources)
+        context_tokens = settings.max_context_tokens or ollama_llm.estimate_tokens("x" * settings.max_context_length)
+        return ollama_llm.estimate_tokens((system or "") + prompt) + context_tokens
+    
     def _get_collections_to_search(self, requested_collections: List[CollectionType]) -> List[str]:
         """Convert requested collection types to actual collection names"""
         print(f"  Requested collections: {requested_collections}")
@@ -186,12 +259,29 @@ class RAGService:
         print(f"  ✓ Searching collections: {available}")
         return list(set(available))  # Remove duplicates
     
+    def _get_query_embedding(self, query: str) -> List[float]:
+        """Embed a query, going through the embedding cache when enabled"""
+        if not settings.enable_caching:
+            return self.embedding_model.encode(query).tolist()
+        
+        cache_manager = get_cache_manager()
+        query_embedding = cache_manager.get_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.embedding_model.encode(query).tolist()
+            cache_manager.set_embedding(query, query_embedding)
+        else:
+            print(f"  ✓ Using cached embedding for query")
+        return query_embedding
+    
     def _retrieve_documents(
         self,
         query: str,
         collections: List[str],
         max_results: int,
-        min_score: float
+        min_score: float,
+        query_embedding: Optional[List[float]] = None,
+        failed_collections: Optional[List[str]] = None,
+        deadline: Optional[Deadline] = None
     ) -> List[Dict[str, Any]]:
         """
         Retrieve relevant documents using advanced ANN vector search strategies
@@ -199,55 +289,65 @@ class RAGService:
         Implements:
         - Multi-stage retrieval (retrieve more, then filter)
         - Diversity filtering (MMR) if enabled
-        - Adaptive retrieval based on query complexity
+        - Adaptive retrieval: with enable_adaptive_top_k the score distribution
+          decides how many chunks to keep (a clear gap or elbow cuts the list,
+          a flat list is searched again with more candidates); otherwise the
+          candidate count grows with query complexity
+        - Resolution targeting: a question naming resolution numbers searches
+          only those resolutions' chunks (collections without them are searched
+          again unfiltered)
+        
+        With a deadline, searches are bounded by the time left (collections
+        that don't answer in time count as failed) and MMR / re-ranking are
+        skipped when little time remains.
         """
-        # Adaptive retrieval: adjust based on query complexity
-        query_length = len(query.split())
-        is_complex_query = query_length > 10 or '?' in query or any(
-            word in query.lower() for word in ['what', 'how', 'why', 'explain', 'describe']
-        )
+        deadline = deadline or Deadline(None)
+        adaptive = settings.enable_adaptive_top_k
         
         # Determine initial retrieval count
         if settings.enable_diversity_filtering or settings.enable_reranking:
             initial_limit = max(settings.initial_retrieval_count, max_results * 3)
+        elif adaptive:
+            # A few scores past max_results show where the list drops off
+            initial_limit = max_results * 2
         else:
             initial_limit = max_results
         
-        # Increase for complex queries
-        if is_complex_query:
+        # Increase for complex queries (adaptive top-k reads the scores instead)
+        if not adaptive and is_complex_query(query):
             initial_limit = int(initial_limit * 1.5)
         
-        all_results = []
+        results_by_collection: Dict[str, List[Dict[str, Any]]] = {}
         
-        # CACHE OPTIMIZATION: Check cache for query embedding
-        if settings.enable_caching:
-            cache_manager = get_cache_manager()
-            query_embedding = cache_manager.get_embedding(query)
-            
-            if query_embedding is None:
-                # Generate query embedding if not cached
-                query_embedding = self.embedding_model.encode(query).tolist()
-                # Cache it for future use
-                cache_manager.set_embedding(query, query_embedding)
-            else:
-                print(f"  ✓ Using cached embedding for query")
-        else:
-            # Generate query embedding without caching
-            query_embedding = self.embedding_model.encode(query).tolist()
+        # Reuse the request's query vector when the caller already has one
+        if query_embedding is None:
+            query_embedding = self._get_query_embedding(query)
         
         # Stage 1: Initial ANN retrieval (retrieve more candidates)
         # OPTIMIZATION: Search collections in parallel for faster response
-        failed_collections = []
+        # Failures are reported into the caller's list (request-scoped) when given
+        if failed_collections is None:
+            failed_collections = []
         
-        def search_collection(collection_name: str) -> tuple[str, List[Dict[str, Any]], Optional[str]]:
+        # "Resolution No. 236" in the question: search that resolution's chunks
+        resolution_numbers = extract_resolution_numbers(query) if settings.enable_resolution_filter else []
+        resolution_condition = FieldCondition(key='resolution_number', match=MatchAny(any=resolution_numbers))
+        targeted = set(collections) if resolution_numbers else set()
+        
+        def search_collection(collection_name: str, limit: int) -> tuple[str, List[Dict[str, Any]], Optional[str]]:
             """Search a single collection and return results or error"""
             try:
                 # Use Qdrant client directly for ANN search
                 search_results = self.qdrant_client.search(
                     collection_name=collection_name,
                     query_vector=query_embedding,
-                    limit=initial_limit,
-                    score_threshold=min_score  # Filter low-quality results early
+                    # Hide unpublished and replaced document versions
+                    query_filter=live_chunks_filter(resolution_condition) if collection_name in targeted else live_chunks_filter(),
+                    limit=limit,
+                    # Filter low-quality results early (and below the collection's noise floor)
+                    score_threshold=max(min_score, self.score_floors.get(collection_name, min_score)),
+                    with_vectors=settings.enable_diversity_filtering,  # MMR reuses stored vectors
+                    timeout=max(1, int(math.ceil(deadline.timeout(settings.qdrant_search_timeout))))
                 )
                 
                 # Convert to our format
@@ -261,7 +361,7 @@ class RAGService:
                         'similarity_score': similarity_score,
                         'collection': collection_name,
                         'metadata': payload,
-                        'embedding': None  # Store for diversity calculation if needed
+                        'embedding': result.vector if isinstance(result.vector, list) else None
                     }
                     collection_results.append(result_dict)
                 
@@ -298,26 +398,89 @@ class RAGService:
                 
                 return collection_name, [], error_msg
         
-        # Search all collections in parallel
-        with ThreadPoolExecutor(max_workers=min(len(collections), 5)) as executor:
+        def search_all(names: List[str], limit: int) -> None:
+            """Search collections in parallel, for no longer than the deadline allows"""
+            executor = ThreadPoolExecutor(max_workers=min(len(names), 5))
             future_to_collection = {
-                executor.submit(search_collection, collection_name): collection_name
-                for collection_name in collections
+                executor.submit(search_collection, collection_name, limit): collection_name
+                for collection_name in names
             }
-            
-            for future in as_completed(future_to_collection):
-                collection_name, collection_results, error = future.result()
-                if error:
-                    failed_collections.append(collection_name)
-                else:
-                    all_results.extend(collection_results)
+            try:
+                for future in as_completed(future_to_collection, timeout=deadline.remaining()):
+                    collection_name, collection_results, error = future.result()
+                    if error:
+                        failed_collections.append(collection_name)
+                    else:
+                        results_by_collection[collection_name] = collection_results
+            except FuturesTimeoutError:
+                late = [name for future, name in future_to_collection.items() if not future.done()]
+                failed_collections.extend(late)
+                deadline.degrade('retrieval', f"no answer in time from {', '.join(late)}")
+            finally:
+                # Don't wait for searches that missed the deadline
+                executor.shutdown(wait=False)
+        
+        search_all(collections, initial_limit)
+        
+        if targeted:
+            # Collections without the named resolution fall back to a plain search
+            untargeted = [name for name in collections if name in results_by_collection and not results_by_collection[name]]
+            targeted.difference_update(untargeted)
+            if untargeted and not deadline.expired():
+                search_all(untargeted, initial_limit)
+            print(f"  🔍 Resolution filter {', '.join(resolution_numbers)}: "
+                  f"{len(targeted)} collection(s) targeted, {len(untargeted)} searched unfiltered")
+        
+        def ranked() -> List[Dict[str, Any]]:
+            # Sort by similarity score (descending)
+            return sorted(
+                (result for results in results_by_collection.values() for result in results),
+                key=lambda x: x['similarity_score'],
+                reverse=True
+            )
+        
+        all_results = ranked()
         
-        # Store failed collections for reporting
-        if failed_collections:
-            self._last_failed_collections = failed_collections
+        if adaptive and all_results:
+            scores = [result['similarity_score'] for result in all_results]
+            cutoff, decision = find_cutoff(
+                scores,
+                max_results,
+                min_k=settings.adaptive_min_results,
+                gap_threshold=settings.adaptive_gap_threshold,
+                elbow_threshold=settings.adaptive_elbow_threshold
+            )
+            # A flat top with collections that filled the first search: the
+            # right answer may sit just below, so look further down
+            saturated = [name for name, results in results_by_collection.items() if len(results) >= initial_limit]
+            if decision == AMBIGUOUS and saturated and settings.adaptive_max_candidates > initial_limit \
+                    and deadline.has(settings.deadline_min_rerank_seconds):
+                search_all(saturated, settings.adaptive_max_candidates)
+                all_results = ranked()
+                max_results = min(len(all_results), max_results + settings.adaptive_extra_results)
+            elif cutoff is not None:
+                all_results = all_results[:cutoff]
+                max_results = cutoff
+            print(f"  🔀 Adaptive top-k: {decision} → {min(max_results, len(all_results))} chunks "
+                  f"(top {scores[0]:.3f}, {len(scores)} candidates)")
+            metrics = get_metrics()
+            metrics.inc(
+                "retrieval_adaptive_decisions_total",
+                labels={"decision": decision},
+                help_text="Adaptive top-k decisions by score distribution shape"
+            )
+            metrics.observe(
+                "retrieval_chunks_selected",
+                min(max_results, len(all_results)),
+                buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15),
+                help_text="Chunks kept per question by adaptive top-k"
+            )
         
-        # Sort by similarity score (descending)
-        all_results.sort(key=lambda x: x['similarity_score'], reverse=True)
+        # Re-ordering is optional; keep the score order when time is short
+        if (settings.enable_diversity_filtering or settings.enable_reranking) and len(all_results) > 1 \
+                and not deadline.has(settings.deadline_min_rerank_seconds):
+            deadline.degrade('rerank', "not enough time left for MMR / re-ranking")
+            return all_results[:max_results]
         
         # Stage 2: Apply diversity filtering (MMR) if enabled
         if settings.enable_diversity_filtering and len(all_results) > max_results:
@@ -356,14 +519,13 @@ class RAGService:
         if not results:
             return []
         
-        # Get embeddings for all results (lazy loading)
-        result_embeddings = []
-        for result in results:
-            if result['embedding'] is None:
-                # Generate embedding for the chunk
-                chunk_text = result['content']
-                result['embedding'] = self.embedding_model.encode(chunk_text).tolist()
-            result_embeddings.append(result['embedding'])
+        # Stored vectors come back with the search; only encode chunks without one
+        missing = [result for result in results if result['embedding'] is None]
+        if missing:
+            missing_embeddings = self.embedding_model.encode([result['content'] for result in missing])
+            for result, embedding in zip(missing, missing_embeddings):
+                result['embedding'] = embedding.tolist()
+        result_embeddings = [result['embedding'] for result in results]
         
         # Convert to numpy for efficient computation
         query_vec = np.array(query_embedding)
@@ -451,32 +613,37 @@ class RAGService:
         min_score: float,
         user_id: Optional[str] = None,
         session_id: Optional[str] = None,
-        use_memory: bool = True
+        use_memory: bool = True,
+        priority: str = 'interactive',
+        timeout_ms: Optional[int] = None
     ) -> Dict[str, Any]:
-        """Ask a question and get an answer with references"""
-        # Get conversation memory (retrieve relevant past conversations)
-        context_conversations = []
-        if use_memory and (user_id or session_id):
-            try:
-                print(f"  🔍 Retrieving conversation memory (user_id: {user_id}, session_id: {session_id})...")
-                context_conversations = self.conversation_memory.get_relevant_conversations(
-                    current_question=question,
-                    user_id=user_id,
-                    session_id=session_id,
-                    limit=5,  # Get top 5 relevant past conversations
-                    score_threshold=0.5  # Lower threshold to get more results
-                )
-                if context_conversations:
-                    print(f"  📝 Found {len(context_conversations)} relevant past conversations")
-                    for i, conv in enumerate(context_conversations, 1):
-                        print(f"    {i}. Score: {conv.get('similarity_score', 0):.3f} - Q: {conv.get('question', '')[:50]}...")
-                else:
-                    print(f"  ℹ No relevant past conversations found (threshold: 0.5)")
-            except Exception as e:
-                print(f"  ⚠ Error retrieving conversation memory: {e}")
-                import traceback
-                print(traceback.format_exc())
-                context_conversations = []
+        """
+        Ask a question and get an answer with references
+        
+        The request runs as a small dependency graph (see StagePipeline):
+        memory search and document retrieval run side by side, page lookup for
+        the retrieved documents overlaps prompt building and LLM generation,
+        and the audit write and memory store run together at the end. Every
+        stage has a timeout; a stage that misses it is skipped.
+        
+        All stages share one deadline (timeout_ms, or request_deadline_seconds).
+        Stages size their timeouts from the time left and skip or shrink
+        optional work when it runs short; those stages are reported in
+        'degraded_stages'.
+        
+        Raises:
+            LLMSaturatedError: If the LLM scheduler could not admit the request
+        """
+        # Request-scoped context: the question is embedded once and shared
+        budget_seconds = timeout_ms / 1000 if timeout_ms else settings.request_deadline_seconds
+        deadline = Deadline(budget_seconds or None)
+        query_context = QueryContext(
+            question,
+            embed=self._get_query_embedding,
+            user_id=user_id,
+            session_id=session_id,
+            deadline=deadline
+        )
         
         # Get collections to search
         collections_to_search = self._get_collections_to_search(collections)
@@ -490,33 +657,302 @@ class RAGService:
                 'collections_searched': []
             }
         
-        # Reset failed collections tracking
-        self._last_failed_collections = []
+        # Collections that fail to search during this request
+        failed_collections: List[str] = []
         
-        # Retrieve relevant documents
-        retrieved_docs = self._retrieve_documents(
-            question,
-            collections_to_search,
-            max_results,
-            min_score
+        pipeline = StagePipeline("ask", concurrent=settings.enable_concurrent_stages, deadline=deadline)
+        pipeline.add_stage(
+            'memory',
+            lambda _: self._retrieve_memory(query_context, use_memory),
+            timeout=settings.memory_stage_timeout,
+            default=[]
+        )
+        pipeline.add_stage(
+            'retrieval',
+            lambda _: self._retrieve_documents_shared(
+                query_context,
+                collections_to_search,
+                max_results,
+                min_score,
+                failed_collections
+            ),
+            timeout=settings.retrieval_stage_timeout,
+            default=[]
+        )
+        pipeline.add_stage(
+            'prompt',
+            lambda results: self._build_prompt(
+                question,
+                results['retrieval'],
+                results['memory'],
+                deadline,
+                query_context.query_vector
+            ),
+            depends_on=['memory', 'retrieval']
+        )
+        pipeline.add_stage(
+            'generation',
+            lambda results: self._generate_answer_shared(
+                results['prompt'],
+                self._choose_model_route(question, results['retrieval']),
+                priority,
+                session_id,
+                deadline
+            ) if results['prompt'] else None,
+            depends_on=['prompt', 'retrieval'],
+            timeout=settings.generation_stage_timeout,
+            default=self._generation_failure(
+                f"Generation stage timeout after {settings.generation_stage_timeout}s"
+            )
         )
+        # Page numbers for the retrieved docs are looked up while the LLM generates;
+        # only the ones that end up cited are used
+        pipeline.add_stage(
+            'page_lookup',
+            lambda results: self._lookup_page_numbers(results['retrieval'], deadline),
+            depends_on=['retrieval'],
+            timeout=settings.max_page_lookup_time,
+            default={}
+        )
+        stage_results = pipeline.run()
+        for stage_name in pipeline.timed_out:
+            deadline.degrade(stage_name, "timed out")
+        
+        # Overload is reported to the caller (HTTP 429/503), not answered
+        if isinstance(pipeline.exceptions.get('generation'), LLMSaturatedError):
+            raise pipeline.exceptions['generation']
+        
+        retrieved_docs = stage_results['retrieval']
+        prompt_info = stage_results['prompt']
+        generation = stage_results['generation']
+        page_numbers = stage_results['page_lookup']
+        stage_timings = dict(pipeline.timings)
         
         # Get successfully searched collections (exclude failed ones)
-        successfully_searched = [c for c in collections_to_search if c not in self._last_failed_collections]
+        successfully_searched = [c for c in collections_to_search if c not in failed_collections]
         
-        if not retrieved_docs:
+        if not retrieved_docs or not prompt_info:
+            if retrieved_docs:
+                print(f"  ⚠ Warning: No context parts generated from retrieved documents")
             answer = "I couldn't find any relevant information to answer your question. Please try rephrasing your question or checking if the relevant documents have been indexed."
-            if self._last_failed_collections:
-                answer += f" Note: Some collections ({', '.join(self._last_failed_collections)}) could not be searched due to errors."
+            if failed_collections:
+                answer += f" Note: Some collections ({', '.join(failed_collections)}) could not be searched due to errors."
             return {
                 'answer': answer,
                 'question': question,
                 'references': [],
                 'total_references_found': 0,
                 'collections_searched': successfully_searched,
-                'failed_collections': self._last_failed_collections if self._last_failed_collections else None
+                'failed_collections': failed_collections if failed_collections else None,
+                'stage_timings': stage_timings,
+                'degraded_stages': deadline.degraded or None
             }
         
+        citation_map = prompt_info['citation_map']
+        answer = generation['answer']
+        token_usage = generation['token_usage']
+        cited_numbers = generation['cited_numbers']
+        success = generation['success']
+        error_message = generation['error_message']
+        
+        # Filter to only include references that were actually cited in the answer
+        # Convert cited_numbers to integers for comparison
+        cited_indices = set(int(num) for num in cited_numbers if num.isdigit())
+        
+        # Filter retrieved_docs to only those that were cited
+        # citation_map maps citation number (1-indexed) to doc index (0-indexed)
+        # So we need to find which doc indices correspond to cited citation numbers
+        cited_doc_indices = set()
+        for citation_num in cited_indices:
+            if citation_num in citation_map:
+                doc_idx = citation_map[citation_num]
+                cited_doc_indices.add(doc_idx)
+        
+        # If no citations found, fall back to all references (shouldn't happen, but safety check)
+        if not cited_doc_indices:
+            print(f"  ⚠ No citations found in answer, showing all {len(retrieved_docs)} retrieved references")
+            cited_doc_indices = set(range(len(retrieved_docs)))
+        else:
+            print(f"  ✓ Filtering references: showing {len(cited_doc_indices)} cited reference(s) out of {len(retrieved_docs)} retrieved")
+        
+        # Create a new citation_map that maps citation numbers to the new filtered reference indices
+        # First, create a mapping from old doc index to new reference index
+        old_to_new_index = {old_idx: new_idx for new_idx, old_idx in enumerate(sorted(cited_doc_indices))}
+        
+        # Update citation_map to only include cited references with new indices
+        filtered_citation_map = {}
+        for citation_num, old_doc_idx in citation_map.items():
+            if old_doc_idx in old_to_new_index:
+                filtered_citation_map[citation_num] = old_to_new_index[old_doc_idx]
+        
+        # Format references with citation numbers - ONLY for cited references
+        # Get current timestamp for when sources were retrieved
+        retrieved_timestamp = datetime.now().isoformat()
+        
+        references = []
+        for old_idx in sorted(cited_doc_indices):
+            doc = retrieved_docs[old_idx]
+            metadata = doc['metadata']
+            
+            # Use stored page number if available, else the one found by the page lookup stage
+            page_number = metadata.get('page_number')
+            page_source = 'stored' if page_number is not None else None
+            if page_number is None and old_idx in page_numbers:
+                page_number, page_source = page_numbers[old_idx]
+            
+            ref = SourceReference(
+                pdf_title=metadata.get('pdf_title', 'Unknown'),
+                pdf_url=metadata.get('pdf_url'),
+                chunk_text=doc['content'],
+                similarity_score=doc['similarity_score'],
+                chunk_index=metadata.get('chunk_index', 0),
+                total_chunks=metadata.get('total_chunks', 0),
+                page_number=page_number,
+                page_number_source=page_source,
+                date=metadata.get('date'),
+                document_type=metadata.get('document_type'),
+                resolution_number=metadata.get('resolution_number'),
+                source=doc['collection'],
+                retrieved_at=retrieved_timestamp,
+                # Documents whose near-identical chunk was linked to this one at ingest
+                duplicate_sources=metadata.get('duplicate_sources') or None
+            )
+            references.append(ref)
+        
+        # Calculate response time
+        response_time_ms = query_context.elapsed_ms
+        
+        # Get collection names as strings
+        collection_names = [c.value if hasattr(c, 'value') else str(c) for c in successfully_searched]
+        
+        def write_audit_log(_):
+            audit_logger = get_audit_logger()
+            audit_logger.log_query(
+                question=question,
+                answer=answer if success else None,
+                llm_provider=settings.llm_provider,
+                llm_model=settings.ollama_model if settings.llm_provider == "ollama" else (settings.openai_model if settings.llm_provider == "openai" else "unknown"),
+                prompt_tokens=token_usage['prompt_tokens'],
+                completion_tokens=token_usage['completion_tokens'],
+                total_tokens=token_usage['total_tokens'],
+                collections_searched=collection_names,
+                num_sources_found=len(retrieved_docs),
+                num_sources_cited=len(cited_numbers),
+                max_results=max_results,
+                min_score=min_score,
+                answer_length=len(answer) if answer else None,
+                response_time_ms=response_time_ms,
+                error_message=error_message,
+                success=success
+            )
+        
+        def store_memory(_):
+            if not (use_memory and (user_id or session_id) and success):
+                return None
+            print(f"  💾 Storing conversation in memory (user_id: {user_id}, session_id: {session_id})...")
+            conversation_id = self.conversation_memory.store_conversation(
+                user_id=user_id or "anonymous",
+                session_id=session_id or "default",
+                question=question,
+                answer=answer,
+                metadata={
+                    'collections_searched': successfully_searched,
+                    'num_sources': len(references),
+                    'total_tokens': token_usage.get('total_tokens', 0)
+                }
+            )
+            print(f"  ✓ Queued conversation for memory (ID: {conversation_id})")
+            return conversation_id
+        
+        # Audit write and memory store are independent of each other
+        bookkeeping = StagePipeline("ask-bookkeeping", concurrent=settings.enable_concurrent_stages)
+        bookkeeping.add_stage('audit', write_audit_log, timeout=settings.bookkeeping_stage_timeout)
+        bookkeeping.add_stage('memory_store', store_memory, timeout=settings.bookkeeping_stage_timeout)
+        bookkeeping.run()
+        stage_timings.update(bookkeeping.timings)
+        
+        stage_timings['total'] = float(query_context.elapsed_ms)
+        print(f"  ⏱ Stage timings (ms): " + ", ".join(f"{name}={ms:.0f}" for name, ms in stage_timings.items()))
+        
+        return {
+            'answer': answer,
+            'question': question,
+            'references': references,
+            'total_references_found': len(retrieved_docs),  # Total retrieved (for info)
+            'collections_searched': successfully_searched,
+            'failed_collections': failed_collections if failed_collections else None,
+            'citation_map': filtered_citation_map,  # Map citation numbers to filtered reference indices
+            'token_usage': token_usage,  # Include token usage in the result
+            'stage_timings': stage_timings,
+            'model_route': generation.get('model_route'),
+            'degraded_stages': deadline.degraded or None
+        }
+    
+    def _retrieve_memory(self, query_context: QueryContext, use_memory: bool) -> List[Dict[str, Any]]:
+        """Retrieve relevant past conversations for the request's user/session"""
+        user_id = query_context.user_id
+        session_id = query_context.session_id
+        if not (use_memory and (user_id or session_id)):
+            return []
+        if not query_context.deadline.has(settings.deadline_min_memory_seconds):
+            query_context.deadline.degrade('memory', "not enough time left for conversation memory")
+            return []
+        
+        try:
+            print(f"  🔍 Retrieving conversation memory (user_id: {user_id}, session_id: {session_id})...")
+            context_conversations = self.conversation_memory.get_relevant_conversations(
+                current_question=query_context.question,
+                user_id=user_id,
+                session_id=session_id,
+                limit=5,  # Get top 5 relevant past conversations
+                score_threshold=0.5,  # Lower threshold to get more results
+                query_embedding=query_context.query_vector
+            )
+            if context_conversations:
+                print(f"  📝 Found {len(context_conversations)} relevant past conversations")
+                for i, conv in enumerate(context_conversations, 1):
+                    print(f"    {i}. Score: {conv.get('similarity_score', 0):.3f} - Q: {conv.get('question', '')[:50]}...")
+            else:
+                print(f"  ℹ No relevant past conversations found (threshold: 0.5)")
+            return context_conversations
+        except Exception as e:
+            print(f"  ⚠ Error retrieving conversation memory: {e}")
+            import traceback
+            print(traceback.format_exc())
+            return []
+    
+    def _build_prompt(
+        self,
+        question: str,
+        retrieved_docs: List[Dict[str, Any]],
+        context_conversations: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Build the LLM prompt from retrieved documents and past conversations
+        
+        When the deadline is close the context is shortened so the LLM has
+        less to read. With context compression on, only the sentences of each
+        document closest to the question (query_vector) are kept.
+        
+        Returns:
+            Dict with 'system' (fixed instructions, None for v1 templates),
+            'prompt' (user message), 'template', 'prompt_tokens' (None when
+            packing by characters), 'citation_map' and 'num_sources', or None
+            when there is no usable context
+        """
+        if not retrieved_docs:
+            return None
+        
+        max_context_length = settings.max_context_length
+        max_context_tokens = settings.max_context_tokens
+        if deadline and not deadline.has(settings.deadline_full_context_seconds):
+            max_context_length = int(max_context_length * settings.deadline_reduced_context_ratio)
+            max_context_tokens = int(max_context_tokens * settings.deadline_reduced_context_ratio)
+            deadline.degrade('context', f"context shortened to {max_context_tokens} tokens" if max_context_tokens
+                             else f"context shortened to {max_context_length} characters")
+        
         # Build context from past conversations
         conversation_context = ""
         if context_conversations:
@@ -525,27 +961,29 @@ class RAGService:
                 conversation_context += f"Q: {conv['question']}\n"
                 conversation_context += f"A: {conv['answer'][:200]}...\n\n"
         
+        # Keep the sentences closest to the question rather than whole chunks;
+        # docs keep their order, so citation numbers still map to retrieved_docs
+        context_docs = retrieved_docs
+        if settings.enable_context_compression and query_vector is not None:
+            token_budget = settings.compression_token_budget
+            if max_context_tokens:
+                token_budget = min(token_budget, max_context_tokens)
+            context_docs, stats = self.context_compressor.compress(query_vector, retrieved_docs, token_budget)
+            if stats['tokens_after'] < stats['tokens_before']:
+                print(f"  🗜 Compressed context: {stats['tokens_before']} → {stats['tokens_after']} tokens "
+                      f"({stats['sentences_after']}/{stats['sentences_before']} sentences)")
+        
         # Prepare context for LLM with smart prioritization and citation numbering
-        context_parts, citation_map = self._prepare_context_with_citations(
-            retrieved_docs,
-            settings.max_context_length,
-            settings.enable_smart_truncation
+        context_parts, citation_map, context_tokens = self._prepare_context_with_citations(
+            context_docs,
+            max_context_length,
+            settings.enable_smart_truncation,
+            max_tokens=max_context_tokens
         )
         
         # Validate context is not empty
         if not context_parts or not any(context_parts):
-            print(f"  ⚠ Warning: No context parts generated from retrieved documents")
-            answer = "I couldn't find any relevant information to answer your question. Please try rephrasing your question or checking if the relevant documents have been indexed."
-            if self._last_failed_collections:
-                answer += f" Note: Some collections ({', '.join(self._last_failed_collections)}) could not be searched due to errors."
-            return {
-                'answer': answer,
-                'question': question,
-                'references': [],
-                'total_references_found': 0,
-                'collections_searched': successfully_searched,
-                'failed_collections': self._last_failed_collections if self._last_failed_collections else None
-            }
+            return None
         
         # Use more compact separator to save characters
         if settings.use_compact_prompt:
@@ -557,212 +995,255 @@ class RAGService:
         # Validate context is not empty after joining
         if not context or not context.strip():
             print(f"  ⚠ Warning: Context is empty after joining parts")
-            answer = "I couldn't find any relevant information to answer your question. Please try rephrasing your question or checking if the relevant documents have been indexed."
-            if self._last_failed_collections:
-                answer += f" Note: Some collections ({', '.join(self._last_failed_collections)}) could not be searched due to errors."
-            return {
-                'answer': answer,
-                'question': question,
-                'references': [],
-                'total_references_found': 0,
-                'collections_searched': successfully_searched,
-                'failed_collections': self._last_failed_collections if self._last_failed_collections else None
-            }
+            return None
         
-        # Apply context compression if enabled
-        if settings.enable_context_compression and len(context) > settings.max_context_length:
-            context = self._compress_context(context, settings.max_context_length)
-        
-        # Final safety check: truncate if still too long
-        if len(context) > settings.max_context_length:
-            print(f"  ⚠ Truncating context from {len(context)} to {settings.max_context_length} characters")
-            context = context[:settings.max_context_length] + "... [context truncated]"
+        # Final safety check: truncate if still too long (the token budget is exact per chunk)
+        if context_tokens is None and len(context) > max_context_length:
+            print(f"  ⚠ Truncating context from {len(context)} to {max_context_length} characters")
+            context = context[:max_context_length] + "... [context truncated]"
         
         # Count how many sources are provided
         num_sources = len(context_parts)
         
-        # Create prompt with enhanced multi-source synthesis instructions
-        if settings.use_compact_prompt:
-            if num_sources > 1:
-                # Enhanced compact prompt with examples - PUT CONTEXT FIRST, THEN QUESTION
-                prompt = f"""You are an expert assistant with DIRECT ACCESS to authoritative Shariah documents. Answer questions using ONLY the source documents provided below.
-
-═══════════════════════════════════════════════════════════════
-SOURCE DOCUMENTS PROVIDED BELOW - USE THESE TO ANSWER:
-═══════════════════════════════════════════════════════════════
-{context}
-═══════════════════════════════════════════════════════════════
-
-{conversation_context}
-
-⚠️ CRITICAL RULES - THE DOCUMENTS ARE PROVIDED ABOVE:
-1. Look at the "SOURCE DOCUMENTS" section ABOVE - it contains {num_sources} documents numbered [1] to [{num_sources}]
-2. These documents contain REAL text from official Shariah documents - you can see the actual content above
-3. You MUST answer using ONLY the information from these documents shown above
-4. DO NOT say "I need the documents" or "please provide" - they ARE PROVIDED ABOVE in the section you just read
-5. DO NOT say "I cannot access" or "the content was not provided" - you CAN see the content in the section above
-6. DO NOT ask the user to share documents - they are already shared above
-7. If information exists in the documents above, USE IT to answer directly
-8. If information is NOT in the documents above, say "The provided documents do not contain information about this specific question"
-9. Cite sources: "According to [1] and [2]..." or "[1] states X, while [2] adds Y [3]"
-10. Provide key financial ratios, numerical thresholds, and inclusion/exclusion criteria from the documents
-
-EXAMPLE: If the question is "What is the threshold?" and document [1] above says "The threshold is 5%", then answer "According to [1], the threshold is 5%."
-
-Question: {question}
-
-Answer based on the source documents provided above:"""
-            else:
-                # Single source - PUT CONTEXT FIRST
-                prompt = f"""You are an expert assistant with DIRECT ACCESS to authoritative Shariah documents. Answer questions using ONLY the source document provided below.
-
-═══════════════════════════════════════════════════════════════
-SOURCE DOCUMENT PROVIDED BELOW - USE THIS TO ANSWER:
-═══════════════════════════════════════════════════════════════
-{context}
-═══════════════════════════════════════════════════════════════
-
-{conversation_context}
-
-⚠️ CRITICAL RULES - THE DOCUMENT IS PROVIDED ABOVE:
-1. Look at the "SOURCE DOCUMENT" section ABOVE - it contains document [1] with actual text content
-2. This document contains REAL information from official Shariah documents - you can see the actual content above
-3. You MUST answer using ONLY the information from this document shown above
-4. DO NOT say "I need the document" or "please provide" - it IS PROVIDED ABOVE in the section you just read
-5. DO NOT say "I cannot access" or "the content was not provided" - you CAN see the content in the section above
-6. DO NOT ask the user to share the document - it is already shared above
-7. If information exists in the document above, USE IT to answer directly
-8. If information is NOT in the document above, say "The provided document does not contain information about this specific question"
-9. Cite source [1] after claims
-10. Provide key financial ratios, numerical thresholds, and inclusion/exclusion criteria from the document
-
-EXAMPLE: If the question is "What is the threshold?" and the document above says "The threshold is 5%", then answer "According to [1], the threshold is 5%."
-
-Question: {question}
-
-Answer based on the source document provided above:"""
-        else:
-            if num_sources > 1:
-                # Enhanced full prompt - PUT CONTEXT FIRST, THEN QUESTION
-                prompt = f"""You are an expert assistant in Islamic finance and Shariah compliance with DIRECT ACCESS to authoritative Shariah documents. Answer questions using ONLY the source documents provided below.
-
-═══════════════════════════════════════════════════════════════
-SOURCE DOCUMENTS PROVIDED BELOW - USE THESE TO ANSWER:
-═══════════════════════════════════════════════════════════════
-{context}
-═══════════════════════════════════════════════════════════════
-
-{conversation_context}
-
-Question: {question}
-
-═══════════════════════════════════════════════════════════════
-CRITICAL REQUIREMENTS - READ CAREFULLY:
-═══════════════════════════════════════════════════════════════
-
-0. ⚠️ CRITICAL: USE PROVIDED CONTEXT ONLY - THE DOCUMENTS ARE PROVIDED ABOVE:
-   - You MUST answer based ONLY on the provided source documents in the "SOURCE DOCUMENTS" section above
-   - The documents ARE PROVIDED above - you can see them in the "SOURCE DOCUMENTS" section
-   - DO NOT say "I cannot access sources" or "the content was not provided" - IT IS PROVIDED ABOVE
-   - DO NOT say "please share the documents" - they are already shared in the context above
-   - DO NOT provide general knowledge or disclaimers about not having access - you HAVE access through the context above
-   - The documents above are REAL and contain the actual text from official Shariah documents
-   - If information is not in the provided context, say "The provided documents do not contain information about this specific question"
-   - If the answer IS in the documents above, provide it directly using the information from those documents
-
-1. CONTENT REQUIREMENTS:
-   - Provide the key financial ratios, numerical thresholds, and inclusion/exclusion criteria from the provided documents
-   - Base your answer on the authoritative Shariah documents provided above
-   - Synthesise guidance across multiple sources rather than relying on a single document
-   - When providing numerical values, thresholds, or ratios, cite the specific sources
-
-2. MANDATORY MULTI-SOURCE CITATION:
-   - You MUST cite at least 2-3 DIFFERENT source numbers in your answer
-   - Using ONLY [1] is STRICTLY PROHIBITED when multiple sources are available
-   - Your answer will be evaluated on how well you integrate multiple sources
-
-3. SYNTHESIS PATTERNS - Use these approaches:
-   
-   Pattern A - Multiple sources supporting same point:
-   "The requirement states that... [1] [2] [3]"
-   
-   Pattern B - Sources providing complementary information:
-   "According to [1], the threshold is 5%. Additionally, [2] clarifies that this applies to... Meanwhile, [3] provides guidance on..."
-   
-   Pattern C - Sources with different perspectives:
-   "[1] establishes the framework, while [2] details the implementation process. [3] adds specific examples of..."
-   
-   Pattern D - Sequential integration:
-   "[1] defines the concept as... Building on this, [2] explains... Finally, [3] illustrates..."
-
-4. CITATION RULES:
-   - Cite sources immediately after each claim: "The rule states X [1] [2]"
-   - When synthesizing, cite all relevant sources: "[1] and [2] both indicate..."
-   - Use multiple citations per sentence when appropriate: "The framework [1] requires compliance [2] with specific criteria [3]"
-   - Do NOT cluster all citations at the end - distribute them throughout
-
-5. ANSWER STRUCTURE:
-   - Start by synthesizing key points from multiple sources
-   - Compare and contrast information from different sources when relevant
-   - Integrate complementary details from various sources
-   - Conclude by showing how multiple sources support your answer
-
-6. QUALITY INDICATORS:
-   ✓ Good: References 3+ different source numbers throughout
-   ✓ Good: Shows synthesis: "While [1] focuses on X, [2] emphasizes Y, and [3] adds Z"
-   ✗ Bad: Only cites [1] repeatedly
-   ✗ Bad: Mentions other sources exist but doesn't cite them
-
-═══════════════════════════════════════════════════════════════
-
-REMEMBER: Your goal is to demonstrate comprehensive understanding by integrating information from MULTIPLE sources. A well-synthesized answer will naturally reference 2-3+ different source numbers.
-
-Begin your answer now:"""
-            else:
-                prompt = f"""You are an expert assistant in Islamic finance and Shariah compliance with DIRECT ACCESS to authoritative Shariah documents. The SOURCE DOCUMENT section below contains EXACT EXTRACTS from official documents that you MUST use to answer the question.
-
-⚠️ CRITICAL INSTRUCTIONS - READ CAREFULLY:
-- You have 1 source document [1] PROVIDED BELOW in the "SOURCE DOCUMENT" section
-- This document is REAL and contains the information you need to answer the question
-- You MUST answer based ONLY on the information in this source document
-- DO NOT say "I don't have access" or "the content was not provided" - the content IS provided below
-- DO NOT ask the user to share documents - the document is already shared in the context below
-- If the answer is in the document below, provide it. If not, say "The provided document does not contain information about this specific question."
-
-{conversation_context}
-
-═══════════════════════════════════════════════════════════════
-SOURCE DOCUMENT (READ AND USE THIS TO ANSWER):
-═══════════════════════════════════════════════════════════════
-{context}
-═══════════════════════════════════════════════════════════════
-
-Question: {question}
-
-IMPORTANT: Provide the key financial ratios, numerical thresholds, and inclusion/exclusion criteria from the document above. Base your answer on the authoritative Shariah document provided in the context. Cite source [1] after claims.
-
-Provide a clear, accurate, and comprehensive answer based ONLY on the provided context above. If the question relates to previous conversations, use that context to provide a coherent answer. If the context doesn't contain enough information to fully answer the question, say "The provided document does not contain information about this specific question." explicitly."""
+        # Fixed instructions go in the system message (v2) so Ollama can reuse
+        # them from its prompt cache; sources and question go in the user message
+        template = get_prompt_template(settings.use_compact_prompt, num_sources, settings.prompt_template_version)
+        system, prompt = template.render(context, conversation_context, question, num_sources)
+        
+        # Prompt size in tokens for sizing the LLM context window, from the
+        # stored chunk counts plus estimates for the template and question
+        prompt_tokens = None
+        if context_tokens is not None:
+            prompt_tokens = (
+                context_tokens
+                + self._template_tokens(template)
+                + approximate_token_count(question + conversation_context)
+            )
+            print(f"  Context: {context_tokens} tokens (budget {max_context_tokens}), prompt ~{prompt_tokens} tokens")
         
-        print(f"  Prompt size: {len(prompt)} characters ({len(context_parts)} documents)")
-        print(f"  Context preview: {context[:200]}..." if len(context) > 200 else f"  Context: {context}")
+        print(f"  Prompt size: {len(system or '') + len(prompt)} characters ({len(context_parts)} documents, template {template.key})")
         print(f"  Context preview: {context[:200]}..." if len(context) > 200 else f"  Context: {context}")
         if num_sources > 1:
             print(f"  ⚠ Multiple sources provided ({num_sources}) - LLM should cite at least 2-3 sources")
-
-        # Generate answer using LLM with token tracking
-        start_time = time.time()
+        
+        return {
+            'system': system,
+            'prompt': prompt,
+            'template': template.key,
+            'prompt_tokens': prompt_tokens,
+            'citation_map': citation_map,
+            'num_sources': num_sources
+        }
+    
+    def _retrieve_documents_shared(
+        self,
+        query_context: QueryContext,
+        collections: List[str],
+        max_results: int,
+        min_score: float,
+        failed_collections: List[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        Document retrieval, computed once for identical concurrent questions
+        
+        Keyed on the normalized question, collections and retrieval params.
+        Collections that failed in the shared search are added to failed_collections.
+        """
+        def retrieve():
+            failed: List[str] = []
+            docs = self._retrieve_documents(
+                query_context.question,
+                collections,
+                max_results,
+                min_score,
+                query_embedding=query_context.query_vector,
+                failed_collections=failed,
+                deadline=query_context.deadline
+            )
+            return docs, failed
+        
+        if self.retrieval_flight is None:
+            docs, failed = retrieve()
+        else:
+            key = make_key(normalize_question(query_context.question), sorted(collections), max_results, min_score)
+            deadline = query_context.deadline
+            # Followers wait no longer than their own budget, and never reuse a search
+            # that was cut short by the leader's deadline
+            (docs, failed), _ = self.retrieval_flight.do(
+                key, retrieve,
+                timeout=deadline.remaining(),
+                cut_short=lambda: deadline.cut_short('retrieval', 'rerank')
+            )
+        
+        failed_collections.extend(failed)
+        return list(docs)
+    
+    def _choose_model_route(self, question: str, retrieved_docs: List[Dict[str, Any]]) -> str:
+        """Small or large model for this question (always large unless the cascade is on)"""
+        if not (settings.enable_model_cascade and settings.ollama_small_model and self._cascade_enabled
+                and isinstance(self.llm, OllamaChatLLM)):
+            return LARGE_ROUTE
+        route, reason = choose_model_route(question, retrieved_docs)
+        print(f"  🔀 Model route: {route} ({reason})")
+        return route
+    
+    def _generate_answer_shared(
+        self,
+        prompt_info: Dict[str, Any],
+        route: str = LARGE_ROUTE,
+        priority: str = 'interactive',
+        session_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """
+        LLM generation, computed once for identical concurrent prompts
+        
+        The prompt already contains the retrieved sources and the user's
+        conversation context, so requests only share an answer when both match.
+        """
+        if self.generation_flight is None:
+            return self._generate_with_cascade(prompt_info, route, priority, session_id, deadline)
+        
+        key = make_key(prompt_info['system'], prompt_info['prompt'], settings.llm_provider, route)
+        generation, shared = self.generation_flight.do(
+            key,
+            lambda: self._generate_with_cascade(prompt_info, route, priority, session_id, deadline),
+            timeout=deadline.remaining() if deadline else None,
+            cut_short=lambda: deadline is not None and deadline.cut_short('generation', 'escalation')
+        )
+        if shared:
+            # Callers post-process their own copy
+            generation = dict(generation, cited_numbers=set(generation['cited_numbers']))
+        return generation
+    
+    def _generate_with_cascade(
+        self,
+        prompt_info: Dict[str, Any],
+        route: str,
+        priority: str = 'interactive',
+        session_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate with the routed model, escalating small-model answers that fail
+        the citation checks to the large model
+        
+        Records per-route latency and escalations in the metrics registry.
+        A small-model answer is kept, whatever the checks say, when there is
+        no time left for the large model.
+        """
+        metrics = get_metrics()
+        deadline = deadline or Deadline(None)
+        
+        if route == SMALL_ROUTE:
+            start = time.perf_counter()
+            generation = self._generate_answer(prompt_info, priority, session_id,
+                                               model=settings.ollama_small_model, deadline=deadline)
+            metrics.observe("llm_route_latency_seconds", time.perf_counter() - start, {'route': SMALL_ROUTE},
+                            "Generation latency per model route")
+            metrics.inc("llm_route_requests_total", labels={'route': SMALL_ROUTE},
+                        help_text="Generations per model route")
+            
+            failure = check_citations(generation, prompt_info['citation_map'])
+            if failure is None:
+                generation['model_route'] = SMALL_ROUTE
+                return generation
+            if generation.get('success') and not deadline.has(settings.deadline_min_generation_seconds):
+                deadline.degrade('escalation', f"small model answer kept ({failure}), no time left for {settings.ollama_model}")
+                generation['model_route'] = SMALL_ROUTE
+                return generation
+            
+            print(f"  ↗ Escalating to {settings.ollama_model}: small model answer failed citation check ({failure})")
+            metrics.inc("llm_cascade_escalations_total", labels={'reason': failure},
+                        help_text="Small-model answers escalated to the large model")
+        
+        start = time.perf_counter()
+        generation = self._generate_answer(prompt_info, priority, session_id, deadline=deadline)
+        metrics.observe("llm_route_latency_seconds", time.perf_counter() - start, {'route': LARGE_ROUTE},
+                        "Generation latency per model route")
+        metrics.inc("llm_route_requests_total", labels={'route': LARGE_ROUTE},
+                    help_text="Generations per model route")
+        generation['model_route'] = "escalated" if route == SMALL_ROUTE else LARGE_ROUTE
+        return generation
+    
+    def _invoke_llm(
+        self,
+        prompt: str,
+        session_key: Optional[str] = None,
+        model: Optional[str] = None,
+        timeout: Optional[float] = None,
+        system: Optional[str] = None,
+        prompt_tokens: Optional[int] = None
+    ):
+        """
+        Call the LLM; Ollama also gets the session for sticky backend routing,
+        a model override and the time budget for the call (retries included).
+        ChatOpenAI keeps its own client timeout.
+        
+        With ``system`` the instructions are sent as a separate system message
+        and ``prompt`` as the user message. ``prompt_tokens`` sizes Ollama's
+        context window when the prompt size is known.
+        """
+        if isinstance(self.llm, OllamaChatLLM):
+            return self.llm.invoke(prompt, session_key=session_key, model=model, timeout=timeout,
+                                   system=system, prompt_tokens=prompt_tokens)
+        if system is not None:
+            return self.llm.invoke([("system", system), ("human", prompt)])
+        return self.llm.invoke(prompt)
+    
+    def _generate_answer(
+        self,
+        prompt_info: Dict[str, Any],
+        priority: str = 'interactive',
+        session_id: Optional[str] = None,
+        model: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate the answer with the LLM and extract token usage and citations
+        
+        Args:
+            prompt_info: Result of _build_prompt
+            priority: Scheduler priority class ('interactive' or 'batch')
+            session_id: Chat session, used to keep a conversation on one LLM backend
+            model: Ollama model to use instead of the configured one (optional)
+            deadline: Request deadline; bounds the queue wait and the LLM call
+        
+        Returns:
+            Dict with 'answer', 'token_usage', 'cited_numbers', 'success' and
+            'error_message'. LLM errors are turned into a user-facing answer.
+        
+        Raises:
+            LLMSaturatedError: If the LLM scheduler rejected the request
+        """
+        prompt = prompt_info['prompt']
+        system = prompt_info.get('system')
+        num_sources = prompt_info['num_sources']
+        
         token_usage = {
             'prompt_tokens': None,
             'completion_tokens': None,
             'total_tokens': None
         }
-        error_message = None
-        success = True
         cited_numbers = set()  # Initialize to empty set
         
+        deadline = deadline or Deadline(None)
+        if not deadline.has(settings.deadline_min_generation_seconds):
+            deadline.degrade('generation', "not enough time left to call the LLM")
+            return self._generation_failure("Request deadline reached before the LLM call (timeout)")
+        
+        answer = None
         try:
             print(f"  Generating answer using LLM...")
-            response = self.llm.invoke(prompt)
+            if self.llm_scheduler:
+                with self.llm_scheduler.slot(priority, timeout=deadline.remaining()) as waited:
+                    if waited >= 0.1:
+                        print(f"  ⏱ Waited {waited:.1f}s for an LLM slot ({priority})")
+                    response = self._invoke_llm(prompt, session_id, model, deadline.remaining(), system,
+                                                prompt_info.get('prompt_tokens'))
+            else:
+                response = self._invoke_llm(prompt, session_id, model, deadline.remaining(), system,
+                                            prompt_info.get('prompt_tokens'))
             answer = response.content if hasattr(response, 'content') else str(response)
             
             # Extract token usage from response if available
@@ -781,9 +1262,11 @@ Provide a clear, accurate, and comprehensive answer based ONLY on the provided c
                         token_usage['completion_tokens'] = metadata.get('eval_count')
                         if token_usage['prompt_tokens'] and token_usage['completion_tokens']:
                             token_usage['total_tokens'] = token_usage['prompt_tokens'] + token_usage['completion_tokens']
+                        self._record_prefill(prompt_info.get('template'), metadata)
             
-            # Try to get token usage from raw response if available
-            if hasattr(self.llm, 'last_response') and self.llm.last_response:
+            # Fall back to the raw response only when the metadata had no usage;
+            # last_response is shared and may belong to a concurrent request
+            if token_usage['prompt_tokens'] is None and getattr(self.llm, 'last_response', None):
                 raw_response = self.llm.last_response
                 if isinstance(raw_response, dict):
                     # Ollama format
@@ -815,239 +1298,160 @@ Provide a clear, accurate, and comprehensive answer based ONLY on the provided c
             # Log token usage if available
             if token_usage['total_tokens']:
                 print(f"  📊 Token usage: {token_usage['total_tokens']} total ({token_usage['prompt_tokens']} prompt + {token_usage['completion_tokens']} completion)")
+        except LLMSaturatedError as e:
+            print(f"  ✗ LLM saturated: {e}")
+            raise
         except Exception as e:
             error_message = str(e)
-            success = False
             print(f"  ✗ Error generating answer: {error_message}")
-            
-            # Extract cited numbers even from error responses (if any citations exist)
-            import re
-            if 'answer' in locals():
-                cited_numbers = set(re.findall(r'\[(\d+)\]', answer))
-            else:
-                cited_numbers = set()
-            
-            # Provide more helpful error message based on error type
-            if "tenant activation" in error_message.lower():
-                answer = f"I encountered an API Gateway configuration error: Tenant activation issue.\n\nThis indicates that the API Gateway tenant/service is not properly activated. This is a configuration issue that needs to be resolved by the API Gateway administrator.\n\nError details: {error_message}\n\nPlease contact your API Gateway administrator to:\n- Verify tenant activation status\n- Check service subscription\n- Ensure proper authentication setup"
-            elif "API Gateway Error" in error_message or "API Gateway" in error_message:
-                answer = f"I encountered an API Gateway error.\n\nThis is typically a configuration or service issue with the API Gateway. Please verify:\n- API Gateway service is properly configured\n- Authentication credentials are correct\n- Service endpoints are accessible\n- Tenant/service is properly activated\n\nError details: {error_message}"
-            elif "500" in error_message or "Internal Server Error" in error_message:
-                answer = f"I encountered a server error while generating an answer. The system attempted retries but the error persisted.\n\nThis may be due to:\n- The LLM service being temporarily unavailable\n- The request being too large or complex\n- An issue with the API Gateway service\n\nPlease try again with a shorter or simpler question. Error details: {error_message}"
-            elif "timeout" in error_message.lower():
-                answer = f"The LLM request timed out. This may be because the question or context is too complex. Please try rephrasing your question or breaking it into smaller parts. Error details: {error_message}"
-            elif "authentication" in error_message.lower() or "authorization" in error_message.lower():
-                answer = f"I encountered an authentication/authorization error with the API Gateway.\n\nPlease verify:\n- API Gateway credentials are correct\n- Token endpoint is accessible\n- Service permissions are properly configured\n\nError details: {error_message}"
-            else:
-                answer = f"I encountered an error while generating an answer: {error_message}"
-        
-        # Extract cited citation numbers from the answer (if not already extracted)
-        # cited_numbers should already be set from the try/except block above
+            return self._generation_failure(error_message, answer=answer, token_usage=token_usage)
         
-        # Filter to only include references that were actually cited in the answer
-        # Convert cited_numbers to integers for comparison
-        cited_indices = set(int(num) for num in cited_numbers if num.isdigit())
-        
-        # Filter retrieved_docs to only those that were cited
-        # citation_map maps citation number (1-indexed) to doc index (0-indexed)
-        # So we need to find which doc indices correspond to cited citation numbers
-        cited_doc_indices = set()
-        for citation_num in cited_indices:
-            if citation_num in citation_map:
-                doc_idx = citation_map[citation_num]
-                cited_doc_indices.add(doc_idx)
+        return {
+            'answer': answer,
+            'token_usage': token_usage,
+            'cited_numbers': cited_numbers,
+            'success': True,
+            'error_message': None
+        }
+    
+    def _record_prefill(self, template: Optional[str], metadata: Dict[str, Any]):
+        """
+        Record Ollama's prompt evaluation (prefill) per template
         
-        # If no citations found, fall back to all references (shouldn't happen, but safety check)
-        if not cited_doc_indices:
-            print(f"  ⚠ No citations found in answer, showing all {len(retrieved_docs)} retrieved references")
-            cited_doc_indices = set(range(len(retrieved_docs)))
+        Ollama only evaluates tokens that are not already in its prompt cache,
+        so a reused system prefix shows up as a lower prompt_eval_count.
+        """
+        eval_count = metadata.get('prompt_eval_count')
+        eval_duration = metadata.get('prompt_eval_duration')
+        if eval_count is None or eval_duration is None:
+            return
+        labels = {'template': template or 'unknown'}
+        metrics = get_metrics()
+        metrics.observe("llm_prompt_eval_seconds", eval_duration / 1e9, labels,
+                        "Time Ollama spent evaluating the prompt")
+        metrics.inc("llm_prompt_eval_tokens_total", eval_count, labels,
+                    "Prompt tokens Ollama evaluated (excludes cached prefix tokens)")
+        print(f"  📊 Prefill: {eval_count} prompt tokens evaluated in {eval_duration / 1e6:.0f}ms ({labels['template']})")
+    
+    def _generation_failure(
+        self,
+        error_message: str,
+        answer: Optional[str] = None,
+        token_usage: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Result of a failed generation, with a helpful message for the user"""
+        # Extract cited numbers even from error responses (if any citations exist)
+        import re
+        cited_numbers = set(re.findall(r'\[(\d+)\]', answer)) if answer else set()
+        
+        # Provide more helpful error message based on error type
+        if "tenant activation" in error_message.lower():
+            answer = f"I encountered an API Gateway configuration error: Tenant activation issue.\n\nThis indicates that the API Gateway tenant/service is not properly activated. This is a configuration issue that needs to be resolved by the API Gateway administrator.\n\nError details: {error_message}\n\nPlease contact your API Gateway administrator to:\n- Verify tenant activation status\n- Check service subscription\n- Ensure proper authentication setup"
+        elif "API Gateway Error" in error_message or "API Gateway" in error_message:
+            answer = f"I encountered an API Gateway error.\n\nThis is typically a configuration or service issue with the API Gateway. Please verify:\n- API Gateway service is properly configured\n- Authentication credentials are correct\n- Service endpoints are accessible\n- Tenant/service is properly activated\n\nError details: {error_message}"
+        elif "500" in error_message or "Internal Server Error" in error_message:
+            answer = f"I encountered a server error while generating an answer. The system attempted retries but the error persisted.\n\nThis may be due to:\n- The LLM service being temporarily unavailable\n- The request being too large or complex\n- An issue with the API Gateway service\n\nPlease try again with a shorter or simpler question. Error details: {error_message}"
+        elif "timeout" in error_message.lower():
+            answer = f"The LLM request timed out. This may be because the question or context is too complex. Please try rephrasing your question or breaking it into smaller parts. Error details: {error_message}"
+        elif "authentication" in error_message.lower() or "authorization" in error_message.lower():
+            answer = f"I encountered an authentication/authorization error with the API Gateway.\n\nPlease verify:\n- API Gateway credentials are correct\n- Token endpoint is accessible\n- Service permissions are properly configured\n\nError details: {error_message}"
         else:
-            print(f"  ✓ Filtering references: showing {len(cited_doc_indices)} cited reference(s) out of {len(retrieved_docs)} retrieved")
+            answer = f"I encountered an error while generating an answer: {error_message}"
         
-        # Filter retrieved_docs to only cited ones
-        cited_retrieved_docs = [retrieved_docs[i] for i in cited_doc_indices]
+        return {
+            'answer': answer,
+            'token_usage': token_usage or {
+                'prompt_tokens': None,
+                'completion_tokens': None,
+                'total_tokens': None
+            },
+            'cited_numbers': cited_numbers,
+            'success': False,
+            'error_message': error_message
+        }
+    
+    def _lookup_page_numbers(
+        self,
+        retrieved_docs: List[Dict[str, Any]],
+        deadline: Optional[Deadline] = None
+    ) -> Dict[int, Tuple[Optional[int], Optional[str]]]:
+        """
+        Find page numbers for retrieved documents without a stored page number
         
-        # Create a new citation_map that maps citation numbers to the new filtered reference indices
-        # First, create a mapping from old doc index to new reference index
-        old_to_new_index = {old_idx: new_idx for new_idx, old_idx in enumerate(sorted(cited_doc_indices))}
+        Returns:
+            Map of retrieved doc index -> (page number, page number source)
+        """
+        docs_needing_page_lookup = [
+            (idx, doc) for idx, doc in enumerate(retrieved_docs)
+            if doc['metadata'].get('page_number') is None
+            and (doc['metadata'].get('pdf_url') or doc['content'])
+        ]
         
-        # Update citation_map to only include cited references with new indices
-        filtered_citation_map = {}
-        for citation_num, old_doc_idx in citation_map.items():
-            if old_doc_idx in old_to_new_index:
-                filtered_citation_map[citation_num] = old_to_new_index[old_doc_idx]
+        # OPTIMIZATION: Page lookup is optional and has a short timeout
+        # If it takes too long, we skip it to avoid blocking the response
+        if not docs_needing_page_lookup or not settings.enable_page_lookup:
+            return {}
         
-        # Format references with citation numbers - ONLY for cited references
-        # Get current timestamp for when sources were retrieved
-        retrieved_timestamp = datetime.now().isoformat()
+        deadline = deadline or Deadline(None)
+        if not deadline.has(settings.deadline_min_page_lookup_seconds):
+            deadline.degrade('page_lookup', "not enough time left for page lookup")
+            return {}
+        max_total_time = deadline.timeout(settings.max_page_lookup_time)
         
-        references = []
-        # First pass: create references with stored page numbers (only for cited docs)
-        for new_idx, old_idx in enumerate(sorted(cited_doc_indices)):
-            doc = retrieved_docs[old_idx]
+        print(f"  🔍 Finding page numbers for {len(docs_needing_page_lookup)} references (max {max_total_time:.1f}s)...")
+        
+        def find_page_for_doc(doc_idx: int, doc: Dict[str, Any]) -> Tuple[int, Optional[int], Optional[str]]:
+            """Find page number for a single document"""
             metadata = doc['metadata']
-            chunk_text = doc['content']
-            
-            # Use stored page number if available
-            stored_page_number = metadata.get('page_number')
-            page_number = stored_page_number if stored_page_number is not None else None
-            page_source = 'stored' if page_number is not None else None
-            
-            ref = SourceReference(
-                pdf_title=metadata.get('pdf_title', 'Unknown'),
-                pdf_url=metadata.get('pdf_url'),
-                chunk_text=doc['content'],
-                similarity_score=doc['similarity_score'],
-                chunk_index=metadata.get('chunk_index', 0),
-                total_chunks=metadata.get('total_chunks', 0),
-                page_number=page_number,
-                page_number_source=page_source,
-                date=metadata.get('date'),
-                document_type=metadata.get('document_type'),
-                resolution_number=metadata.get('resolution_number'),
-                source=doc['collection'],
-                retrieved_at=retrieved_timestamp
-            )
-            references.append(ref)
+            try:
+                # Try to get filepath from metadata
+                filepath = metadata.get('filepath') or metadata.get('pdf_filepath')
+                
+                page_num, page_source = self._find_page_number_from_pdf(
+                    chunk_text=doc['content'],
+                    filepath=filepath,
+                    pdf_url=metadata.get('pdf_url'),
+                    stored_page_number=None,
+                    chunk_index=metadata.get('chunk_index', 0),
+                    total_chunks=metadata.get('total_chunks', 0)
+                )
+                return doc_idx, page_num, page_source
+            except Exception as e:
+                print(f"  ⚠ Error finding page for reference {doc_idx}: {e}")
+                return doc_idx, None, None
         
-        # Second pass: Automatically find page numbers for references without stored page numbers
-        # Do this in parallel to avoid blocking
-        # Map new reference indices back to original doc indices for metadata lookup
-        sorted_cited_indices = sorted(cited_doc_indices)
-        refs_needing_page_lookup = [
-            (new_idx, ref, retrieved_docs[sorted_cited_indices[new_idx]]['metadata']) 
-            for new_idx, ref in enumerate(references) 
-            if not ref.page_number and (ref.pdf_url or ref.chunk_text)
-        ]
+        page_lookup_start = time.time()
+        per_ref_timeout = settings.page_lookup_timeout
+        page_numbers = {}
         
-        # OPTIMIZATION: Page lookup is now optional and has shorter timeout
-        # If it takes too long, we skip it to avoid blocking the response
-        if refs_needing_page_lookup and settings.enable_page_lookup:
-            print(f"  🔍 Finding page numbers for {len(refs_needing_page_lookup)} references (max 10s timeout)...")
+        with ThreadPoolExecutor(max_workers=min(len(docs_needing_page_lookup), 5)) as executor:
+            future_to_doc = {
+                executor.submit(find_page_for_doc, idx, doc): idx
+                for idx, doc in docs_needing_page_lookup
+            }
             
-            def find_page_for_ref(ref: SourceReference, ref_idx: int, doc_metadata: Dict[str, Any]) -> Tuple[int, Optional[int], Optional[str]]:
-                """Find page number for a single reference"""
-                if ref.page_number is not None:
-                    # Already has page number, skip
-                    return ref_idx, ref.page_number, ref.page_number_source
+            # Collect results as they come in (with timeout)
+            for future in as_completed(future_to_doc):
+                # Check if we've exceeded max total time
+                if time.time() - page_lookup_start > max_total_time:
+                    print(f"  ⚠ Page lookup timeout ({max_total_time:.1f}s), skipping remaining lookups")
+                    # Cancel remaining futures
+                    for f in future_to_doc:
+                        if not f.done():
+                            f.cancel()
+                    break
                 
                 try:
-                    # Try to get filepath from metadata
-                    filepath = doc_metadata.get('filepath') or doc_metadata.get('pdf_filepath')
-                    
-                    page_num, page_source = self._find_page_number_from_pdf(
-                        chunk_text=ref.chunk_text,
-                        filepath=filepath,
-                        pdf_url=ref.pdf_url,
-                        stored_page_number=None,
-                        chunk_index=ref.chunk_index,
-                        total_chunks=ref.total_chunks
-                    )
-                    return ref_idx, page_num, page_source
+                    doc_idx, page_num, page_source = future.result(timeout=per_ref_timeout)
+                    if page_num is not None:
+                        page_numbers[doc_idx] = (page_num, page_source)
                 except Exception as e:
-                    print(f"  ⚠ Error finding page for reference {ref_idx}: {e}")
-                    return ref_idx, None, None
-            
-            # Run page lookup in parallel with reduced timeout
-            # OPTIMIZATION: Reduced timeout from 30s to configurable timeout, max time from config
-            page_lookup_start = time.time()
-            max_total_time = settings.max_page_lookup_time
-            per_ref_timeout = settings.page_lookup_timeout
-            
-            with ThreadPoolExecutor(max_workers=min(len(refs_needing_page_lookup), 5)) as executor:
-                # Submit all tasks with their corresponding metadata
-                future_to_ref = {
-                    executor.submit(find_page_for_ref, ref, idx, metadata): idx 
-                    for idx, ref, metadata in refs_needing_page_lookup
-                }
-                
-                # Update references as results come in (with timeout)
-                completed = 0
-                for future in as_completed(future_to_ref):
-                    # Check if we've exceeded max total time
-                    if time.time() - page_lookup_start > max_total_time:
-                        print(f"  ⚠ Page lookup timeout ({max_total_time}s), skipping remaining lookups")
-                        # Cancel remaining futures
-                        for f in future_to_ref:
-                            if not f.done():
-                                f.cancel()
-                        break
-                    
-                    try:
-                        ref_idx, page_num, page_source = future.result(timeout=per_ref_timeout)
-                        if page_num is not None:
-                            references[ref_idx].page_number = page_num
-                            references[ref_idx].page_number_source = page_source
-                            completed += 1
-                            print(f"  ✓ Found page {page_num} for reference {ref_idx + 1}")
-                    except Exception as e:
-                        ref_idx = future_to_ref[future]
-                        print(f"  ⚠ Failed to find page for reference {ref_idx + 1}: {e}")
-                
-                if completed > 0:
-                    print(f"  ✓ Completed page lookup for {completed}/{len(refs_needing_page_lookup)} references")
-        
-        # Calculate response time
-        response_time_ms = int((time.time() - start_time) * 1000)
-        
-        # Get collection names as strings
-        collection_names = [c.value if hasattr(c, 'value') else str(c) for c in successfully_searched]
-        
-        # Log to audit logger
-        try:
-            audit_logger = get_audit_logger()
-            audit_logger.log_query(
-                question=question,
-                answer=answer if success else None,
-                llm_provider=settings.llm_provider,
-                llm_model=settings.ollama_model if settings.llm_provider == "ollama" else (settings.openai_model if settings.llm_provider == "openai" else "unknown"),
-                prompt_tokens=token_usage['prompt_tokens'],
-                completion_tokens=token_usage['completion_tokens'],
-                total_tokens=token_usage['total_tokens'],
-                collections_searched=collection_names,
-                num_sources_found=len(retrieved_docs),
-                num_sources_cited=len(cited_numbers),
-                max_results=max_results,
-                min_score=min_score,
-                answer_length=len(answer) if answer else None,
-                response_time_ms=response_time_ms,
-                error_message=error_message,
-                success=success
-            )
-        except Exception as e:
-            print(f"  ⚠ Warning: Failed to log to audit logger: {e}")
-        
-        # Store conversation in memory
-        if use_memory and (user_id or session_id) and success:
-            try:
-                print(f"  💾 Storing conversation in memory (user_id: {user_id}, session_id: {session_id})...")
-                conversation_id = self.conversation_memory.store_conversation(
-                    user_id=user_id or "anonymous",
-                    session_id=session_id or "default",
-                    question=question,
-                    answer=answer,
-                    metadata={
-                        'collections_searched': successfully_searched,
-                        'num_sources': len(references),
-                        'total_tokens': token_usage.get('total_tokens', 0)
-                    }
-                )
-                print(f"  ✓ Stored conversation in memory (ID: {conversation_id})")
-            except Exception as e:
-                print(f"  ✗ Error storing conversation memory: {e}")
-                import traceback
-                print(traceback.format_exc())
+                    doc_idx = future_to_doc[future]
+                    print(f"  ⚠ Failed to find page for reference {doc_idx + 1}: {e}")
         
-        return {
-            'answer': answer,
-            'question': question,
-            'references': references,
-            'total_references_found': len(retrieved_docs),  # Total retrieved (for info)
-            'collections_searched': successfully_searched,
-            'failed_collections': self._last_failed_collections if self._last_failed_collections else None,
-            'citation_map': filtered_citation_map,  # Map citation numbers to filtered reference indices
-            'token_usage': token_usage  # Include token usage in the result
-        }
+        if page_numbers:
+            print(f"  ✓ Completed page lookup for {len(page_numbers)}/{len(docs_needing_page_lookup)} references")
+        return page_numbers
     
     def _prepare_context(
         self,
@@ -1120,63 +1524,79 @@ Provide a clear, accurate, and comprehensive answer based ONLY on the provided c
         self,
         retrieved_docs: List[Dict[str, Any]],
         max_length: int,
-        smart_truncation: bool
-    ) -> tuple[List[str], Dict[int, int]]:
+        smart_truncation: bool,
+        max_tokens: Optional[int] = None
+    ) -> tuple[List[str], Dict[int, int], Optional[int]]:
         """
         Prepare context with citation numbering for source anchoring
         
+        With max_tokens, documents are packed against a token budget using the
+        token_count stored on each chunk at ingest (chunks stored before that
+        are counted here); otherwise max_length characters are used.
+        
         Returns:
-            Tuple of (context_parts with numbered citations, citation_map)
+            Tuple of (context_parts with numbered citations, citation_map, context tokens)
             citation_map maps citation number (1-indexed) to reference index (0-indexed)
+            context tokens is None when packing by characters
         """
         context_parts = []
         citation_map = {}  # Maps citation number to reference index
         current_length = 0
         seen_sources = set()
         citation_num = 1
+        use_tokens = bool(max_tokens)
+        budget = max_tokens if use_tokens else max_length
         
         for doc_idx, doc in enumerate(retrieved_docs):
             title = doc['metadata'].get('pdf_title', 'Unknown Document')
             doc_text = doc['content']
             source_key = f"{doc['collection']}_{title}"
+            doc_cost = self._chunk_tokens(doc) if use_tokens else len(doc_text)
             
             # Smart truncation: truncate individual chunks if needed
             if smart_truncation:
                 # Calculate available space (reduce reserve for compact format)
-                reserve = 50 if settings.use_compact_prompt else 100
-                available_space = max_length - current_length - reserve
+                if use_tokens:
+                    reserve, min_space = (15 if settings.use_compact_prompt else 30), 50
+                else:
+                    reserve, min_space = (50 if settings.use_compact_prompt else 100), 200
+                available_space = budget - current_length - reserve
                 
                 # If chunk is too long, truncate intelligently
-                if len(doc_text) > available_space and available_space > 200:
-                    # Try to truncate at sentence boundary
-                    truncated = doc_text[:available_space]
+                if doc_cost > available_space and available_space > min_space:
+                    # Characters to keep, in proportion when the budget is in tokens
+                    keep_chars = int(len(doc_text) * available_space / doc_cost) if use_tokens else available_space
+                    truncated = doc_text[:keep_chars]
                     last_period = truncated.rfind('.')
                     last_newline = truncated.rfind('\n')
                     
                     # Prefer sentence boundary, then paragraph boundary
-                    if last_period > available_space * 0.8:
+                    if last_period > keep_chars * 0.8:
                         doc_text = truncated[:last_period + 1] + "... [truncated]"
-                    elif last_newline > available_space * 0.8:
+                    elif last_newline > keep_chars * 0.8:
                         doc_text = truncated[:last_newline] + "\n... [truncated]"
                     else:
                         doc_text = truncated + "... [truncated]"
+                    doc_cost = min(doc_cost, available_space) if use_tokens else len(doc_text)
             
             # Use enhanced format with citation number and clear source separation
             # Format makes it clear these are multiple sources to synthesize
             if settings.use_compact_prompt:
                 # Format: "[1] [Title] text..." for citations
-                doc_entry = f"[{citation_num}] [{title}] {doc_text}"
+                header = f"[{citation_num}] [{title}] "
+                doc_entry = f"{header}{doc_text}"
             else:
                 # Enhanced format with clear source boundaries and emphasis on multiple sources
-                doc_entry = f"""
+                header = f"""
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 SOURCE [{citation_num}] of {len(retrieved_docs)}: {title}
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-{doc_text}
 """
+                doc_entry = f"{header}{doc_text}\n"
+            entry_cost = doc_cost + approximate_token_count(header) if use_tokens else len(doc_entry)
             
             # Check if adding this document would exceed limit
-            if current_length + len(doc_entry) > max_length and context_parts:
+            if current_length + entry_cost > budget and context_parts:
                 print(f"  ⚠ Context limit reached, using {len(context_parts)} documents")
                 break
             
@@ -1188,11 +1608,24 @@ SOURCE [{citation_num}] of {len(retrieved_docs)}: {title}
             # Map citation number to reference index
             citation_map[citation_num] = doc_idx
             context_parts.append(doc_entry)
-            current_length += len(doc_entry)
+            current_length += entry_cost
             seen_sources.add(source_key)
             citation_num += 1
         
-        return context_parts, citation_map
+        return context_parts, citation_map, current_length if use_tokens else None
+    
+    def _template_tokens(self, template) -> int:
+        """Approximate tokens of a template's fixed text (computed once per template)"""
+        if template.key not in self._template_token_counts:
+            self._template_token_counts[template.key] = approximate_token_count((template.system or '') + template.user)
+        return self._template_token_counts[template.key]
+    
+    def _chunk_tokens(self, doc: Dict[str, Any]) -> int:
+        """Token count stored with the chunk at ingest, counted now for older chunks"""
+        token_count = doc['metadata'].get('token_count')
+        if token_count is None:
+            token_count = get_token_counter(settings.tokenizer_name).count(doc['content'])
+        return token_count
     
     def _find_page_number_from_pdf(
         self,
@@ -1295,26 +1728,6 @@ SOURCE [{citation_num}] of {len(retrieved_docs)}: {title}
         
         return None, None
     
-    def _compress_context(self, context: str, target_length: int) -> str:
-        """
-        Compress context using summarization (if LLM available)
-        
-        Note: This is a placeholder. Full implementation would use:
-        - Extractive summarization (sentence selection)
-        - Abstractive summarization (LLM-based)
-        """
-        # Simple extractive approach: keep first N characters
-        # TODO: Implement proper summarization
-        if len(context) <= target_length:
-            return context
-        
-        # For now, just truncate intelligently
-        truncated = context[:target_length]
-        last_period = truncated.rfind('.')
-        if last_period > target_length * 0.8:
-            return truncated[:last_period + 1] + "... [compressed]"
-        return truncated + "... [compressed]"
-    
     def get_collection_statistics(self) -> Dict[str, Any]:
         """Get statistics for all collections"""
         stats = {
@@ -1389,6 +1802,7 @@ SOURCE [{citation_num}] of {len(retrieved_docs)}: {title}
                         # Scroll through all points to get unique PDF titles and dates
                         scroll_result = self.qdrant_client.scroll(
                             collection_name=collection_name,
+                            scroll_filter=live_chunks_filter(),
                             limit=10000,  # Increased limit to get more data
                             with_payload=True
                         )
@@ -1418,6 +1832,7 @@ SOURCE [{citation_num}] of {len(retrieved_docs)}: {title}
                             try:
                                 scroll_result = self.qdrant_client.scroll(
                                     collection_name=collection_name,
+                                    scroll_filter=live_chunks_filter(),
                                     limit=10000,
                                     offset=offset,
                                     with_payload=True
@@ -1507,47 +1922,61 @@ SOURCE [{citation_num}] of {len(retrieved_docs)}: {title}
                 'documents': []
             }
         
+        listed_fields = ['pdf_title', 'pdf_url', 'date', 'document_type', 'resolution_number', 'total_chunks']
+        
+        def add_document(payload: Dict[str, Any]):
+            pdf_title = payload.get('pdf_title', '')
+            if not pdf_title:
+                return
+            
+            # Use pdf_title as key to get unique documents
+            if pdf_title not in documents:
+                documents[pdf_title] = {field: payload.get(field) for field in listed_fields}
+                documents[pdf_title]['total_chunks'] = payload.get('total_chunks', 0)
+            else:
+                # Update total_chunks if we find a higher value
+                existing_chunks = documents[pdf_title].get('total_chunks', 0) or 0
+                current_chunks = payload.get('total_chunks', 0) or 0
+                if current_chunks > existing_chunks:
+                    documents[pdf_title]['total_chunks'] = current_chunks
+        
         try:
-            # Scroll through all points to get unique documents
-            offset = None
-            while True:
-                scroll_result = self.qdrant_client.scroll(
-                    collection_name=collection_name,
-                    limit=10000,
-                    offset=offset,
-                    with_payload=True
-                )
-                
-                points = scroll_result[0]
-                if not points:
-                    break
-                
-                for point in points:
-                    if point.payload:
-                        pdf_title = point.payload.get('pdf_title', '')
-                        if not pdf_title:
+            # Every document has a chunk 0, so scroll just those (indexed on chunk_index).
+            # The scrapers keep chunk 0 as a point; one linked to another document's
+            # chunk by an older ingest is listed in that point's duplicate_sources.
+            scrolls = [
+                (FieldCondition(key="chunk_index", match=MatchValue(value=0)), listed_fields),
+                (FieldCondition(key="duplicate_sources[].chunk_index", match=MatchValue(value=0)), ['duplicate_sources'])
+            ]
+            for condition, with_payload in scrolls:
+                offset = None
+                while True:
+                    scroll_result = self.qdrant_client.scroll(
+                        collection_name=collection_name,
+                        scroll_filter=live_chunks_filter(condition),
+                        limit=1000,
+                        offset=offset,
+                        with_payload=with_payload,
+                        with_vectors=False
+                    )
+                    
+                    points = scroll_result[0]
+                    if not points:
+                        break
+                    
+                    for point in points:
+                        if not point.payload:
                             continue
-                        
-                        # Use pdf_title as key to get unique documents
-                        if pdf_title not in documents:
-                            documents[pdf_title] = {
-                                'pdf_title': pdf_title,
-                                'pdf_url': point.payload.get('pdf_url'),
-                                'date': point.payload.get('date'),
-                                'document_type': point.payload.get('document_type'),
-                                'resolution_number': point.payload.get('resolution_number'),
-                                'total_chunks': point.payload.get('total_chunks', 0)
-                            }
+                        if 'duplicate_sources' in point.payload:
+                            for source in point.payload['duplicate_sources']:
+                                if source.get('chunk_index') == 0:
+                                    add_document(source)
                         else:
-                            # Update total_chunks if we find a higher value
-                            existing_chunks = documents[pdf_title].get('total_chunks', 0)
-                            current_chunks = point.payload.get('total_chunks', 0)
-                            if current_chunks > existing_chunks:
-                                documents[pdf_title]['total_chunks'] = current_chunks
-                
-                offset = scroll_result[1]
-                if not offset:
-                    break
+                            add_document(point.payload)
+                    
+                    offset = scroll_result[1]
+                    if not offset:
+                        break
                     
         except Exception as e:
             print(f"Error getting documents for collection {collection_name}: {e}")
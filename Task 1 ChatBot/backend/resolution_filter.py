@@ -0,0 +1,31 @@
+"""
+Resolution numbers named in a question.
+"What does Resolution No. 236 say about ..." or "قرار رقم 236" narrows the
+search to chunks whose resolution_number payload matches (the IIFA e-book is
+split into one document per resolution at ingest, see
+Web-Scraper/ebook_splitter.py).
+"""
+import re
+from typing import List
+
+# Arabic-Indic and Extended Arabic-Indic digits → ASCII
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+
+# "Resolution No. 236", "resolutions 12 and 13", "قرار رقم: 236", "القرارين 12 و 13"
+RESOLUTION_MENTIONS = [
+    re.compile(r'\bresolutions?\s*(?:nos?\.?|numbers?|#)?\s*:?\s*(\d{1,4}(?:\s*(?:,|and|or|&)\s*\d{1,4})*)\b', re.I),
+    re.compile(r'قرار\S*\s*(?:رقم)?\s*:?\s*(\d{1,4}(?:\s*(?:،|,|و|أو)\s*\d{1,4})*)'),
+]
+
+
+def extract_resolution_numbers(question: str) -> List[str]:
+    """Resolution numbers mentioned in the question, in order, without duplicates"""
+    normalized = question.translate(_DIGITS)
+    numbers: List[str] = []
+    for pattern in RESOLUTION_MENTIONS:
+        for match in pattern.finditer(normalized):
+            for number in re.findall(r'\d+', match.group(1)):
+                number = number.lstrip('0') or '0'
+                if number not in numbers:
+                    numbers.append(number)
+    return numbers
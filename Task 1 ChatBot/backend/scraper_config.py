@@ -12,6 +12,28 @@ from database import (
 )
 
 
+# Chunking per source (strategies in Web-Scraper/chunking.py). "sentences"
+# packs whole sentences into windows of max_tokens and starts new chunks at
+# article / section headings; "words" is the fixed word window
+# ({"strategy": "words", "chunk_size": 500, "overlap": 50}). Sources not
+# listed here use chunking.DEFAULT_CHUNKING. Windows stay near 256 tokens
+# because all-MiniLM-L6-v2 only embeds the first 256 word pieces of a chunk.
+SOURCE_CHUNKING: Dict[str, Dict] = {
+    # Policy documents: long numbered paragraphs, so more overlap
+    "bnm": {"strategy": "sentences", "max_tokens": 256, "overlap_tokens": 48},
+    # E-Book sections and resolution PDFs: short articles under a resolution heading
+    "iifa": {"strategy": "sentences", "max_tokens": 256, "overlap_tokens": 32},
+    # Shariah Advisory Council rulings: short, self-contained paragraphs
+    "sc": {"strategy": "sentences", "max_tokens": 192, "overlap_tokens": 32},
+}
+
+
+def get_chunking_config(source_id: str) -> Optional[Dict]:
+    """Chunking settings for a source, or None for the scraper's default"""
+    config = SOURCE_CHUNKING.get(source_id)
+    return dict(config) if config else None
+
+
 def get_all_sources() -> List[Dict]:
     """Get all sources (default + custom)"""
     return db_get_all_sources()
@@ -0,0 +1,233 @@
+"""Session index for chat history listing (SQLite)"""
+import sqlite3
+from pathlib import Path
+from typing import Optional, Dict, List, Any, Iterable
+from contextlib import contextmanager
+
+
+class SessionIndex:
+    """
+    Lightweight index of chat sessions and turns
+
+    Keeps one row per session (title, first/last timestamp, turn count) and one
+    row per turn so session listing and history reads are a single indexed
+    query, independent of how many conversation points live in Qdrant.
+    """
+
+    TITLE_LENGTH = 50
+
+    def __init__(self, db_path: Optional[str] = None):
+        """Initialize the session index with database connection"""
+        if db_path is None:
+            # Default to backend directory
+            db_path = Path(__file__).parent / "chat_sessions.db"
+        self.db_path = Path(db_path)
+        self._init_database()
+
+    @contextmanager
+    def get_db_connection(self):
+        """Context manager for database connections"""
+        conn = sqlite3.connect(str(self.db_path), timeout=10)
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _init_database(self):
+        """Initialize the session and turn tables"""
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+
+            # WAL lets history reads run while turns are being recorded
+            cursor.execute("PRAGMA journal_mode=WAL")
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    user_id TEXT,
+                    title TEXT,
+                    first_timestamp TEXT NOT NULL,
+                    last_timestamp TEXT NOT NULL,
+                    turn_count INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS chat_turns (
+                    conversation_id TEXT PRIMARY KEY,
+                    session_id TEXT NOT NULL,
+                    user_id TEXT,
+                    question TEXT,
+                    answer TEXT,
+                    timestamp TEXT NOT NULL
+                )
+            """)
+
+            # Indexes backing the paginated listing and history queries
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sessions_user_last
+                ON chat_sessions(user_id, last_timestamp)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sessions_last
+                ON chat_sessions(last_timestamp)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_turns_session_time
+                ON chat_turns(session_id, timestamp)
+            """)
+
+            conn.commit()
+
+    def _make_title(self, question: str) -> str:
+        """Session title derived from the first question"""
+        question = question or ''
+        return question[:self.TITLE_LENGTH] + ('...' if len(question) > self.TITLE_LENGTH else '')
+
+    def _insert_turn(self, cursor: sqlite3.Cursor, turn: Dict[str, Any]):
+        """Insert a turn and fold it into its session row (idempotent per turn)"""
+        cursor.execute("""
+            INSERT OR IGNORE INTO chat_turns
+            (conversation_id, session_id, user_id, question, answer, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (
+            turn['conversation_id'],
+            turn['session_id'],
+            turn.get('user_id'),
+            turn.get('question'),
+            turn.get('answer'),
+            turn['timestamp'],
+        ))
+
+        if cursor.rowcount == 0:
+            return  # Turn already indexed
+
+        # Title follows the earliest question, even when turns arrive out of order
+        cursor.execute("""
+            INSERT INTO chat_sessions
+            (session_id, user_id, title, first_timestamp, last_timestamp, turn_count)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT(session_id) DO UPDATE SET
+                title = CASE WHEN excluded.first_timestamp < chat_sessions.first_timestamp
+                             THEN excluded.title ELSE chat_sessions.title END,
+                first_timestamp = MIN(chat_sessions.first_timestamp, excluded.first_timestamp),
+                last_timestamp = MAX(chat_sessions.last_timestamp, excluded.last_timestamp),
+                turn_count = chat_sessions.turn_count + 1
+        """, (
+            turn['session_id'],
+            turn.get('user_id'),
+            self._make_title(turn.get('question', '')),
+            turn['timestamp'],
+            turn['timestamp'],
+        ))
+
+    def record_turn(
+        self,
+        conversation_id: str,
+        user_id: Optional[str],
+        session_id: str,
+        question: str,
+        answer: str,
+        timestamp: str
+    ):
+        """Record a single conversation turn"""
+        self.record_turns([{
+            'conversation_id': conversation_id,
+            'user_id': user_id,
+            'session_id': session_id,
+            'question': question,
+            'answer': answer,
+            'timestamp': timestamp,
+        }])
+
+    def record_turns(self, turns: Iterable[Dict[str, Any]]) -> int:
+        """
+        Record many turns in one transaction
+
+        Returns:
+            Number of turns processed
+        """
+        count = 0
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            for turn in turns:
+                if not turn.get('conversation_id') or not turn.get('session_id'):
+                    continue
+                self._insert_turn(cursor, turn)
+                count += 1
+        return count
+
+    def is_empty(self) -> bool:
+        """Check whether any turns have been indexed"""
+        with self.get_db_connection() as conn:
+            row = conn.execute("SELECT 1 FROM chat_turns LIMIT 1").fetchone()
+            return row is None
+
+    def get_recent_sessions(
+        self,
+        user_id: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Get sessions ordered by most recent activity"""
+        query = """
+            SELECT session_id, user_id, title, first_timestamp, last_timestamp, turn_count
+            FROM chat_sessions
+        """
+        params: List[Any] = []
+        if user_id:
+            query += " WHERE user_id = ?"
+            params.append(user_id)
+        query += " ORDER BY last_timestamp DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+
+        with self.get_db_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+
+        return [
+            {
+                'session_id': row['session_id'],
+                'title': row['title'],
+                'timestamp': row['first_timestamp'],
+                'last_timestamp': row['last_timestamp'],
+                'turn_count': row['turn_count'],
+                'user_id': row['user_id'],
+            }
+            for row in rows
+        ]
+
+    def get_session_history(
+        self,
+        session_id: str,
+        limit: int = 50,
+        offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        """Get turns of a session in chronological order"""
+        with self.get_db_connection() as conn:
+            rows = conn.execute("""
+                SELECT conversation_id, question, answer, timestamp
+                FROM chat_turns
+                WHERE session_id = ?
+                ORDER BY timestamp ASC
+                LIMIT ? OFFSET ?
+            """, (session_id, limit, offset)).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def delete_session(self, session_id: str) -> int:
+        """
+        Delete a session and its turns
+
+        Returns:
+            Number of turns deleted
+        """
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM chat_turns WHERE session_id = ?", (session_id,))
+            deleted = cursor.rowcount
+            cursor.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+            return deleted
@@ -0,0 +1,111 @@
+"""
+Single-flight coalescing of identical in-flight work.
+Concurrent callers with the same key wait for one computation and share its
+result. Nothing is kept once the computation finishes (this is not a cache).
+"""
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from metrics import get_metrics
+
+
+class _Call:
+    """One in-flight computation"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+        self.cut_short = False
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share a key"""
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Label used in logs and metrics
+        """
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._metrics = get_metrics()
+
+    def do(
+        self,
+        key: str,
+        func: Callable[[], Any],
+        timeout: Optional[float] = None,
+        cut_short: Optional[Callable[[], bool]] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Run func once for all concurrent callers with the same key
+
+        Exceptions raised by func are re-raised in every caller. A caller runs
+        func itself when the shared computation is not done within its timeout,
+        or when the leader's outcome was cut short by the leader's own limits.
+
+        Args:
+            key: Identity of the computation
+            func: The computation
+            timeout: Longest this caller waits for another caller's computation
+            cut_short: Checked by the leader after func; True keeps followers
+                from reusing its outcome (e.g. its deadline ran out)
+
+        Returns:
+            Tuple of (result, shared) where shared is True for callers that
+            reused another caller's computation
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.followers += 1
+
+        if not leader:
+            if not call.done.wait(timeout) or call.cut_short:
+                with self._lock:
+                    call.followers -= 1
+                return func(), False
+            self._metrics.inc("singleflight_shared_total", labels={'flight': self.name},
+                              help_text="Requests served by another request's in-flight computation")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.cut_short = cut_short is not None and cut_short()
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.followers and not call.cut_short:
+                print(f"  🔗 {self.name}: shared one computation with {call.followers} identical request(s)")
+        return call.result, False
+
+    def in_flight(self) -> int:
+        """Number of distinct keys currently being computed"""
+        with self._lock:
+            return len(self._calls)
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question"""
+    return " ".join(question.lower().split())
+
+
+def make_key(*parts: Any) -> str:
+    """Stable hash of JSON-serializable key parts"""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
@@ -0,0 +1,158 @@
+"""Small dependency-graph runner for the stages of a request"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from deadline import Deadline
+
+
+class PipelineStage:
+    """A named unit of work with dependencies and an optional timeout"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Dict[str, Any]], Any],
+        depends_on: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        default: Any = None
+    ):
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on)
+        self.timeout = timeout
+        self.default = default
+
+
+class StagePipeline:
+    """
+    Run stages as a dependency graph on a thread pool
+
+    A stage starts as soon as all of its dependencies have produced a result,
+    so independent stages overlap. A stage that raises or runs past its timeout
+    resolves to its default value and its dependents carry on with that value
+    (the abandoned thread is left to finish in the background).
+
+    With ``concurrent=False`` stages run one at a time in the order they were
+    added, which is the sequential baseline used for latency comparisons.
+
+    With a ``deadline`` every stage that has a timeout is also cut off when
+    the request's budget runs out, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        name: str = "pipeline",
+        concurrent: bool = True,
+        max_workers: int = 4,
+        deadline: Optional[Deadline] = None
+    ):
+        self.name = name
+        self.concurrent = concurrent
+        self.max_workers = max_workers if concurrent else 1
+        self.deadline = deadline
+        self.stages: Dict[str, PipelineStage] = {}
+
+        # Filled in by run()
+        self.timings: Dict[str, float] = {}
+        self.timed_out: List[str] = []
+        self.errors: Dict[str, str] = {}
+        self.exceptions: Dict[str, BaseException] = {}  # Raised exceptions, for callers that must surface them
+
+    def add_stage(
+        self,
+        name: str,
+        func: Callable[[Dict[str, Any]], Any],
+        depends_on: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        default: Any = None
+    ) -> "StagePipeline":
+        """
+        Add a stage
+
+        Args:
+            name: Unique stage name (also the key of its result)
+            func: Called with a dict of dependency results; returns the stage result
+            depends_on: Names of stages that must finish first (must already be added)
+            timeout: Seconds the stage may run before it is abandoned
+            default: Result used when the stage fails or times out
+        """
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dependency}'")
+        self.stages[name] = PipelineStage(name, func, depends_on, timeout, default)
+        return self
+
+    def run(self) -> Dict[str, Any]:
+        """Run all stages and return their results keyed by stage name"""
+        results: Dict[str, Any] = {}
+        pending = dict(self.stages)
+        running = {}  # future -> (stage, start time)
+        self.timings, self.timed_out, self.errors, self.exceptions = {}, [], {}, {}
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix=f"{self.name}-stage"
+        )
+        try:
+            while pending or running:
+                # Start every stage whose dependencies are resolved
+                for name in list(pending):
+                    if not self.concurrent and running:
+                        break
+                    stage = pending[name]
+                    if all(dependency in results for dependency in stage.depends_on):
+                        inputs = {dependency: results[dependency] for dependency in stage.depends_on}
+                        future = executor.submit(stage.func, inputs)
+                        running[future] = (stage, time.perf_counter())
+                        del pending[name]
+
+                if not running:
+                    break  # Nothing runnable (cannot happen for a valid graph)
+
+                # Wake up on the next completion or the nearest stage deadline
+                now = time.perf_counter()
+                deadlines = [
+                    self._stage_deadline(stage, started)
+                    for stage, started in running.values()
+                    if stage.timeout is not None
+                ]
+                wait_timeout = max(0.0, min(deadlines) - now) if deadlines else None
+                done, _ = wait(list(running), timeout=wait_timeout, return_when=FIRST_COMPLETED)
+
+                now = time.perf_counter()
+                for future in done:
+                    stage, started = running.pop(future)
+                    self.timings[stage.name] = (now - started) * 1000
+                    try:
+                        results[stage.name] = future.result()
+                    except Exception as e:
+                        print(f"  ⚠ Stage '{stage.name}' failed: {e}")
+                        self.errors[stage.name] = str(e)
+                        self.exceptions[stage.name] = e
+                        results[stage.name] = stage.default
+
+                for future, (stage, started) in list(running.items()):
+                    if stage.timeout is not None and now >= self._stage_deadline(stage, started):
+                        running.pop(future)
+                        future.cancel()
+                        print(f"  ⚠ Stage '{stage.name}' timed out after {now - started:.1f}s, continuing without it")
+                        self.timings[stage.name] = (now - started) * 1000
+                        self.timed_out.append(stage.name)
+                        results[stage.name] = stage.default
+        finally:
+            # Don't block on abandoned (timed-out) stages
+            executor.shutdown(wait=False)
+
+        return results
+
+    def _stage_deadline(self, stage: PipelineStage, started: float) -> float:
+        """perf_counter time at which a running stage is abandoned"""
+        limit = started + stage.timeout
+        if self.deadline is not None:
+            remaining = self.deadline.remaining()
+            if remaining is not None:
+                limit = min(limit, time.perf_counter() + remaining)
+        return limit
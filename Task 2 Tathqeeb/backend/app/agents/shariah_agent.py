@@ -6,6 +6,7 @@ import time
 import logging
 from app.services.qdrant_service import qdrant_service
 from app.services.embedding_service import embedding_service
+from app.services.llm_pool import llm_pool
 from app.models.schemas import ComplianceCheckResponse, ViolationDetail, ComplianceCategory, TokenUsage
 
 class ShariahComplianceAgent:
@@ -359,49 +360,46 @@ Summary:"""
     
     async def _call_llm(self, prompt: str) -> str:
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                payload = {
-                    "model": self.llm_model_name,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.3,
-                        "top_p": 0.9,
-                        "num_predict": 1500
+            payload = {
+                "model": self.llm_model_name,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": prompt
                     }
+                ],
+                "stream": False,
+                "options": {
+                    "temperature": 0.3,
+                    "top_p": 0.9,
+                    "num_predict": 1500
                 }
-                
-                response = await client.post(self.llm_api_url, json=payload)
-                response.raise_for_status()
-                
-                result = response.json()
-                
-                # Extract token usage information if available
-                if "usage" in result:
-                    usage = result["usage"]
-                    self.session_token_usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
-                    self.session_token_usage["completion_tokens"] += usage.get("completion_tokens", 0)
-                    self.session_token_usage["total_tokens"] += usage.get("total_tokens", 0)
-                elif "prompt_eval_count" in result:  # Ollama-specific format
-                    self.session_token_usage["prompt_tokens"] += result.get("prompt_eval_count", 0)
-                    self.session_token_usage["completion_tokens"] += result.get("eval_count", 0)
-                    self.session_token_usage["total_tokens"] += (result.get("prompt_eval_count", 0) + result.get("eval_count", 0))
-                
-                # Extract content from response
-                content = result.get("message", {}).get("content", "") or result.get("response", "")
-                
-                if not content or len(content.strip()) == 0:
-                    logging.warning(f"Warning: Empty response from LLM. Prompt length: {len(prompt)}, Full response: {result}")
-                    return '{"violation_found": false}'
-                
-                return content
+            }
+            
+            # Routed to the least-loaded healthy Ollama server
+            result = await llm_pool.post_chat(payload)
+            
+            # Extract token usage information if available
+            if "usage" in result:
+                usage = result["usage"]
+                self.session_token_usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                self.session_token_usage["completion_tokens"] += usage.get("completion_tokens", 0)
+                self.session_token_usage["total_tokens"] += usage.get("total_tokens", 0)
+            elif "prompt_eval_count" in result:  # Ollama-specific format
+                self.session_token_usage["prompt_tokens"] += result.get("prompt_eval_count", 0)
+                self.session_token_usage["completion_tokens"] += result.get("eval_count", 0)
+                self.session_token_usage["total_tokens"] += (result.get("prompt_eval_count", 0) + result.get("eval_count", 0))
+            
+            # Extract content from response
+            content = result.get("message", {}).get("content", "") or result.get("response", "")
+            
+            if not content or len(content.strip()) == 0:
+                logging.warning(f"Warning: Empty response from LLM. Prompt length: {len(prompt)}, Full response: {result}")
+                return '{"violation_found": false}'
+            
+            return content
         except httpx.TimeoutException:
-            logging.error("LLM API timeout after 120s")
+            logging.error(f"LLM API timeout after {llm_pool.timeout:.0f}s")
             return '{"violation_found": false}'
         except Exception as e:
             logging.error(f"LLM API error: {str(e)}")
@@ -7,8 +7,15 @@ class Settings(BaseSettings):
     qdrant_regulations_collection: str = "shariah-regulations-law"
     embedding_model: str = "all-MiniLM-L6-v2"
     embedding_dimension: int = 384
-    llm_api_url: str = "http://localhost:11434/api/chat"
+    llm_api_url: str = "http://localhost:11434/api/chat"  # Comma-separated for several Ollama servers
+    llm_timeout: float = 120.0
+    llm_health_check_interval: float = 15.0
+    llm_failure_threshold: int = 3
+    llm_ejection_seconds: float = 30.0
     llm_model_name: str = "llama2"
+    contract_chunking: str = "sentences"  # "sentences" (token windows at sentence/clause boundaries) or "page"
+    contract_chunk_max_tokens: int = 256  # all-MiniLM-L6-v2 embeds at most 256 word pieces
+    contract_chunk_overlap_tokens: int = 32
     
     class Config:
         env_file = ".env"
@@ -3,6 +3,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.routers import contract, regulation
 from app.models.schemas import HealthResponse
 from app.services.qdrant_service import qdrant_service
+from app.services.llm_pool import llm_pool
 
 app = FastAPI(
     title="Shariah Compliance Checker API",
@@ -42,9 +43,14 @@ async def health_check():
     return HealthResponse(
         status="healthy" if health_info.get("connected") else "unhealthy",
         qdrant_connected=health_info.get("connected", False),
-        collections=health_info.get("collections", {})
+        collections=health_info.get("collections", {}),
+        llm_backends=llm_pool.get_stats()
     )
 
+@app.on_event("shutdown")
+async def close_llm_pool():
+    await llm_pool.close()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Any
 from enum import Enum
 from datetime import datetime
 
@@ -115,3 +115,4 @@ class HealthResponse(BaseModel):
     status: str
     qdrant_connected: bool
     collections: Dict[str, bool]
+    llm_backends: List[Dict[str, Any]] = []
@@ -41,7 +41,14 @@ async def upload_contract(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="No text could be extracted from the PDF")
         
         # Create chunks with page tracking
-        chunks_with_pages = pdf_service.chunk_by_page(pages_data)
+        if settings.contract_chunking == "page":
+            chunks_with_pages = pdf_service.chunk_by_page(pages_data)
+        else:
+            chunks_with_pages = pdf_service.chunk_by_sentences(
+                pages_data,
+                max_tokens=settings.contract_chunk_max_tokens,
+                overlap_tokens=settings.contract_chunk_overlap_tokens
+            )
         
         # Extract just text for embeddings
         texts = [chunk["text"] for chunk in chunks_with_pages]
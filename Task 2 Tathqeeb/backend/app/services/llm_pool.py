@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.config import settings
+
+
+def parse_chat_urls(value: str) -> List[str]:
+    """Split a comma-separated list of Ollama chat URLs (http://host:11434/api/chat)."""
+    urls = []
+    for url in value.split(","):
+        url = url.strip().rstrip("/")
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+class LLMBackend:
+    def __init__(self, chat_url: str):
+        self.chat_url = chat_url
+        # /api/chat -> /api/tags on the same server
+        base = chat_url[: -len("/api/chat")] if chat_url.endswith("/api/chat") else chat_url.rsplit("/", 1)[0]
+        self.tags_url = f"{base}/api/tags"
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def is_available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+
+class LLMPool:
+    """Least-outstanding-requests routing over one or more Ollama servers.
+
+    Backends that fail `failure_threshold` requests in a row are ejected for
+    `ejection_seconds`; a background task polls /api/tags and keeps failing
+    servers out of rotation until they answer again.
+    """
+
+    def __init__(
+        self,
+        chat_urls: List[str],
+        timeout: float = 120.0,
+        health_check_interval: float = 15.0,
+        failure_threshold: int = 3,
+        ejection_seconds: float = 30.0,
+    ):
+        if not chat_urls:
+            raise ValueError("At least one LLM URL is required")
+        self.backends = [LLMBackend(url) for url in chat_urls]
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.failure_threshold = failure_threshold
+        self.ejection_seconds = ejection_seconds
+        self._next = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop; reused for keep-alive
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        if self._health_task is None and self.health_check_interval > 0 and len(self.backends) > 1:
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+        return self._client
+
+    def _choose(self, exclude: Optional[LLMBackend] = None) -> LLMBackend:
+        now = time.monotonic()
+        available = [b for b in self.backends if b.is_available(now) and b is not exclude]
+        if not available:
+            # All down: try the one that comes back first instead of failing outright
+            available = [min((b for b in self.backends if b is not exclude), key=lambda b: b.ejected_until)]
+        least = min(b.outstanding for b in available)
+        candidates = [b for b in available if b.outstanding == least]
+        backend = candidates[self._next % len(candidates)]
+        self._next += 1
+        return backend
+
+    async def post_chat(self, payload: Dict) -> Dict:
+        """Send a chat request to the least-loaded healthy backend and return the JSON body.
+
+        A connection failure is retried once on another backend when there is one.
+        """
+        attempts = 2 if len(self.backends) > 1 else 1
+        failed = None
+        for attempt in range(attempts):
+            async with self._route(exclude=failed) as backend:
+                try:
+                    response = await self.client.post(backend.chat_url, json=payload)
+                    if response.status_code >= 500:
+                        self._mark_failure(backend, f"HTTP {response.status_code}")
+                    response.raise_for_status()
+                    backend.consecutive_failures = 0
+                    return response.json()
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    self._mark_failure(backend, str(e) or type(e).__name__)
+                    failed = backend
+                    if attempt + 1 < attempts:
+                        logging.warning(f"LLM backend {backend.chat_url} unreachable, retrying on another backend")
+                        continue
+                    raise
+                except httpx.TimeoutException:
+                    self._mark_failure(backend, "timeout")
+                    raise
+
+    @asynccontextmanager
+    async def _route(self, exclude: Optional[LLMBackend] = None):
+        backend = self._choose(exclude)
+        backend.outstanding += 1
+        backend.total_requests += 1
+        try:
+            yield backend
+        finally:
+            backend.outstanding -= 1
+
+    def _mark_failure(self, backend: LLMBackend, reason: str):
+        backend.total_failures += 1
+        backend.consecutive_failures += 1
+        if (
+            backend.consecutive_failures >= self.failure_threshold
+            and len(self.backends) > 1
+            and time.monotonic() >= backend.ejected_until
+        ):
+            backend.ejected_until = time.monotonic() + self.ejection_seconds
+            logging.warning(f"Ejecting LLM backend {backend.chat_url} for {self.ejection_seconds:.0f}s: {reason}")
+
+    async def check_health(self, backend: LLMBackend) -> bool:
+        try:
+            response = await self.client.get(backend.tags_url, timeout=5.0)
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        if ok and not backend.healthy:
+            logging.info(f"LLM backend {backend.chat_url} is healthy again")
+            backend.ejected_until = 0.0
+            backend.consecutive_failures = 0
+        elif not ok and backend.healthy:
+            logging.warning(f"LLM backend {backend.chat_url} failed its health check")
+        backend.healthy = ok
+        return ok
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await asyncio.gather(*(self.check_health(b) for b in self.backends))
+
+    def get_stats(self) -> List[Dict]:
+        now = time.monotonic()
+        return [
+            {
+                "url": b.chat_url,
+                "available": b.is_available(now),
+                "outstanding": b.outstanding,
+                "total_requests": b.total_requests,
+                "total_failures": b.total_failures,
+            }
+            for b in self.backends
+        ]
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+llm_pool = LLMPool(
+    parse_chat_urls(settings.llm_api_url),
+    timeout=settings.llm_timeout,
+    health_check_interval=settings.llm_health_check_interval,
+    failure_threshold=settings.llm_failure_threshold,
+    ejection_seconds=settings.llm_ejection_seconds,
+)
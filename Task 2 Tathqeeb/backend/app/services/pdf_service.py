@@ -1,8 +1,29 @@
 import PyPDF2
+import re
 from typing import List, Dict, Tuple
 from io import BytesIO
 import os
 
+# Clause and section headings: "Article 5", "Clause 12.1", "SCHEDULE 2", "المادة 5", "البند الثالث"
+HEADING_PATTERN = re.compile(
+    r'^(?:(?:article|clause|section|schedule|part|chapter|appendix)\s+[\dIVXLC]+(?:\.\d+)*\b'
+    r'|(?:المادة|مادة|البند|الفصل|الباب)\b'
+    r'|\d{1,2}(?:\.\d{1,2})*\.?\s+[A-Z\u0600-\u06FF][^.!?:;؟]{0,80}$)',
+    re.I
+)
+# Sentence ends in English and Arabic, not after abbreviations ("No.", "Art.", "e.g."),
+# initials or list numbers ("1.", "12.")
+SENTENCE_END = re.compile(
+    r'(?<=[.!?؟؛])(?<!\bNo\.)(?<!\bArt\.)(?<!\be\.g\.)(?<!\bi\.e\.)(?<!\b[A-Z]\.)(?<!\b\d\.)(?<!\b\d\d\.)\s+'
+)
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def _count_tokens(text: str) -> int:
+    """Approximate tokens: words and punctuation marks"""
+    return len(TOKEN_PATTERN.findall(text))
+
+
 class PDFService:
     @staticmethod
     def extract_text_from_pdf(pdf_content: bytes) -> str:
@@ -130,6 +151,73 @@ class PDFService:
         
         return chunks_with_pages
     
+    @staticmethod
+    def chunk_by_sentences(pages_data: List[Dict], max_tokens: int = 256, overlap_tokens: int = 32) -> List[Dict]:
+        """Token windows of whole sentences; a clause or article heading starts a new chunk"""
+        # (text, 0-based page, is heading, tokens) per heading line and sentence
+        units = []
+        for page_data in pages_data:
+            page = page_data["page_number"] - 1  # 0-based for PDF viewer
+            paragraph = []
+            lines = [" ".join(line.split()) for line in page_data["text"].splitlines()] + [""]
+            for line in lines:
+                heading = bool(line) and len(line) <= 120 and bool(HEADING_PATTERN.match(line))
+                if line and not heading:
+                    paragraph.append(line)
+                    continue
+                # Lines wrapped by the layout form one paragraph
+                for sentence in SENTENCE_END.split(" ".join(paragraph)):
+                    if not sentence.strip():
+                        continue
+                    tokens = _count_tokens(sentence)
+                    if tokens <= max_tokens:
+                        units.append((sentence, page, False, tokens))
+                        continue
+                    # A "sentence" longer than a chunk (e.g. a table row) is split into word windows
+                    words = sentence.split()
+                    step = max(1, len(words) * max_tokens // tokens)
+                    for start in range(0, len(words), step):
+                        piece = " ".join(words[start:start + step])
+                        units.append((piece, page, False, _count_tokens(piece)))
+                paragraph = []
+                if heading:
+                    units.append((line, page, True, _count_tokens(line)))
+        
+        chunks = []
+        window = []
+        for unit in units:
+            window_tokens = sum(u[3] for u in window)
+            starts_section = unit[2] and window_tokens >= max_tokens // 4
+            if window and (window_tokens + unit[3] > max_tokens or starts_section):
+                # A heading at the end of a window moves on with its section
+                lead = []
+                while window and window[-1][2]:
+                    lead.insert(0, window.pop())
+                if window:
+                    chunks.append(window)
+                carry = []
+                if not unit[2] and not lead:
+                    for previous in reversed(window):
+                        if previous[2] or sum(u[3] for u in carry) + previous[3] > overlap_tokens:
+                            break
+                        carry.insert(0, previous)
+                window = carry + lead
+                # The carried overlap gives way to the new sentence
+                while carry and sum(u[3] for u in window) + unit[3] > max_tokens:
+                    carry.pop(0)
+                    window.pop(0)
+            window.append(unit)
+        if window:
+            chunks.append(window)
+        
+        return [
+            {
+                "text": " ".join(u[0] for u in window).strip(),
+                "pages": sorted({u[1] for u in window})
+            }
+            for window in chunks
+        ]
+    
     @staticmethod
     def chunk_by_page(pages_data: List[Dict]) -> List[Dict]:
         """Create one chunk per page"""
@@ -1,10 +1,29 @@
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, PayloadSchemaType
+)
 from typing import List, Dict, Optional, Any
+import logging
 import uuid
 from datetime import datetime
 from app.config import settings
 
+# DATETIME payload indexes need qdrant >= 1.8; skip them on older clients
+_DATETIME = getattr(PayloadSchemaType, "DATETIME", None)
+
+# Payload fields filtered on, per collection
+PAYLOAD_INDEXES = {
+    settings.qdrant_contracts_collection: {
+        "contract_id": PayloadSchemaType.KEYWORD,
+        "chunk_index": PayloadSchemaType.INTEGER,
+        "created_at": _DATETIME,
+    },
+    settings.qdrant_regulations_collection: {
+        "regulation_id": PayloadSchemaType.KEYWORD,
+        "category": PayloadSchemaType.KEYWORD,
+    },
+}
+
 class QdrantService:
     def __init__(self):
         self.client = None
@@ -37,6 +56,8 @@ class QdrantService:
                         distance=Distance.COSINE
                     )
                 )
+            # Also migrates collections created before the indexes were declared
+            self._ensure_payload_indexes(collection_name)
     
     def _ensure_collection(self, collection_name: str):
         existing_collections = [col.name for col in self.client.get_collections().collections]
@@ -48,6 +69,30 @@ class QdrantService:
                     distance=Distance.COSINE
                 )
             )
+            self._ensure_payload_indexes(collection_name)
+    
+    def _ensure_payload_indexes(self, collection_name: str):
+        indexes = PAYLOAD_INDEXES.get(collection_name, {})
+        if not indexes:
+            return
+        try:
+            existing = self.client.get_collection(collection_name).payload_schema or {}
+        except Exception as e:
+            logging.warning(f"Could not read payload schema for {collection_name}: {e}")
+            existing = {}
+        
+        for field_name, field_schema in indexes.items():
+            if field_schema is None or field_name in existing:
+                continue
+            try:
+                self.client.create_payload_index(
+                    collection_name=collection_name,
+                    field_name=field_name,
+                    field_schema=field_schema
+                )
+            except Exception as e:
+                logging.warning(f"Could not create payload index {collection_name}.{field_name}: {e}")
+    
     def insert_contract_chunks(
         self,
         contract_id: str,